@@ -0,0 +1,134 @@
+"""
+@desc:
+compare cis requested keyed by attribute name with cis requested keyed by attribute id
+and rewritten by client, see `Option.compact_keys`.
+
+by default a local fake server returns synthetic pages, sent at `--mbps` to stand for the network,
+use `--mbps 0` to measure client cpu only, where rewriting costs a little more than the decoding it saves:
+
+    > python benchmarks/bench_compact_keys.py --count 2000 --attrs 40 --mbps 100
+
+against a real cmdb, with connection read from enviroment CMDB_HOST, CMDB_KEY and CMDB_SECRET:
+
+    > python benchmarks/bench_compact_keys.py --live --q "_type:server" --count 2000
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from cmdb import Client, Option
+
+
+def _fake_page(count: int, attrs: int):
+    names = [f"attribute_with_descriptive_name_{i}" for i in range(attrs)]
+    attributes = [{"id": 100 + i, "name": n, "alias": n.title()} for i, n in enumerate(names)]
+    cis = [
+        dict({"_id": ci_id, "_type": 1, "ci_type": "server"}, **{n: f"value-{ci_id}-{i}" for i, n in enumerate(names)})
+        for ci_id in range(1, count + 1)
+    ]
+    ids = {a["name"]: str(a["id"]) for a in attributes}
+
+    def page(ret_key: str) -> bytes:
+        result = cis if ret_key != "id" else [{ids.get(k, k): v for k, v in ci.items()} for ci in cis]
+        body = {"counter": {"server": count}, "facet": {}, "numfound": count, "page": 1,
+                "result": result, "total": count}
+        return json.dumps(body).encode()
+
+    return {"name": page("name"), "id": page("id"), "attributes": json.dumps({"attributes": attributes}).encode()}
+
+
+def _serve(count: int, attrs: int, mbps: float) -> str:
+    bodies = _fake_page(count, attrs)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            u = urlparse(self.path)
+            if u.path.endswith("/attributes"):
+                body = bodies["attributes"]
+            else:
+                body = bodies[parse_qs(u.query).get("ret_key", ["name"])[0]]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            chunk = 64 * 1024
+            for i in range(0, len(body), chunk):
+                self.wfile.write(body[i:i + chunk])
+                if mbps:
+                    time.sleep(min(chunk, len(body) - i) * 8 / (mbps * 1e6))
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/api/v0.1"
+
+
+def _run(opt: Option, q: str, count: int, rounds: int, stream: bool):
+    client = Client(opt)
+    sizes = []
+
+    def on_response(method, path, params, status, size, elapsed):
+        sizes.append(size)
+
+    client.transport.observers.append(on_response)
+
+    def fetch():
+        if stream:
+            with client.get_ci_stream(q, count=count) as rsp:
+                return list(rsp)
+        return client.get_ci(q, count=count).result
+
+    fetch()  # warm up connection and attribute cache
+    latencies = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        cis = fetch()
+        latencies.append(time.perf_counter() - start)
+    return sizes[-1], latencies, cis
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--live", action="store_true", help="run against CMDB_HOST instead of a local fake server")
+    parser.add_argument("--q", default="_type:server")
+    parser.add_argument("--count", type=int, default=2000, help="cis per page")
+    parser.add_argument("--attrs", type=int, default=40, help="attributes per ci of the fake server")
+    parser.add_argument("--mbps", type=float, default=100.0, help="bandwidth of the fake server, 0 for unlimited")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--stream", action="store_true", help="use get_ci_stream instead of get_ci")
+    args = parser.parse_args()
+
+    if args.live:
+        base = {}
+    else:
+        base = {"url": _serve(args.count, args.attrs, args.mbps), "key": "key", "secret": "secret"}
+
+    rows = []
+    results = []
+    for compact in (False, True):
+        size, latencies, cis = _run(Option(compact_keys=compact, **base), args.q, args.count, args.rounds, args.stream)
+        results.append(cis)
+        rows.append((f"compact_keys={compact}", size, statistics.median(latencies), min(latencies)))
+
+    if results[0] != results[1]:
+        print("warning: results differ between modes", file=sys.stderr)
+    print(f"{'mode':<20}{'bytes':>12}{'median ms':>12}{'min ms':>10}")
+    for mode, size, median, best in rows:
+        print(f"{mode:<20}{size:>12}{median * 1000:>12.1f}{best * 1000:>10.1f}")
+    print(f"bytes saved: {1 - rows[1][1] / rows[0][1]:.1%}, latency saved: {1 - rows[1][2] / rows[0][2]:.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
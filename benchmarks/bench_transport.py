@@ -0,0 +1,86 @@
+"""
+@desc:
+per call overhead of transports at high request rates, see `Option.transport_type`.
+
+a local fake server answers every request with the same small body, so the measured time is
+mostly spent by the sdk and the http library, `memory` shows the cost without any http.
+
+    > python benchmarks/bench_transport.py --calls 5000 --threads 1 8
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cmdb import Client, Option
+from cmdb.core.policy import TransportType
+from cmdb.core.transport import MemoryTransport, Transport
+
+
+BODY = {"numfound": 1, "total": 1, "page": 1, "facet": {}, "counter": {}, "result": [{"_id": 1, "_type": 1}]}
+
+
+def _serve() -> str:
+    body = json.dumps(BODY).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/api/v0.1"
+
+
+def _bench(transport: Transport, calls: int, threads: int) -> float:
+    client = Client(transport=transport)
+
+    def work(n: int) -> None:
+        for _ in range(n):
+            client.get_ci("_type:server", count=1)
+
+    work(threads)  # warm up
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(work, [calls // threads] * threads))
+    return time.perf_counter() - start
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8])
+    args = parser.parse_args()
+
+    url = _serve()
+    transports = {t.value: lambda t=t: Transport.from_option(Option(url=url, key="key", secret="secret", transport_type=t))
+                  for t in TransportType}
+    transports["memory"] = lambda: MemoryTransport(lambda method, path, params: BODY)
+
+    print(f"{'transport':<12}{'threads':>8}{'calls/s':>12}{'us/call':>10}")
+    for threads in args.threads:
+        for name, new in transports.items():
+            transport = new()
+            elapsed = _bench(transport, args.calls, threads)
+            transport.close()
+            print(f"{name:<12}{threads:>8}{args.calls / elapsed:>12.0f}{elapsed / args.calls * 1e6:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
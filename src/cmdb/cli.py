@@ -0,0 +1,299 @@
+"""
+cmdb command line tool
+
+    > cmdb import books.ndjson --type book --key book_id --workers 16 --checkpoint books.ckpt
+    > cmdb export --q "_type:book" --format csv --out books.csv
+    > cmdb relations import relations.csv
+
+connection arguments --url, --api-key and --api-secret default to enviroment CMDB_HOST, CMDB_KEY and CMDB_SECRET
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional, TextIO
+
+from cmdb.client import Client
+from cmdb.core.models import CIUpsertRsp, Option
+from cmdb.core.policy import ExistPolicy, NoAttributePolicy
+
+
+def _open_input(path: str) -> TextIO:
+    if path == "-":
+        return sys.stdin
+    return open(path, encoding="utf-8", newline="")
+
+
+def _read_records(f: TextIO, fmt: str) -> Iterator[dict]:
+    """read records one by one, the input is never loaded at once"""
+    if fmt == "csv":
+        yield from csv.DictReader(f)
+        return
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def _guess_format(path: str, fmt: Optional[str]) -> str:
+    if fmt:
+        return fmt
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+
+class Progress:
+    """
+    count processed records, checkpoint the contiguous finished prefix and report throughput
+
+    Attributes:
+        checkpoint: file to save the count of finished records, None for no checkpoint
+        skip: records finished by previous runs
+        interval: seconds between progress lines
+        out: stream of progress lines
+    """
+
+    def __init__(self, checkpoint: Optional[str], skip: int, interval: float = 2.0, out: TextIO = sys.stderr):
+        self.checkpoint = checkpoint
+        self.skip = skip
+        self.interval = interval
+        self.out = out
+        self.ok = 0
+        self.errors = 0
+        self.created = 0
+        self.updated = 0
+        self._finished = set()
+        self._prefix = skip
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._last = self._start
+
+    @staticmethod
+    def load(checkpoint: Optional[str]) -> int:
+        if not checkpoint or not os.path.exists(checkpoint):
+            return 0
+        with open(checkpoint, encoding="utf-8") as f:
+            return json.load(f)["done"]
+
+    def _save(self) -> None:
+        if not self.checkpoint:
+            return
+        tmp = f"{self.checkpoint}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"done": self._prefix}, f)
+        os.replace(tmp, self.checkpoint)
+
+    @property
+    def processed(self) -> int:
+        return self.ok + self.errors
+
+    def done(self, seq: int, result) -> None:
+        with self._lock:
+            if isinstance(result, Exception):
+                self.errors += 1
+            else:
+                self.ok += 1
+                if isinstance(result, CIUpsertRsp) and result.created is not None:
+                    if result.created:
+                        self.created += 1
+                    else:
+                        self.updated += 1
+            self._finished.add(seq)
+            while self._prefix in self._finished:
+                self._finished.discard(self._prefix)
+                self._prefix += 1
+            now = time.monotonic()
+            if now - self._last >= self.interval:
+                self._last = now
+                self._save()
+                self.out.write(f"{self.processed} records, {self.errors} errors, {self.rate():.1f}/s\n")
+                self.out.flush()
+
+    def rate(self) -> float:
+        return self.processed / max(time.monotonic() - self._start, 1e-9)
+
+    def summary(self) -> str:
+        self._save()
+        elapsed = time.monotonic() - self._start
+        lines = [
+            f"processed: {self.processed} in {elapsed:.1f}s, {self.rate():.1f}/s",
+            f"ok: {self.ok}, errors: {self.errors}",
+        ]
+        if self.created or self.updated:
+            lines.append(f"created: {self.created}, updated: {self.updated}")
+        if self.skip:
+            lines.append(f"skipped by checkpoint: {self.skip}")
+        return "\n".join(lines)
+
+
+def _run(
+        records: Iterator[dict],
+        write: Callable[[dict], object],
+        workers: int,
+        progress: Progress,
+        errors_out: Optional[TextIO],
+    ) -> None:
+    # bound records in flight, so input is consumed as fast as it is written
+    slots = threading.BoundedSemaphore(workers * 2)
+    errors_lock = threading.Lock()
+
+    def task(seq: int, record: dict) -> None:
+        try:
+            try:
+                result = write(record)
+            except Exception as e:
+                result = e
+            if isinstance(result, Exception) and errors_out:
+                line = json.dumps({"seq": seq, "record": record, "error": str(result)}, ensure_ascii=False)
+                with errors_lock:
+                    errors_out.write(line + "\n")
+            progress.done(seq, result)
+        finally:
+            slots.release()
+
+    # records in flight are finished on the way out, interrupted or not
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for seq, record in enumerate(itertools.islice(records, progress.skip, None), progress.skip):
+            slots.acquire()
+            pool.submit(task, seq, record)
+
+
+def _client(args: argparse.Namespace) -> Client:
+    return Client(Option(url=args.url or "", key=args.api_key or "", secret=args.api_secret or ""))
+
+
+def _cmd_import(args: argparse.Namespace) -> int:
+    client = _client(args)
+    policy = NoAttributePolicy(args.no_attribute_policy)
+    if args.key:
+        key = args.key.split(",")
+        prefer = ExistPolicy(args.prefer)
+
+        def write(record: dict):
+            return client.upsert_ci(args.type, record, key, policy, prefer)
+    else:
+        def write(record: dict):
+            return client.add_ci(args.type, record, policy)
+
+    return _import(args, write)
+
+
+def _cmd_relations_import(args: argparse.Namespace) -> int:
+    client = _client(args)
+
+    def write(record: dict):
+        return client.add_ci_relation(int(record["src_ci_id"]), int(record["dst_ci_id"]))
+
+    return _import(args, write)
+
+
+def _import(args: argparse.Namespace, write: Callable[[dict], object]) -> int:
+    fmt = _guess_format(args.file, args.format)
+    errors_out = open(args.errors, "a", encoding="utf-8") if args.errors else None
+    f = _open_input(args.file)
+    progress = Progress(args.checkpoint, Progress.load(args.checkpoint))
+    try:
+        _run(_read_records(f, fmt), write, args.workers, progress, errors_out)
+    finally:
+        # stdin is left open for the caller
+        if f is not sys.stdin:
+            f.close()
+        if errors_out:
+            errors_out.close()
+        # saves the checkpoint, also when interrupted, so a resumed import does not write records again
+        print(progress.summary(), file=sys.stderr)
+    return 1 if progress.errors else 0
+
+
+def _cmd_export(args: argparse.Namespace) -> int:
+    client = _client(args)
+    out = open(args.out, "w", encoding="utf-8", newline="") if args.out else sys.stdout
+    fields: List[str] = args.fl.split(",") if args.fl else []
+    writer = None
+    count = 0
+    start = time.monotonic()
+    try:
+        page = 1
+        while True:
+            with client.get_ci_stream(args.q, fl=args.fl, count=args.page_size, page=page) as rsp:
+                n = 0
+                for ci in rsp:
+                    n += 1
+                    if args.format == "csv":
+                        if writer is None:
+                            writer = csv.DictWriter(out, fields or list(ci), extrasaction="ignore")
+                            writer.writeheader()
+                        writer.writerow(ci)
+                    else:
+                        out.write(json.dumps(ci, ensure_ascii=False) + "\n")
+            count += n
+            if n < args.page_size:
+                break
+            page += 1
+    finally:
+        if args.out:
+            out.close()
+    elapsed = time.monotonic() - start
+    print(f"exported: {count} in {elapsed:.1f}s, {count / max(elapsed, 1e-9):.1f}/s", file=sys.stderr)
+    return 0
+
+
+def _add_connection_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--url", help="api url, default to enviroment CMDB_HOST")
+    parser.add_argument("--api-key", help="api key, default to enviroment CMDB_KEY")
+    parser.add_argument("--api-secret", help="api secret, default to enviroment CMDB_SECRET")
+
+
+def _add_import_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("file", help="input file, - for stdin")
+    parser.add_argument("--format", choices=["ndjson", "csv"], help="input format, default by file extension")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent writes")
+    parser.add_argument("--checkpoint", help="file to save progress, an interrupted import resumes from it")
+    parser.add_argument("--errors", help="file to append failed records to, as ndjson")
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cmdb", description="veops cmdb command line tool")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("import", help="import cis from ndjson or csv")
+    _add_connection_args(p)
+    _add_import_args(p)
+    p.add_argument("--type", required=True, help="ci model type")
+    p.add_argument("--key", help="unique attributes split by comma, upsert cis if set, otherwise create")
+    p.add_argument("--prefer", choices=[e.value for e in ExistPolicy], default=ExistPolicy.NEED.value,
+                   help="upsert policy tried first")
+    p.add_argument("--no-attribute-policy", choices=[e.value for e in NoAttributePolicy],
+                   default=NoAttributePolicy.default().value)
+    p.set_defaults(func=_cmd_import)
+
+    p = sub.add_parser("export", help="export cis as ndjson or csv")
+    _add_connection_args(p)
+    p.add_argument("--q", required=True, help='search expression, eg: "_type:book"')
+    p.add_argument("--fl", help="ret attributes split by comma, also csv columns")
+    p.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    p.add_argument("--out", help="output file, default to stdout")
+    p.add_argument("--page-size", type=int, default=500)
+    p.set_defaults(func=_cmd_export)
+
+    p = sub.add_parser("relations", help="ci relation commands")
+    rel = p.add_subparsers(dest="relations_command", required=True)
+    p = rel.add_parser("import", help="import relations from ndjson or csv with src_ci_id and dst_ci_id")
+    _add_connection_args(p)
+    _add_import_args(p)
+    p.set_defaults(func=_cmd_relations_import)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = _parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
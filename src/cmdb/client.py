@@ -1,8 +1,17 @@
-from typing import Optional
+from typing import List, Optional, Union
 
+from cmdb.core.analytics import CIAnalytics
+from cmdb.core.batch import Batch
 from cmdb.core.ci import CIClient
 from cmdb.core.ci_relations import CIRelationClient
+from cmdb.core.exc import CMDBError
+from cmdb.core.topology import Topology
+from cmdb.core.resultset import CIResultSet
+from cmdb.core.feed import ChangeFeed, Checkpoint, FileCheckpoint
 from cmdb.core.models import *
+from cmdb.core.profile import Profiler
+from cmdb.core.stream import CIRetrieveStream
+from cmdb.core.transport import Transport
 
 
 class Client:
@@ -11,6 +20,8 @@ class Client:
 
     Attributes:
         opt: initialize arugument, if None input, will initiallize with enviroment arguments
+        transport: sends requests of ci and ci relation clients, if None, created by `opt.transport_type`,
+            eg: `MemoryTransport` to test without cmdb server
 
     Example:
 
@@ -24,11 +35,23 @@ class Client:
         
             > client = Client()
 
+        3. initialize with several api replicas, requests are balanced across them
+
+            > opt = Option(url=["https://host1.com/api/v0.1", "https://host2.com/api/v0.1"], key=your_key, secret=your_secret)
+
+            > client = Client(opt)
+
+    the client is safe to share between threads, and to create before forking workers,
+    every thread and process uses its own connection pool.
+
     """
 
-    def __init__(self, opt: Optional[Option] = None):
-        self.ci = CIClient(opt)
-        self.cr = CIRelationClient(opt)
+    def __init__(self, opt: Optional[Option] = None, transport: Optional[Transport] = None):
+        opt = opt if opt else (transport.opt if transport else Option())
+        self.transport = transport if transport else Transport.from_option(opt)
+        self.ci = CIClient(opt, self.transport)
+        self.cr = CIRelationClient(opt, self.transport)
+        self.analytics = CIAnalytics(self.ci)
 
     def add_ci(
             self,
@@ -36,6 +59,7 @@ class Client:
             attrs: dict,
             no_attribute_policy: NoAttributePolicy = NoAttributePolicy.default(),
             exist_policy: ExistPolicy = ExistPolicy.default(),
+            deadline: Optional[float] = None,
         ) -> CICreateRsp:
         """
         create new ci instance
@@ -48,11 +72,68 @@ class Client:
             attrs: fields of ci to add
             no_attribute_policy: default to ignore not existed attributes update operation, optional value include IGNORE|REJECT
             exist_policy: default to reject add new ci if exists, optional value include NEED|REJECT|REPLACE
+            deadline: seconds the call must finish in, including retries, raise CMDBTimeoutError if exceeded
 
         Retrurns:
             CMDB create operation result
         """
-        return self.ci.add_ci(ci_type, attrs, no_attribute_policy, exist_policy)
+        return self.ci.add_ci(ci_type, attrs, no_attribute_policy, exist_policy, deadline=deadline)
+    
+    def upsert_ci(
+            self,
+            ci_type: str,
+            attrs: dict,
+            key: List[str],
+            no_attribute_policy: NoAttributePolicy = NoAttributePolicy.default(),
+            prefer: ExistPolicy = ExistPolicy.NEED,
+            deadline: Optional[float] = None,
+        ) -> CIUpsertRsp:
+        """
+        create a ci, or update it if exists
+
+        eg: suppose a ci model with fields [id, name, age], and its unique key is "name"
+            > client.upsert_ci("Human", {"name": "a", "age": 10}, key=["name"])
+
+        Args:
+            ci_type: ci model type
+            attrs: fields of ci, must include the unique key of ci model
+            key: attributes identifing the ci, must be in attrs
+            no_attribute_policy: default to ignore not existed attributes update operation, optional value include IGNORE|REJECT
+            prefer: which case costs one request, NEED to update first, REJECT to create first,
+                REPLACE always costs one request but does not tell if created
+            deadline: seconds the call must finish in, including retries, raise CMDBTimeoutError if exceeded
+
+        Retrurns:
+            ci_id and whether the ci is created
+        """
+        return self.ci.upsert_ci(ci_type, attrs, key, no_attribute_policy, prefer, deadline)
+
+    def upsert_cis(
+            self,
+            ci_type: str,
+            records: List[dict],
+            key: List[str],
+            no_attribute_policy: NoAttributePolicy = NoAttributePolicy.default(),
+            prefer: ExistPolicy = ExistPolicy.NEED,
+            max_workers: int = 8,
+            deadline: Optional[float] = None,
+        ) -> List[Union[CIUpsertRsp, Exception]]:
+        """
+        upsert cis concurrently, records with the same key are merged and the last one wins
+
+        Args:
+            ci_type: ci model type
+            records: fields of cis, each must include the key attributes
+            key: attributes identifing a ci
+            no_attribute_policy: default to ignore not existed attributes update operation, optional value include IGNORE|REJECT
+            prefer: which case costs one request, NEED to update first, REJECT to create first, REPLACE for one request always
+            max_workers: max concurrent requests
+            deadline: seconds the whole batch must finish in, unfinished records get CMDBTimeoutError
+
+        Retrurns:
+            result for each record in order, the CMDBError or requests.RequestException it failed with instead
+        """
+        return self.ci.upsert_cis(ci_type, records, key, no_attribute_policy, prefer, max_workers, deadline)
     
     def get_ci(
             self, 
@@ -63,6 +144,7 @@ class Client:
             page: int = 1,
             sort: Optional[str] = None,
             ret_key: RetKey = RetKey.default(),
+            deadline: Optional[float] = None,
         ) -> CIRetrieveRsp:
         """
         get ci instance
@@ -78,11 +160,193 @@ class Client:
             page: target page num
             sort: sort by target attribute, use `-attr` for descending
             ret_key: ret field name, optional values include ID|NAME|ALIAS
+            deadline: seconds the call must finish in, including retries, raise CMDBTimeoutError if exceeded
 
         Returns:
             target ci results
         """
-        return self.ci.get_ci(q, fl, facet, count, page, sort, ret_key)
+        return self.ci.get_ci(q, fl, facet, count, page, sort, ret_key, deadline=deadline)
+
+    def get_ci_stream(
+            self,
+            q: str,
+            fl: Optional[str] = None,
+            facet: Optional[str] = None,
+            count: int = 25,
+            page: int = 1,
+            sort: Optional[str] = None,
+            ret_key: RetKey = RetKey.default(),
+            deadline: Optional[float] = None,
+        ) -> CIRetrieveStream:
+        """
+        get ci instance in streaming mode
+
+        the same as `get_ci`, but cis are yielded while the response body is being received
+
+            > with client.get_ci_stream(q="_type:Human", count=10000) as rsp:
+            >     for ci in rsp:
+            >         print(ci)
+
+        Args:
+            q: search expression, may looks like "_type:Human,name:a"
+            fl: ret attrubute, split by comma
+            facet: staticstics
+            count: ci count per page
+            page: target page num
+            sort: sort by target attribute, use `-attr` for descending
+            ret_key: ret field name, optional values include ID|NAME|ALIAS
+            deadline: seconds the call must finish in, including retries, raise CMDBTimeoutError if exceeded
+
+        Returns:
+            stream of target ci results, `numfound`, `facet` and `counter` are available on it
+        """
+        return self.ci.get_ci_stream(q, fl, facet, count, page, sort, ret_key, deadline=deadline)
+    
+    def get_ci_all(
+            self,
+            q: str,
+            fl: Optional[str] = None,
+            sort: Optional[str] = None,
+            ret_key: RetKey = RetKey.default(),
+            page_size: int = 500,
+            memory_budget: int = 64 << 20,
+            deadline: Optional[float] = None,
+        ) -> CIResultSet:
+        """
+        get all ci instance matched, cis beyond `memory_budget` are spilled to a temporary file
+
+            > with client.get_ci_all(q="_type:Human", memory_budget=256 << 20) as cis:
+            >     print(len(cis), cis[0])
+
+        Args:
+            q: search expression, may looks like "_type:Human,name:a"
+            fl: ret attrubute, split by comma
+            sort: sort by target attribute, use `-attr` for descending
+            ret_key: ret field name, optional values include ID|NAME|ALIAS
+            page_size: ci count per page
+            memory_budget: max bytes of cis kept in memory, estimated from the size of a sample of them
+            deadline: seconds the fetch must finish in, when exceeded the cis fetched so far are
+                returned with `partial` True
+
+        Returns:
+            result set supporting iteration, len() and indexing
+        """
+        return self.ci.get_ci_all(q, fl, sort, ret_key, page_size, memory_budget, deadline)
+
+    def batch(self, max_workers: int = 8) -> Batch:
+        """
+        collect unrelated ci and ci relation queries to send them concurrently
+
+        eg: render a page needing several queries in the time of the slowest one
+
+            > batch = client.batch()
+            > servers = batch.add(CIRetrieveReq("_type:server", count=100))
+            > deps = batch.add(CIRelationRetrieveReq(root_id=1, level="1,2"))
+            > results = batch.run(deadline=2)
+
+        Args:
+            max_workers: max concurrent queries
+
+        Returns:
+            batch, `add` requests to it and `run` it to get responses in order, or errors of failed requests
+        """
+        return Batch(self.ci, self.cr, max_workers)
+
+    def profile(self, trace_malloc: bool = True) -> Profiler:
+        """
+        start measuring cpu time and allocations of every phase of requests, summed per endpoint:
+        to_params, sign, network, decode, rewrite of compact keys and model construction
+
+        eg: tell whether a slow export is spent in the sdk or waiting for the server
+
+            > with client.profile() as profiler:
+            >     client.get_ci_all("_type:server")
+            > profiler.dump("profile.txt")
+
+        Args:
+            trace_malloc: also trace allocations with tracemalloc, which slows python down noticeably
+
+        Returns:
+            profiler attached to the client, `stop` it or leave its with block to end profiling
+        """
+        return Profiler(trace_malloc).attach(self)
+
+    def count_ci(self, q: str, deadline: Optional[float] = None) -> int:
+        """
+        count cis matched by search expression, no ci is downloaded
+
+        Args:
+            q: search expression, may looks like "_type:Human,name:a"
+            deadline: seconds the call must finish in, including retries, raise CMDBTimeoutError if exceeded
+        """
+        return self.analytics.count(q, deadline)
+
+    def group_count(self, q: str, by: List[str], deadline: Optional[float] = None) -> GroupCountRsp:
+        """
+        count cis grouped by attributes with server side facet, no ci is downloaded
+
+        eg: count servers per datacenter per os
+
+            > client.group_count("_type:server", by=["datacenter", "os"]).to_records()
+
+        Args:
+            q: search expression, may looks like "_type:Human,name:a"
+            by: attributes to group by
+            deadline: seconds the call must finish in, queries still running then are cancelled
+
+        Returns:
+            count table keyed by value tuples of `by`, marked partial if the deadline passed
+        """
+        return self.analytics.group_count(q, by, deadline)
+
+    def group_count_types(
+            self,
+            ci_types: List[str],
+            by: List[str],
+            q: Optional[str] = None,
+            deadline: Optional[float] = None,
+        ) -> GroupCountRsp:
+        """
+        count cis of several ci types concurrently, grouped by ci type and attributes
+
+        Args:
+            ci_types: ci model types
+            by: attributes to group by
+            q: extra search expression applied to every ci type
+            deadline: seconds the call must finish in, queries still running then are cancelled
+
+        Returns:
+            count table keyed by value tuples of ["_type", *by], marked partial if the deadline passed
+        """
+        return self.analytics.group_count_types(ci_types, by, q, deadline)
+    
+    def change_feed(
+            self,
+            q: str,
+            updated_attr: str = "updated_at",
+            checkpoint: Union[str, Checkpoint, None] = None,
+            count: int = 100,
+        ) -> ChangeFeed:
+        """
+        get a feed of cis modified since last poll
+
+        eg: keep a cache of servers up to date, the watermark is kept in file "server.ckpt"
+
+            > for ci in client.change_feed("_type:server", checkpoint="server.ckpt").poll(interval=30):
+            >     refresh_cache(ci)
+
+        Args:
+            q: search expression of watched cis, may looks like "_type:Human"
+            updated_attr: attribute of ci update time
+            checkpoint: file path or checkpoint object to persist the watermark, if None, kept in memory only
+            count: ci count per page
+
+        Returns:
+            change feed, use `changes()` for one pass and `poll()` for a endless generator
+        """
+        if isinstance(checkpoint, str):
+            checkpoint = FileCheckpoint(checkpoint)
+        return ChangeFeed(self.ci, q, updated_attr, checkpoint, count)
     
     def update_ci(
             self,
@@ -91,6 +355,7 @@ class Client:
             ci_id: Optional[int] = None,
             attrs: Optional[dict] = None,
             no_attribute_policy: NoAttributePolicy = NoAttributePolicy.default(),
+            deadline: Optional[float] = None,
             **kwargs,
         ) -> CIUpdateRsp:
         """
@@ -108,13 +373,14 @@ class Client:
             ci_id: keyword agument only, the id of ci
             attrs: keyword agument only, fields to update
             no_attribute_policy: default to ignore not existed attributes update operation, optional value include IGNORE|REJECT
+            deadline: seconds the call must finish in, including retries, raise CMDBTimeoutError if exceeded
 
         Retrurns:
             CMDB update operation result
         """
-        return self.ci.update_ci(ci_type, ci_id=ci_id, attrs=attrs, no_attribute_policy=no_attribute_policy, **kwargs)
+        return self.ci.update_ci(ci_type, ci_id=ci_id, attrs=attrs, no_attribute_policy=no_attribute_policy, deadline=deadline, **kwargs)
     
-    def delete_ci(self, ci_id: int) -> CIDeleteRsp:
+    def delete_ci(self, ci_id: int, deadline: Optional[float] = None) -> CIDeleteRsp:
         """
         delete a ci by its ci_id
 
@@ -125,16 +391,18 @@ class Client:
 
         Args:
             ci_id: ci id for the ci to delete
+            deadline: seconds the call must finish in, including retries, raise CMDBTimeoutError if exceeded
         
         Retrurns:
             CMDB delete operation result
         """
-        return self.ci.delete_ci(ci_id)
+        return self.ci.delete_ci(ci_id, deadline=deadline)
     
     def add_ci_relation(
             self,
             src_ci_id: int,
             dst_ci_id: int,
+            deadline: Optional[float] = None,
         ) -> CIRelationCreateRsp:
         """
         create new ci_relation instance
@@ -142,11 +410,12 @@ class Client:
         Args:
             src_ci_id: id of source ci
             src_ci_id: id of destination ci
+            deadline: seconds the call must finish in, including retries, raise CMDBTimeoutError if exceeded
 
         Retrurns:
             ci_relation create operation result
         """
-        return self.cr.add_ci_relation(src_ci_id, dst_ci_id)
+        return self.cr.add_ci_relation(src_ci_id, dst_ci_id, deadline=deadline)
     
     def get_ci_relation(
             self,
@@ -160,6 +429,7 @@ class Client:
             page: int = 1,
             sort: Optional[str] = None,
             ret_key: RetKey = RetKey.default(),
+            deadline: Optional[float] = None,
         ) -> CIRelationRetrieveRsp:
         """
         get ci_relation instance
@@ -178,11 +448,12 @@ class Client:
             page: target page num
             sort: sort by target attribute, use `-attr` for descending
             ret_key: ret field name, optional values include ID|NAME|ALIAS
+            deadline: seconds the call must finish in, including retries, raise CMDBTimeoutError if exceeded
 
         Returns:
             target ci_relation results
         """
-        return self.cr.get_ci_relation(root_id, level, reverse, q, fl, facet, count, page, sort, ret_key)
+        return self.cr.get_ci_relation(root_id, level, reverse, q, fl, facet, count, page, sort, ret_key, deadline=deadline)
     
     def delete_ci_relation(
             self,
@@ -190,6 +461,7 @@ class Client:
             cr_id: Optional[int] = None,
             src_ci_id: Optional[int] = None,
             dst_ci_id: Optional[int] = None,
+            deadline: Optional[float] = None,
     ) -> CIRelationDeleteRsp:
         """
         to delete the cr, either the cr_id or a combination of dst_ci_id and src_ci_id can be used
@@ -208,11 +480,31 @@ class Client:
             cr_id: cr id for the ci_relation want to delete
             src_ci_id: id of source ci
             src_ci_id: id of destination ci
+            deadline: seconds the call must finish in, including retries, raise CMDBTimeoutError if exceeded
 
         Retrurns:
             CMDB delete operation result
         """
-        return self.cr.delete_ci_relation(cr_id=cr_id, src_ci_id=src_ci_id, dst_ci_id=dst_ci_id)
+        return self.cr.delete_ci_relation(cr_id=cr_id, src_ci_id=src_ci_id, dst_ci_id=dst_ci_id, deadline=deadline)
+
+
+    def topology_snapshot(self, ci_types: List[str], within_types: bool = True) -> Topology:
+        """
+        download relations of all cis of the ci types into a local graph
+
+        eg: find everything depending on a server without further requests
+
+            > topo = client.topology_snapshot(["application", "server"])
+            > topo.ancestors(server_ci_id)
+
+        Args:
+            ci_types: ci model types to snapshot
+            within_types: keep only relations whose destination is also of `ci_types`
+
+        Returns:
+            topology snapshot, can be saved to and loaded from file
+        """
+        return Topology.download(self.ci, self.cr, ci_types, within_types)
 
 
 def get_client(opt: Optional[Option] = None) -> Client:
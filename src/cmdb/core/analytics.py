@@ -0,0 +1,170 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cmdb.core.ci import CIClient
+from cmdb.core.deadline import Deadline
+from cmdb.core.exc import CMDBTimeoutError
+from cmdb.core.models import *
+
+
+# chars with a meaning in search expressions, the server has no escaping for them
+_QUERY_CHARS = frozenset(",;:()*\" \t\r\n")
+
+
+def _queryable(value: object) -> bool:
+    """tell if a facet value can be matched exactly by `attr:value` in a search expression"""
+    if value is None or isinstance(value, (list, dict)):
+        return False
+    text = str(value)
+    return bool(text) and _QUERY_CHARS.isdisjoint(text)
+
+
+class CIAnalytics:
+    """
+    CMDB CI statistics without downloading cis
+
+    counts are computed by server side `facet` and `numfound` with minimal page size,
+    queries are sent concurrently, one wave for each grouped attribute.
+
+    Attributes:
+        client: ci client to send queries
+        max_workers: max concurrent queries
+
+    Example:
+
+        > analytics = CIAnalytics(CIClient(opt))
+
+        > analytics.group_count("_type:server", by=["datacenter", "os"]).to_records()
+
+    """
+
+    def __init__(self, client: CIClient, max_workers: int = 8):
+        self.client = client
+        self.max_workers = max_workers
+
+    @staticmethod
+    def _map(pool: ThreadPoolExecutor, fn: Callable, items: list, deadline: Optional[Deadline]) -> Tuple[list, bool]:
+        """
+        run fn over items concurrently, queries not finished by the deadline are cancelled
+        and their results are None, the second value tells if any result is missing
+        """
+        futures = [pool.submit(fn, item) for item in items]
+        _, not_done = wait(futures, timeout=deadline.remaining() if deadline else None)
+        for f in not_done:
+            f.cancel()
+        results = []
+        for f in futures:
+            try:
+                results.append(None if f in not_done else f.result())
+            except CMDBTimeoutError:
+                results.append(None)
+        return results, any(r is None for r in results)
+
+    def _facet(self, q: str, attr: str, deadline: Optional[Deadline] = None) -> Tuple[int, List[Tuple[object, int]]]:
+        rsp = self.client._get_ci(CIRetrieveReq(q, facet=attr, count=1), deadline)
+        facet = rsp.facet or {}
+        if attr in facet:
+            entries = facet[attr]
+        elif len(facet) == 1:
+            entries = next(iter(facet.values()))
+        else:
+            entries = []
+        return rsp.numfound, [(e[0], e[1]) for e in entries if e[1]]
+
+    def count(self, q: str, deadline: Optional[float] = None) -> int:
+        """
+        count cis matched by search expression
+
+        Args:
+            q: search expression, may looks like "_type:Human,name:a"
+            deadline: seconds the call must finish in, raise CMDBTimeoutError if exceeded
+        """
+        return self.client._get_ci(CIRetrieveReq(q, count=1), Deadline.of(deadline)).numfound
+
+    def _group_count(self, queries: Dict[tuple, str], by: List[str], deadline: Optional[Deadline]) -> GroupCountRsp:
+        rows = {}
+        total = 0
+        partial = False
+        frontier = list(queries.items())
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            for level, attr in enumerate(by):
+                results, missing = self._map(pool, lambda item: self._facet(item[1], attr, deadline), frontier, deadline)
+                partial = partial or missing
+                last = level == len(by) - 1
+                next_frontier = []
+                for (prefix, q), result in zip(frontier, results):
+                    if result is None:
+                        continue
+                    numfound, entries = result
+                    if level == 0:
+                        total += numfound
+                    for value, count in entries:
+                        if last:
+                            rows[prefix + (value,)] = count
+                        elif _queryable(value):
+                            next_frontier.append((prefix + (value,), f"{q},{attr}:{value}"))
+                        else:
+                            # the group cannot be queried for the next attribute, so its rows are missing
+                            partial = True
+                frontier = next_frontier
+        finally:
+            # queries still running past the deadline are left to end by their own timeout
+            pool.shutdown(wait=False)
+        return GroupCountRsp(list(by), rows, total, partial)
+
+    def group_count(self, q: str, by: List[str], deadline: Optional[float] = None) -> GroupCountRsp:
+        """
+        count cis matched by search expression, grouped by attributes
+
+        eg: count servers per datacenter per os
+
+            > analytics.group_count("_type:server", by=["datacenter", "os"])
+
+        Args:
+            q: search expression, may looks like "_type:Human,name:a"
+            by: attributes to group by, each attribute costs one more concurrent wave of queries
+            deadline: seconds the call must finish in, queries still running then are cancelled
+
+        Returns:
+            count table keyed by value tuples of `by`, marked partial if the deadline passed,
+            or if a value of an attribute but the last one is null or contains chars of search expressions,
+            eg: `,` `;` `:` or spaces, as the cis of that value cannot be queried for the next attribute
+        """
+        if not by:
+            total = self.count(q, deadline)
+            return GroupCountRsp([], {(): total}, total)
+        return self._group_count({(): q}, by, Deadline.of(deadline))
+
+    def group_count_types(
+            self,
+            ci_types: List[str],
+            by: List[str],
+            q: Optional[str] = None,
+            deadline: Optional[float] = None,
+        ) -> GroupCountRsp:
+        """
+        count cis of several ci types, grouped by ci type and attributes
+
+        Args:
+            ci_types: ci model types, queried concurrently
+            by: attributes to group by
+            q: extra search expression applied to every ci type, eg: "status:online"
+            deadline: seconds the call must finish in, queries still running then are cancelled
+
+        Returns:
+            count table keyed by value tuples of ["_type", *by], marked partial as by `group_count`
+        """
+        queries = {(t,): f"_type:{t},{q}" if q else f"_type:{t}" for t in ci_types}
+        deadline = Deadline.of(deadline)
+        if not by:
+            pool = ThreadPoolExecutor(max_workers=self.max_workers)
+            try:
+                results, partial = self._map(pool, lambda q: self.count(q, deadline), list(queries.values()), deadline)
+            finally:
+                pool.shutdown(wait=False)
+            counts = {k: v for k, v in zip(queries, results) if v is not None}
+            return GroupCountRsp(["_type"], counts, sum(counts.values()), partial)
+        rsp = self._group_count(queries, by, deadline)
+        rsp.by = ["_type", *by]
+        return rsp
@@ -0,0 +1,107 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cmdb.core.deadline import Deadline
+from cmdb.core.policy import RetKey
+from cmdb.core.session import reset_after_fork
+
+
+class AttributeCache:
+    """
+    attribute id to name and alias mapping of ci types
+
+    used to restore name keyed cis from responses requested with `RetKey.ID`,
+    which repeat short attribute ids instead of long names in every ci.
+    a mapping is fetched once per ci type and refreshed after `ttl` seconds,
+    or at once when a ci carries an attribute id not known yet.
+
+    cis of a type mostly share the same keys in the same order, so the renamed keys
+    are cached per key layout, and a ci is rewritten without looking up its keys one by one.
+
+    Attributes:
+        request: send a signed request and decode the response, same as `Transport.request`
+        ttl: seconds a mapping is trusted
+        max_layouts: max key layouts cached, cis with sparse attributes may have many
+    """
+
+    def __init__(self, request: Callable, ttl: float = 300.0, max_layouts: int = 4096):
+        self.request = request
+        self.ttl = ttl
+        self.max_layouts = max_layouts
+        self._lock = threading.Lock()
+        self._mappings: Dict[int, Tuple[float, Dict[str, Dict[RetKey, str]]]] = {}
+        self._layouts: Dict[tuple, Tuple[str, ...]] = {}
+        reset_after_fork(self)
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def _fetch(self, type_id: int, deadline: Optional[Deadline]) -> Dict[str, Dict[RetKey, str]]:
+        resp = self.request("GET", f"/ci_types/{type_id}/attributes", {}, deadline)
+        mapping = {
+            str(attr["id"]): {
+                RetKey.ID: str(attr["id"]),
+                RetKey.NAME: attr["name"],
+                RetKey.ALIAS: attr.get("alias") or attr["name"],
+            }
+            for attr in resp.get("attributes", [])
+        }
+        with self._lock:
+            self._mappings[type_id] = (time.monotonic(), mapping)
+            self._layouts = {k: v for k, v in self._layouts.items() if k[0] != type_id}
+        return mapping
+
+    def mapping(self, type_id: int, deadline: Optional[Deadline] = None) -> Dict[str, Dict[RetKey, str]]:
+        """
+        attribute names keyed by attribute id of a ci type
+
+        Args:
+            type_id: ci type id, the `_type` of cis
+        """
+        cached = self._mappings.get(type_id)
+        if cached and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+        return self._fetch(type_id, deadline)
+
+    def invalidate(self, type_id: Optional[int] = None) -> None:
+        """forget mapping of a ci type, or of all ci types if None"""
+        with self._lock:
+            if type_id is None:
+                self._mappings.clear()
+                self._layouts = {}
+            else:
+                self._mappings.pop(type_id, None)
+                self._layouts = {k: v for k, v in self._layouts.items() if k[0] != type_id}
+
+    def rewrite(self, ci: dict, ret_key: RetKey, deadline: Optional[Deadline] = None) -> dict:
+        """
+        turn attribute id keys of a ci into `ret_key`, other keys are kept
+        """
+        type_id = ci.get("_type")
+        if type_id is None:
+            return ci
+        layout = (type_id, ret_key, tuple(ci))
+        keys = self._layouts.get(layout)
+        if keys is None or not self._fresh(type_id):
+            keys = self._rename(layout, deadline)
+        return dict(zip(keys, ci.values()))
+
+    def _fresh(self, type_id: int) -> bool:
+        cached = self._mappings.get(type_id)
+        return cached is not None and time.monotonic() - cached[0] < self.ttl
+
+    def _rename(self, layout: tuple, deadline: Optional[Deadline]) -> Tuple[str, ...]:
+        type_id, ret_key, keys = layout
+        mapping = self.mapping(type_id, deadline)
+        if any(k.isdigit() and k not in mapping for k in keys):
+            mapping = self._fetch(type_id, deadline)
+        renamed = tuple(mapping[k][ret_key] if k in mapping else k for k in keys)
+        with self._lock:
+            if len(self._layouts) >= self.max_layouts:
+                self._layouts = {}
+            self._layouts[layout] = renamed
+        return renamed
+
+    def rewrite_all(self, cis: List[dict], ret_key: RetKey, deadline: Optional[Deadline] = None) -> List[dict]:
+        return [self.rewrite(ci, ret_key, deadline) for ci in cis]
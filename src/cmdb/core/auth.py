@@ -1,4 +1,11 @@
 import hashlib
+from operator import itemgetter
+from typing import Callable, Dict, Tuple
+
+
+_SIGN_KEYS = ("_key", "_secret")
+# values of these types are signed as is, others are checked for dict and list, which are not signed
+_PLAIN_TYPES = frozenset((str, int, float, bool, type(None)))
 
 
 def build_api_key(key: str, secret: str, path: str, params: dict) -> dict:
@@ -11,3 +18,79 @@ def build_api_key(key: str, secret: str, path: str, params: dict) -> dict:
     params["_secret"] = hashlib.sha1(_secret).hexdigest()
     params["_key"] = key
     return params
+
+
+class SigningContext:
+    """
+    signs request params like `build_api_key`, with the work shared by requests done once
+
+    the sha1 state after hashing path and secret is kept per path and copied for every request,
+    and a getter of values sorted by name is kept per param layout, so params built by the same
+    request model are not sorted again. params are never modified.
+
+    Attributes:
+        key: api key
+        secret: api secret
+        max_cached: max paths and param layouts cached, cleared when exceeded
+    """
+
+    def __init__(self, key: str, secret: str, max_cached: int = 1024):
+        self.key = key
+        self.secret = secret
+        self.max_cached = max_cached
+        self._prefixes: Dict[str, "hashlib._Hash"] = {}
+        self._getters: Dict[Tuple[str, ...], Callable[[dict], tuple]] = {}
+
+    def _prefix(self, path: str) -> "hashlib._Hash":
+        prefix = self._prefixes.get(path)
+        if prefix is None:
+            if len(self._prefixes) >= self.max_cached:
+                self._prefixes = {}
+            prefix = self._prefixes[path] = hashlib.sha1("".join([path, self.secret]).encode("utf-8"))
+        return prefix
+
+    def _getter(self, params: dict) -> Callable[[dict], tuple]:
+        """get values of params sorted by name"""
+        layout = tuple(params)
+        getter = self._getters.get(layout)
+        if getter is None:
+            order = [k for k in sorted(layout) if k not in _SIGN_KEYS]
+            if len(order) > 1:
+                getter = itemgetter(*order)
+            elif order:
+                getter = lambda p, k=order[0]: (p[k],)
+            else:
+                getter = lambda p: ()
+            if len(self._getters) >= self.max_cached:
+                self._getters = {}
+            self._getters[layout] = getter
+        return getter
+
+    def signature(self, path: str, params: dict) -> str:
+        """
+        the `_secret` of params
+
+        Args:
+            path: url path of request, eg: /api/v0.1/ci/s
+            params: request params, without or with signature, which is ignored
+        """
+        h = self._prefix(path).copy()
+        values = self._getter(params)(params)
+        if not _PLAIN_TYPES.issuperset(map(type, values)):
+            values = [v for v in values if not isinstance(v, (dict, list))]
+        if values:
+            h.update("".join(map(str, values)).encode("utf-8"))
+        return h.hexdigest()
+
+    def sign(self, path: str, params: dict) -> dict:
+        """
+        copy of params with `_secret` and `_key`, the same as `build_api_key(key, secret, path, dict(params))`
+
+        Args:
+            path: url path of request, eg: /api/v0.1/ci/s
+            params: request params
+        """
+        signed = dict(params)
+        signed["_secret"] = self.signature(path, params)
+        signed["_key"] = self.key
+        return signed
@@ -0,0 +1,151 @@
+import dataclasses
+import itertools
+import random
+import threading
+import time
+from typing import List, Optional
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from cmdb.core.models import Option
+from cmdb.core.policy import BalancePolicy
+from cmdb.core.session import reset_after_fork
+
+
+@dataclasses.dataclass(eq=False)
+class Endpoint:
+    """
+    one cmdb api replica
+
+    Attributes:
+        url: base url of the replica, eg: https://yourhost.com/api/v0.1
+        outstanding: count of in-flight requests
+        latency: exponentially weighted moving average of response time in seconds
+        failures: consecutive failure count
+        ejected_until: monotonic time until which the replica is out of rotation
+    """
+    url: str
+    outstanding: int = 0
+    latency: Optional[float] = None
+    failures: int = 0
+    ejected_until: float = 0.0
+
+    def available(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+
+class Balancer:
+    """
+    client side load balancer over cmdb api replicas
+
+    every request acquires an endpoint and releases it when done, the balancer uses
+    the reported result as passive health check: an endpoint failing `max_failures`
+    times in a row is ejected for `eject_seconds`, and re-admitted afterwards.
+    if all endpoints are ejected, the one to be re-admitted first is used.
+
+    Attributes:
+        urls: base urls of replicas
+        policy: endpoint pick policy, optional values include ROUND_ROBIN|LEAST_OUTSTANDING|LATENCY_WEIGHTED
+        max_failures: consecutive failures before an endpoint is ejected
+        eject_seconds: how long an ejected endpoint stays out of rotation
+    """
+
+    # weight of the newest sample in latency average
+    decay = 0.3
+
+    def __init__(
+            self,
+            urls: List[str],
+            policy: BalancePolicy = BalancePolicy.default(),
+            max_failures: int = 3,
+            eject_seconds: float = 30.0,
+        ):
+        if not urls:
+            raise ValueError("at least one endpoint url is required")
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.policy = policy
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        reset_after_fork(self)
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+        # requests in flight in the parent are not in flight in the child
+        for ep in self.endpoints:
+            ep.outstanding = 0
+
+    @classmethod
+    def from_option(cls, opt: Option) -> "Balancer":
+        return cls(opt.urls, opt.balance_policy, opt.max_failures, opt.eject_seconds)
+
+    def _pick(self, candidates: List[Endpoint]) -> Endpoint:
+        if len(candidates) == 1:
+            return candidates[0]
+        if self.policy == BalancePolicy.LEAST_OUTSTANDING:
+            least = min(ep.outstanding for ep in candidates)
+            candidates = [ep for ep in candidates if ep.outstanding == least]
+        elif self.policy == BalancePolicy.LATENCY_WEIGHTED:
+            measured = [ep.latency for ep in candidates if ep.latency is not None]
+            # endpoints not measured yet are treated as the fastest one to get probed soon
+            best = min(measured) if measured else 1.0
+            weights = [
+                1.0 / max(ep.latency if ep.latency is not None else best, 1e-6) / (ep.outstanding + 1)
+                for ep in candidates
+            ]
+            return random.choices(candidates, weights)[0]
+        return candidates[next(self._counter) % len(candidates)]
+
+    def acquire(self, exclude: Optional[List[Endpoint]] = None) -> Endpoint:
+        """
+        pick an endpoint for the next request, must be paired with `release`
+
+        Args:
+            exclude: endpoints already tried by the current request, avoided if possible
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                ep for ep in self.endpoints
+                if ep.available(now) and not (exclude and ep in exclude)
+            ]
+            if not candidates:
+                candidates = [ep for ep in self.endpoints if not (exclude and ep in exclude)] or self.endpoints
+                candidates = [min(candidates, key=lambda ep: ep.ejected_until)]
+            ep = self._pick(candidates)
+            ep.outstanding += 1
+            return ep
+
+    def release(self, ep: Endpoint, elapsed: float, ok: bool) -> None:
+        """
+        report the result of a request sent to `ep`
+
+        Args:
+            ep: endpoint returned by `acquire`
+            elapsed: time cost of the request in seconds
+            ok: False if the request failed by connection error or server error
+        """
+        with self._lock:
+            ep.outstanding -= 1
+            if ok:
+                ep.failures = 0
+                ep.ejected_until = 0.0
+                if ep.latency is None:
+                    ep.latency = elapsed
+                else:
+                    ep.latency += self.decay * (elapsed - ep.latency)
+                return
+            ep.failures += 1
+            if ep.failures >= self.max_failures:
+                ep.ejected_until = time.monotonic() + self.eject_seconds
+
+
+def is_unsent(err: requests.RequestException) -> bool:
+    """
+    whether the request failed before reaching the server, so it is safe to retry on another endpoint
+    """
+    cause = err.args[0] if err.args else None
+    reason = getattr(cause, "reason", cause)
+    return isinstance(err, requests.ConnectTimeout) or isinstance(reason, NewConnectionError)
@@ -0,0 +1,112 @@
+import json
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple, Union
+
+import requests
+
+from cmdb.core.ci import CIClient
+from cmdb.core.ci_relations import CIRelationClient
+from cmdb.core.deadline import Deadline
+from cmdb.core.exc import CMDBError
+from cmdb.core.models import *
+
+
+BatchReq = Union[CIRetrieveReq, CIRelationRetrieveReq]
+BatchRsp = Union[CIRetrieveRsp, CIRelationRetrieveRsp, Exception]
+
+
+class Batch:
+    """
+    unrelated read requests sent concurrently
+
+    requests are collected by `add`, identical ones are sent once and share the response,
+    `run` sends them all at once and returns when the slowest one finishes, or the deadline passes.
+    a failed request does not fail the others, its error takes the place of its response.
+
+    Attributes:
+        ci: client of ci requests
+        cr: client of ci relation requests
+        max_workers: max concurrent requests
+
+    Example:
+
+        > batch = client.batch()
+        > servers = batch.add(CIRetrieveReq("_type:server", count=100))
+        > deps = batch.add(CIRelationRetrieveReq(root_id=1, level="1,2"))
+        > results = batch.run(deadline=2)
+        > results[servers].result, results[deps].result
+
+    """
+
+    def __init__(self, ci: CIClient, cr: CIRelationClient, max_workers: int = 8):
+        self.ci = ci
+        self.cr = cr
+        self.max_workers = max_workers
+        self._requests: List[BatchReq] = []
+        # position of every added request in the deduplicated requests
+        self._slots: List[int] = []
+        self._keys: Dict[Tuple[str, str], int] = {}
+
+    @staticmethod
+    def _key(req: BatchReq) -> Tuple[str, str]:
+        return type(req).__name__, json.dumps(req.to_params(), sort_keys=True, default=str)
+
+    def add(self, req: BatchReq) -> int:
+        """
+        add a request
+
+        Args:
+            req: CIRetrieveReq or CIRelationRetrieveReq
+
+        Returns:
+            index of its response in the results of `run`
+        """
+        if not isinstance(req, (CIRetrieveReq, CIRelationRetrieveReq)):
+            raise CMDBError(f"batch does not support {type(req).__name__}")
+        key = self._key(req)
+        slot = self._keys.get(key)
+        if slot is None:
+            slot = self._keys[key] = len(self._requests)
+            self._requests.append(req)
+        self._slots.append(slot)
+        return len(self._slots) - 1
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _send(self, req: BatchReq, deadline: Optional[Deadline]) -> BatchRsp:
+        try:
+            if deadline:
+                deadline.check()
+            if isinstance(req, CIRetrieveReq):
+                return self.ci._get_ci(req, deadline)
+            return self.cr._get_ci_relation(req, deadline)
+        except (CMDBError, requests.RequestException) as e:
+            return e
+
+    def run(self, deadline: Optional[float] = None) -> List[BatchRsp]:
+        """
+        send all requests concurrently
+
+        Args:
+            deadline: seconds the batch must finish in, requests unfinished by then get CMDBTimeoutError
+
+        Returns:
+            response for each added request in order, or the error it failed with
+        """
+        deadline = Deadline.of(deadline)
+        if not self._requests:
+            return []
+        pool = ThreadPoolExecutor(max_workers=min(self.max_workers, len(self._requests)))
+        futures = []
+        try:
+            futures.extend(pool.submit(self._send, req, deadline) for req in self._requests)
+            _, not_done = wait(futures, timeout=deadline.remaining() if deadline else None)
+        finally:
+            # requests not started yet are dropped, those still running past the deadline
+            # are left to end by their own timeout. cancel_futures of shutdown needs python 3.9
+            for f in futures:
+                f.cancel()
+            pool.shutdown(wait=False)
+        responses = [deadline.exceeded() if f in not_done else f.result() for f in futures]
+        return [responses[slot] for slot in self._slots]
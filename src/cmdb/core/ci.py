@@ -1,12 +1,24 @@
-from urllib.parse import urlparse
-from typing import Optional
+import dataclasses
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Union
 
 import requests
 
-from cmdb.core.auth import build_api_key
+from cmdb.core.attributes import AttributeCache
+from cmdb.core.deadline import Deadline
 from cmdb.core.models import *
 from cmdb.core.policy import RetKey
-from cmdb.core.exc import CMDBError
+from cmdb.core.exc import CMDBError, CMDBTimeoutError
+from cmdb.core.resultset import CIResultSet
+from cmdb.core.stream import CIRetrieveStream
+from cmdb.core.transport import Transport
+
+
+# errors of ci create telling the ci exists, or does not exist, by messages of english and chinese servers.
+# ascii word boundaries, chinese chars right after "CI" are word chars otherwise
+_CI_EXISTS = re.compile(r"\bci\b(?!\s*(_?type|类型)).*(already exist|已经?存在)", re.IGNORECASE | re.ASCII)
+_CI_NOT_FOUND = re.compile(r"\bci\b(?!\s*(_?type|类型)).*(not exist|not found|(?<!已)不存在)", re.IGNORECASE | re.ASCII)
 
 
 class CIClient:
@@ -15,6 +27,8 @@ class CIClient:
 
     Attributes:
         opt: initialize arugument, if None input, will initiallize with enviroment arguments
+        transport: sends requests, may be shared by clients, if None, created by `opt.transport_type`
+        attributes: attribute names per ci type, used to rewrite cis requested with `opt.compact_keys`
 
     Example:
 
@@ -30,51 +44,106 @@ class CIClient:
 
     """
 
-    def __init__(self, opt: Optional[Option] = None):
-        self.opt = opt if opt else Option()
-        self.session = requests.Session()
-        self.url = f"{self.opt.url}/ci"
+    def __init__(self, opt: Optional[Option] = None, transport: Optional[Transport] = None):
+        self.opt = opt if opt else (transport.opt if transport else Option())
+        self.transport = transport if transport else Transport.from_option(self.opt)
+        self.path = "/ci"
+        self.attributes = AttributeCache(self.transport.request)
 
-    def _build_api_key(self, url: str, payload: dict) -> dict:
-        return build_api_key(self.opt.key, self.opt.secret, urlparse(url).path, payload)
-    
-    def _check_err(self, resp: dict):
-        msg = resp.get("message")
-        if msg:
-            raise CMDBError(msg)
+    @property
+    def session(self) -> requests.Session:
+        """http session of current thread, only for `RequestsTransport`"""
+        return self.transport.sessions.get()
+
+    def _add_ci(self, params: CICreateReq, deadline: Optional[Deadline] = None) -> CICreateRsp:
+        resp = self.transport.request("POST", self.path, params, deadline)
+        self.transport.check(resp)
+        return self.transport.build(CICreateRsp, **resp)
+
+    def _upsert_ci(self, params: CICreateReq, deadline: Optional[Deadline] = None) -> CIUpsertRsp:
+        if params.exist_policy == ExistPolicy.REPLACE:
+            return CIUpsertRsp(self._add_ci(params, deadline).ci_id)
+        # the preferred policy succeeds in one request, the other one is the fallback,
+        # and the preferred one is tried again if a concurrent writer won the race.
+        # any other error, eg: an invalid attribute, fails at once
+        first = params.exist_policy
+        second = ExistPolicy.REJECT if first == ExistPolicy.NEED else ExistPolicy.NEED
+        err = None
+        for policy in (first, second, first):
+            try:
+                rsp = self._add_ci(dataclasses.replace(params, exist_policy=policy), deadline)
+            except CMDBTimeoutError:
+                raise
+            except CMDBError as e:
+                pattern = _CI_NOT_FOUND if policy == ExistPolicy.NEED else _CI_EXISTS
+                if not pattern.search(str(e)):
+                    raise
+                err = e
+                continue
+            return CIUpsertRsp(rsp.ci_id, policy == ExistPolicy.REJECT)
+        raise err
+
+    def _compact(self, params: CIRetrieveReq) -> Optional[RetKey]:
+        """ret key to rewrite cis to, if they are requested keyed by attribute id"""
+        if self.opt.compact_keys and params.ret_key != RetKey.ID:
+            return params.ret_key
+        return None
+
+    def _get_ci(self, params: CIRetrieveReq, deadline: Optional[Deadline] = None) -> CIRetrieveRsp:
+        ret_key = self._compact(params)
+        if ret_key:
+            params = dataclasses.replace(params, ret_key=RetKey.ID)
+        resp = self.transport.request("GET", f"{self.path}/s", params, deadline)
+        self.transport.check(resp)
+        if ret_key:
+            with self.transport.phase("rewrite"):
+                resp["result"] = self.attributes.rewrite_all(resp["result"], ret_key, deadline)
+        return self.transport.build(CIRetrieveRsp.from_raw, resp)
+
+    def _get_ci_stream(self, params: CIRetrieveReq, deadline: Optional[Deadline] = None) -> CIRetrieveStream:
+        ret_key = self._compact(params)
+        transform = None
+        if ret_key:
+            params = dataclasses.replace(params, ret_key=RetKey.ID)
+            transform = lambda ci: self.attributes.rewrite(ci, ret_key, deadline)
+        resp = self.transport.send("GET", f"{self.path}/s", params, deadline, stream=True)
+        return self.transport.build(CIRetrieveStream, resp, transform=transform, deadline=deadline)
     
-    def _add_ci(self, params: CICreateReq) -> CICreateRsp:
-        url = self.url
-        payload = self._build_api_key(url, params.to_params())
-        resp = self.session.post(url, json=payload).json()
-        self._check_err(resp)
-        return CICreateRsp(**resp)
-
-    def _get_ci(self, params: CIRetrieveReq) -> CIRetrieveRsp:
-        url = f"{self.url}/s"
-        payload = params.to_params()
-        payload = self._build_api_key(url, payload)
-        resp = self.session.get(url, params=payload).json()
-        self._check_err(resp)
-        return CIRetrieveRsp(**resp)
+    def _get_ci_all(self, params: CIRetrieveReq, result: CIResultSet, deadline: Optional[Deadline] = None) -> CIResultSet:
+        while True:
+            try:
+                with self._get_ci_stream(params, deadline) as rsp:
+                    n = 0
+                    for ci in rsp:
+                        result.append(ci)
+                        n += 1
+            except CMDBTimeoutError:
+                result.partial = True
+                return result
+            except BaseException:
+                # no one else holds the result set to close its file
+                result.close()
+                raise
+            if rsp.numfound is not None:
+                result.numfound = rsp.numfound
+            if n < params.count:
+                return result
+            params = dataclasses.replace(params, page=params.page + 1)
     
-    def _update_ci(self, ci_id: Optional[int], params: CIUpdateReq) -> CIUpdateRsp:
+    def _update_ci(self, ci_id: Optional[int], params: CIUpdateReq, deadline: Optional[Deadline] = None) -> CIUpdateRsp:
         if ci_id:
-            url = f"{self.url}/{ci_id}"
+            path = f"{self.path}/{ci_id}"
         else:
             if not params.unique_key.keys():
                 raise CMDBError("if not use ci_id, unique key must in request params")
-            url = self.url
-        payload = self._build_api_key(url, params.to_params())
-        resp = self.session.put(url, json=payload).json()
-        self._check_err(resp)
-        return CIUpdateRsp(**resp)
+            path = self.path
+        resp = self.transport.request("PUT", path, params, deadline)
+        self.transport.check(resp)
+        return self.transport.build(CIUpdateRsp, **resp)
     
-    def _delete_ci(self, params: CIDeleteReq) -> CIDeleteRsp:
-        url = f"{self.url}/{params.ci_id}"
-        payload = self._build_api_key(url, {})
-        resp = self.session.delete(url, json=payload).json()
-        return CIDeleteRsp(**resp)
+    def _delete_ci(self, params: CIDeleteReq, deadline: Optional[Deadline] = None) -> CIDeleteRsp:
+        resp = self.transport.request("DELETE", f"{self.path}/{params.ci_id}", {}, deadline)
+        return self.transport.build(CIDeleteRsp, **resp)
     
     def add_ci(
             self,
@@ -82,6 +151,7 @@ class CIClient:
             attrs: dict,
             no_attribute_policy: NoAttributePolicy = NoAttributePolicy.default(),
             exist_policy: ExistPolicy = ExistPolicy.default(),
+            deadline: Optional[float] = None,
         ) -> CICreateRsp:
         """
         create new ci instance
@@ -95,12 +165,99 @@ class CIClient:
             attrs: fields of ci to add
             no_attribute_policy: default to ignore not existed attributes update operation, optional value include IGNORE|REJECT
             exist_policy: default to reject add new ci if exists, optional value include NEED|REJECT|REPLACE
+            deadline: seconds the call must finish in, including retries, raise CMDBTimeoutError if exceeded
 
         Retrurns:
             CMDB create operation result
         """
         param = CICreateReq(ci_type, no_attribute_policy, exist_policy, attrs)
-        return self._add_ci(param)
+        return self._add_ci(param, Deadline.of(deadline))
+    
+    def upsert_ci(
+            self,
+            ci_type: str,
+            attrs: dict,
+            key: List[str],
+            no_attribute_policy: NoAttributePolicy = NoAttributePolicy.default(),
+            prefer: ExistPolicy = ExistPolicy.NEED,
+            deadline: Optional[float] = None,
+        ) -> CIUpsertRsp:
+        """
+        create a ci, or update it if exists
+
+        eg: suppose a ci model with fields [id, name, age], and its unique key is "name"
+
+            > client.upsert_ci("Human", {"name": "a", "age": 10}, key=["name"])
+
+        Args:
+            ci_type: ci model type
+            attrs: fields of ci, must include the unique key of ci model
+            key: attributes identifing the ci, must be in attrs
+            no_attribute_policy: default to ignore not existed attributes update operation, optional value include IGNORE|REJECT
+            prefer: which case costs one request, NEED to update first, REJECT to create first,
+                REPLACE always costs one request but does not tell if created
+            deadline: seconds the call must finish in, including retries, raise CMDBTimeoutError if exceeded
+
+        Retrurns:
+            ci_id and whether the ci is created
+        """
+        missing = [k for k in key if k not in attrs]
+        if missing:
+            raise CMDBError(f"key attributes {missing} must in attrs")
+        param = CICreateReq(ci_type, no_attribute_policy, prefer, attrs)
+        return self._upsert_ci(param, Deadline.of(deadline))
+
+    def upsert_cis(
+            self,
+            ci_type: str,
+            records: List[dict],
+            key: List[str],
+            no_attribute_policy: NoAttributePolicy = NoAttributePolicy.default(),
+            prefer: ExistPolicy = ExistPolicy.NEED,
+            max_workers: int = 8,
+            deadline: Optional[float] = None,
+        ) -> List[Union[CIUpsertRsp, Exception]]:
+        """
+        upsert cis concurrently
+
+        records with the same key are merged, the last one wins, so they do not race with each other
+
+        Args:
+            ci_type: ci model type
+            records: fields of cis, each must include the key attributes
+            key: attributes identifing a ci
+            no_attribute_policy: default to ignore not existed attributes update operation, optional value include IGNORE|REJECT
+            prefer: which case costs one request, NEED to update first, REJECT to create first, REPLACE for one request always
+            max_workers: max concurrent requests
+            deadline: seconds the whole batch must finish in, unfinished records get CMDBTimeoutError
+
+        Retrurns:
+            result for each record in order, the CMDBError or requests.RequestException it failed with instead
+        """
+        deadline = Deadline.of(deadline)
+        results: List[Union[CIUpsertRsp, Exception, None]] = [None] * len(records)
+        groups = {}
+        for i, attrs in enumerate(records):
+            missing = [k for k in key if k not in attrs]
+            if missing:
+                results[i] = CMDBError(f"key attributes {missing} must in attrs")
+                continue
+            groups.setdefault(tuple(attrs[k] for k in key), []).append(i)
+
+        def upsert(indexes: List[int]):
+            try:
+                if deadline:
+                    deadline.check()
+                param = CICreateReq(ci_type, no_attribute_policy, prefer, records[indexes[-1]])
+                return self._upsert_ci(param, deadline)
+            except (CMDBError, requests.RequestException) as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for indexes, rsp in zip(groups.values(), pool.map(upsert, groups.values())):
+                for i in indexes:
+                    results[i] = rsp
+        return results
     
     def get_ci(
             self, 
@@ -111,6 +268,7 @@ class CIClient:
             page: int = 1,
             sort: Optional[str] = None,
             ret_key: RetKey = RetKey.default(),
+            deadline: Optional[float] = None,
         ) -> CIRetrieveRsp:
         """
         get ci instance
@@ -126,12 +284,79 @@ class CIClient:
             page: target page num
             sort: sort by target attribute, use `-attr` for descending
             ret_key: ret field name, optional values include ID|NAME|ALIAS
+            deadline: seconds the call must finish in, including retries, raise CMDBTimeoutError if exceeded
 
         Returns:
-            target ci results
+            target ci results, `result` holds cis as dict, `cis` wraps them with typed accessors
         """
         params = CIRetrieveReq(q, fl, facet, count, page, sort, ret_key)
-        return self._get_ci(params)
+        return self._get_ci(params, Deadline.of(deadline))
+
+    def get_ci_stream(
+            self,
+            q: str,
+            fl: Optional[str] = None,
+            facet: Optional[str] = None,
+            count: int = 25,
+            page: int = 1,
+            sort: Optional[str] = None,
+            ret_key: RetKey = RetKey.default(),
+            deadline: Optional[float] = None,
+        ) -> CIRetrieveStream:
+        """
+        get ci instance in streaming mode
+
+        the same as `get_ci`, but the response body is parsed while being received,
+        cis are yielded by iterating the returned stream, which keeps memory low for large `count`.
+        close the stream, or use it as context manager, if not fully iterated.
+
+        Args:
+            q: search expression, may looks like "_type:Human,name:a"
+            fl: ret attrubute, split by comma
+            facet: staticstics
+            count: ci count per page
+            page: target page num
+            sort: sort by target attribute, use `-attr` for descending
+            ret_key: ret field name, optional values include ID|NAME|ALIAS
+            deadline: seconds the call must finish in, including retries, raise CMDBTimeoutError if exceeded
+
+        Returns:
+            stream of target ci results
+        """
+        params = CIRetrieveReq(q, fl, facet, count, page, sort, ret_key)
+        return self._get_ci_stream(params, Deadline.of(deadline))
+    
+    def get_ci_all(
+            self,
+            q: str,
+            fl: Optional[str] = None,
+            sort: Optional[str] = None,
+            ret_key: RetKey = RetKey.default(),
+            page_size: int = 500,
+            memory_budget: int = 64 << 20,
+            deadline: Optional[float] = None,
+        ) -> CIResultSet:
+        """
+        get all ci instance matched, page by page
+
+        pages are read in streaming mode, cis beyond `memory_budget` are spilled to a temporary file,
+        close the result set, or use it as context manager, to remove the file.
+
+        Args:
+            q: search expression, may looks like "_type:Human,name:a"
+            fl: ret attrubute, split by comma
+            sort: sort by target attribute, use `-attr` for descending, keeps pages stable while cis change
+            ret_key: ret field name, optional values include ID|NAME|ALIAS
+            page_size: ci count per page
+            memory_budget: max bytes of cis kept in memory, estimated from the size of a sample of them
+            deadline: seconds the fetch must finish in, when exceeded the cis fetched so far are
+                returned with `partial` True
+
+        Returns:
+            result set supporting iteration, len() and indexing
+        """
+        params = CIRetrieveReq(q, fl, None, page_size, 1, sort, ret_key)
+        return self._get_ci_all(params, CIResultSet(memory_budget), Deadline.of(deadline))
     
     def update_ci(
             self,
@@ -140,6 +365,7 @@ class CIClient:
             ci_id: Optional[int] = None,
             attrs: Optional[dict] = None,
             no_attribute_policy: NoAttributePolicy = NoAttributePolicy.default(),
+            deadline: Optional[float] = None,
             **kwargs,
         ) -> CIUpdateRsp:
         """
@@ -160,6 +386,7 @@ class CIClient:
             ci_id: keyword agument only, the id of ci
             attrs: keyword agument only, fields to update
             no_attribute_policy: default to ignore not existed attributes update operation, optional value include IGNORE|REJECT
+            deadline: seconds the call must finish in, including retries, raise CMDBTimeoutError if exceeded
 
         Retrurns:
             CMDB update operation result
@@ -167,9 +394,9 @@ class CIClient:
         param = CIUpdateReq(ci_type, no_attribute_policy, attrs or {})
         if not ci_id:
             param.unique_key = kwargs
-        return self._update_ci(ci_id, param)
+        return self._update_ci(ci_id, param, Deadline.of(deadline))
     
-    def delete_ci(self, ci_id: int) -> CIDeleteRsp:
+    def delete_ci(self, ci_id: int, deadline: Optional[float] = None) -> CIDeleteRsp:
         """
         delete a ci by its ci_id
 
@@ -181,9 +408,10 @@ class CIClient:
 
         Args:
             ci_id: ci id for the ci want to delete
+            deadline: seconds the call must finish in, including retries, raise CMDBTimeoutError if exceeded
         
         Retrurns:
             CMDB delete operation result
         """
         param = CIDeleteReq(ci_id)
-        return self._delete_ci(param)
+        return self._delete_ci(param, Deadline.of(deadline))
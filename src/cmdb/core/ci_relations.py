@@ -1,12 +1,12 @@
-from urllib.parse import urlparse
 from typing import Optional
 
 import requests
 
-from cmdb.core.auth import build_api_key
+from cmdb.core.deadline import Deadline
 from cmdb.core.models import *
 from cmdb.core.policy import RetKey
 from cmdb.core.exc import CMDBError
+from cmdb.core.transport import Transport
 
 
 class CIRelationClient:
@@ -15,6 +15,7 @@ class CIRelationClient:
 
     Attributes:
         opt: initialize arugument, if None input, will initiallize with enviroment arguments
+        transport: sends requests, may be shared by clients, if None, created by `opt.transport_type`
 
     Example:
 
@@ -30,50 +31,39 @@ class CIRelationClient:
 
     """
 
-    def __init__(self, opt: Optional[Option] = None):
-        self.opt = opt if opt else Option()
-        self.session = requests.Session()
-        self.url = f"{self.opt.url}/ci_relations"
-
-    def _build_api_key(self, url: str, payload: dict) -> dict:
-        return build_api_key(self.opt.key, self.opt.secret, urlparse(url).path, payload)
-    
-    def _check_err(self, resp: dict):
-        msg = resp.get("message")
-        if msg:
-            raise CMDBError(msg)
-    
-    def _add_ci_relation(self, params: CIRelationCreateReq) -> CIRelationCreateRsp:
-        url = f"{self.url}/{params.src_ci_id}/{params.dst_ci_id}"
-        payload = self._build_api_key(url, params.to_params())
-        resp = self.session.post(url, json=payload).json()
-        self._check_err(resp)
-        return CIRelationCreateRsp(**resp)
-
-    def _get_ci_relation(self, params: CIRelationRetrieveReq) -> CIRelationRetrieveRsp:
-        url = f"{self.url}/s"
-        payload = params.to_params()
-        payload = self._build_api_key(url, payload)
-        resp = self.session.get(url, params=payload).json()
-        self._check_err(resp)
-        return CIRelationRetrieveRsp(**resp)
+    def __init__(self, opt: Optional[Option] = None, transport: Optional[Transport] = None):
+        self.opt = opt if opt else (transport.opt if transport else Option())
+        self.transport = transport if transport else Transport.from_option(self.opt)
+        self.path = "/ci_relations"
+
+    @property
+    def session(self) -> requests.Session:
+        """http session of current thread, only for `RequestsTransport`"""
+        return self.transport.sessions.get()
+
+    def _add_ci_relation(self, params: CIRelationCreateReq, deadline: Optional[Deadline] = None) -> CIRelationCreateRsp:
+        resp = self.transport.request("POST", f"{self.path}/{params.src_ci_id}/{params.dst_ci_id}", params, deadline)
+        self.transport.check(resp)
+        return self.transport.build(CIRelationCreateRsp, **resp)
+
+    def _get_ci_relation(self, params: CIRelationRetrieveReq, deadline: Optional[Deadline] = None) -> CIRelationRetrieveRsp:
+        resp = self.transport.request("GET", f"{self.path}/s", params, deadline)
+        self.transport.check(resp)
+        return self.transport.build(CIRelationRetrieveRsp.from_raw, resp)
     
-    def _delete_ci_relation_by_cr_id(self, params: CIRelationDeleteReq) -> CIRelationDeleteRsp:
-        url = f"{self.url}/{params.cr_id}"
-        payload = self._build_api_key(url, params.to_params())
-        resp = self.session.delete(url, json=payload).json()
-        return CIRelationDeleteRsp(**resp)
+    def _delete_ci_relation_by_cr_id(self, params: CIRelationDeleteReq, deadline: Optional[Deadline] = None) -> CIRelationDeleteRsp:
+        resp = self.transport.request("DELETE", f"{self.path}/{params.cr_id}", params, deadline)
+        return self.transport.build(CIRelationDeleteRsp, **resp)
     
-    def _delete_ci_relation(self, params: CIRelationDeleteReq) -> CIRelationDeleteRsp:
-        url = f"{self.url}/{params.src_ci_id}/{params.dst_ci_id}"
-        payload = self._build_api_key(url, params.to_params())
-        resp = self.session.delete(url, json=payload).json()
-        return CIRelationDeleteRsp(**resp)
+    def _delete_ci_relation(self, params: CIRelationDeleteReq, deadline: Optional[Deadline] = None) -> CIRelationDeleteRsp:
+        resp = self.transport.request("DELETE", f"{self.path}/{params.src_ci_id}/{params.dst_ci_id}", params, deadline)
+        return self.transport.build(CIRelationDeleteRsp, **resp)
     
     def add_ci_relation(
             self,
             src_ci_id: int,
             dst_ci_id: int,
+            deadline: Optional[float] = None,
         ) -> CIRelationCreateRsp:
         """
         create new ci_relation instance
@@ -81,12 +71,13 @@ class CIRelationClient:
         Args:
             src_ci_id: id of source ci
             src_ci_id: id of destination ci
+            deadline: seconds the call must finish in, including retries, raise CMDBTimeoutError if exceeded
 
         Retrurns:
             ci_relation create operation result
         """
         param = CIRelationCreateReq(src_ci_id, dst_ci_id)
-        return self._add_ci_relation(param)
+        return self._add_ci_relation(param, Deadline.of(deadline))
     
     def get_ci_relation(
             self,
@@ -100,6 +91,7 @@ class CIRelationClient:
             page: int = 1,
             sort: Optional[str] = None,
             ret_key: RetKey = RetKey.default(),
+            deadline: Optional[float] = None,
         ) -> CIRelationRetrieveRsp:
         """
         get ci_relation instance
@@ -118,12 +110,13 @@ class CIRelationClient:
             page: target page num
             sort: sort by target attribute, use `-attr` for descending
             ret_key: ret field name, optional values include ID|NAME|ALIAS
+            deadline: seconds the call must finish in, including retries, raise CMDBTimeoutError if exceeded
 
         Returns:
             target ci_relation results
         """
         params = CIRelationRetrieveReq(root_id, level, reverse, q, fl, facet, count, page, sort, ret_key)
-        return self._get_ci_relation(params)
+        return self._get_ci_relation(params, Deadline.of(deadline))
     
     def delete_ci_relation(
             self,
@@ -131,6 +124,7 @@ class CIRelationClient:
             cr_id: Optional[int] = None,
             src_ci_id: Optional[int] = None,
             dst_ci_id: Optional[int] = None,
+            deadline: Optional[float] = None,
         ) -> CIRelationDeleteRsp:
         """
         to delete the cr, either the cr_id or a combination of dst_ci_id and src_ci_id can be used
@@ -149,14 +143,15 @@ class CIRelationClient:
             cr_id: cr id for the ci_relation want to delete
             src_ci_id: id of source ci
             src_ci_id: id of destination ci
+            deadline: seconds the call must finish in, including retries, raise CMDBTimeoutError if exceeded
 
         Retrurns:
             CMDB delete operation result
         """
         if cr_id is not None:
             param = CIRelationDeleteReq(cr_id)
-            return self._delete_ci_relation_by_cr_id(param)
+            return self._delete_ci_relation_by_cr_id(param, Deadline.of(deadline))
         elif all({src_ci_id is not None, dst_ci_id is not None}):
             param = CIRelationDeleteReq(src_ci_id=src_ci_id, dst_ci_id=dst_ci_id)
-            return self._delete_ci_relation(param)
+            return self._delete_ci_relation(param, Deadline.of(deadline))
         raise CMDBError("cr_id should be provided, or both src_ci_id and dst_ci_id should be provided.")
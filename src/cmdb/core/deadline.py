@@ -0,0 +1,47 @@
+import time
+from typing import Optional, Tuple, Union
+
+from cmdb.core.exc import CMDBTimeoutError
+
+
+class Deadline:
+    """
+    point in time a call, including its retries and pages, must finish by
+
+    Attributes:
+        seconds: time budget from now on
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def of(cls, deadline: Union[None, float, "Deadline"]) -> Optional["Deadline"]:
+        """accept seconds or a deadline object, None for no deadline"""
+        if deadline is None or isinstance(deadline, Deadline):
+            return deadline
+        return cls(deadline)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def exceeded(self) -> CMDBTimeoutError:
+        return CMDBTimeoutError(f"deadline of {self.seconds}s exceeded")
+
+    def check(self) -> None:
+        """raise CMDBTimeoutError if expired"""
+        if self.expired:
+            raise self.exceeded()
+
+    def timeout(self, connect: Optional[float], read: Optional[float]) -> Tuple[float, float]:
+        """socket timeouts clamped to remaining time"""
+        remaining = self.remaining()
+        return (
+            min(connect, remaining) if connect is not None else remaining,
+            min(read, remaining) if read is not None else remaining,
+        )
@@ -1,3 +1,8 @@
 
 class CMDBError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class CMDBTimeoutError(CMDBError):
+    """deadline of a call is exceeded"""
+    pass
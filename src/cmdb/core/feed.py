@@ -0,0 +1,237 @@
+import abc
+import json
+import os
+import time
+from typing import Callable, Iterator, Optional
+
+from cmdb.core.ci import CIClient
+from cmdb.core.deadline import Deadline
+from cmdb.core.exc import CMDBTimeoutError
+from cmdb.core.models import *
+
+
+class Checkpoint(abc.ABC):
+    """persisted state of a change feed"""
+
+    @abc.abstractmethod
+    def load(self) -> Optional[dict]:
+        raise NotImplementedError("")
+
+    @abc.abstractmethod
+    def save(self, state: dict) -> None:
+        raise NotImplementedError("")
+
+
+class FileCheckpoint(Checkpoint):
+    """
+    checkpoint saved as json file, replaced atomically on every save
+
+    Attributes:
+        path: file path of checkpoint
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Optional[dict]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, state: dict) -> None:
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+
+class CallbackCheckpoint(Checkpoint):
+    """
+    checkpoint kept by caller, eg: in redis or database
+
+    Attributes:
+        load_fn: return saved state, None if nothing saved
+        save_fn: persist state
+    """
+
+    def __init__(self, load_fn: Callable[[], Optional[dict]], save_fn: Callable[[dict], None]):
+        self.load_fn = load_fn
+        self.save_fn = save_fn
+
+    def load(self) -> Optional[dict]:
+        return self.load_fn()
+
+    def save(self, state: dict) -> None:
+        self.save_fn(state)
+
+
+class ChangeFeed:
+    """
+    incremental feed of cis modified since last poll
+
+    cis are queried sorted by `updated_attr` starting from the watermark, which is the largest
+    `updated_attr` value seen. cis sharing the watermark value are remembered by `_id`, and ties
+    filling a whole page are scanned again as a group, as their order is not stable across requests,
+    so ties across polls and pages are neither lost nor yielded twice. the watermark is saved to
+    `checkpoint` after every page, a ci may be yielded again if the consumer stops in the middle
+    of a page, so processing should be idempotent.
+
+    cis whose `updated_attr` is null are never yielded.
+
+    Attributes:
+        client: ci client to send queries
+        q: search expression of watched cis, may looks like "_type:Human"
+        updated_attr: attribute of ci update time
+        checkpoint: where to persist the watermark, if None, kept in memory only
+        count: ci count per page
+        fl: ret attrubute, split by comma, must include `updated_attr` if set
+        ret_key: ret field name, optional values include ID|NAME|ALIAS
+        tie_scans: max scans over the pages of ties before giving up on ties missed by unstable order
+
+    Example:
+
+        > feed = ChangeFeed(CIClient(opt), "_type:server", checkpoint=FileCheckpoint("server.ckpt"))
+
+        > for ci in feed.poll(interval=30):
+        >     refresh_cache(ci)
+
+    """
+
+    def __init__(
+            self,
+            client: CIClient,
+            q: str,
+            updated_attr: str = "updated_at",
+            checkpoint: Optional[Checkpoint] = None,
+            count: int = 100,
+            fl: Optional[str] = None,
+            ret_key: RetKey = RetKey.default(),
+            tie_scans: int = 8,
+        ):
+        self.client = client
+        self.q = q
+        self.updated_attr = updated_attr
+        self.checkpoint = checkpoint
+        self.count = count
+        self.fl = fl
+        self.ret_key = ret_key
+        self.tie_scans = tie_scans
+        state = checkpoint.load() if checkpoint else None
+        state = state or {}
+        self.watermark = state.get("watermark")
+        self.seen = set(state.get("seen", []))
+        # False if the last pass stopped by deadline before catching up
+        self.caught_up = False
+
+    def _query(self) -> str:
+        if self.watermark is None:
+            return self.q
+        return f"{self.q},{self.updated_attr}:[{self.watermark} _TO_ *]"
+
+    def _save(self) -> None:
+        if self.checkpoint:
+            self.checkpoint.save({"watermark": self.watermark, "seen": sorted(self.seen)})
+
+    def _page(self, q: str, page: int, deadline: Optional[Deadline]) -> CIRetrieveRsp:
+        params = CIRetrieveReq(q, self.fl, None, self.count, page, self.updated_attr, self.ret_key)
+        return self.client._get_ci(params, deadline)
+
+    def _ties(self, deadline: Optional[Deadline]) -> Iterator[dict]:
+        """
+        yield unseen cis whose `updated_attr` equals the watermark
+
+        the server sorts by `updated_attr` only, so the order of ties may change between requests,
+        and paging through them may skip some. all pages of the ties are scanned again until
+        as many distinct cis as the server counts are found.
+        """
+        q = f"{self.q},{self.updated_attr}:[{self.watermark} _TO_ {self.watermark}]"
+        for _ in range(self.tie_scans):
+            found = set()
+            page = 1
+            while True:
+                rsp = self._page(q, page, deadline)
+                for ci in rsp.result:
+                    if ci.get(self.updated_attr) != self.watermark:
+                        continue
+                    found.add(ci["_id"])
+                    if ci["_id"] not in self.seen:
+                        self.seen.add(ci["_id"])
+                        yield ci
+                if len(rsp.result) < self.count:
+                    break
+                page += 1
+            self._save()
+            if len(found) >= rsp.numfound:
+                return
+
+    def changes(self, deadline: Optional[float] = None) -> Iterator[dict]:
+        """
+        yield cis modified after the watermark until caught up
+
+        Args:
+            deadline: seconds the pass must finish in, when exceeded the pass stops with
+                `caught_up` False, and the next pass continues from the saved watermark
+        """
+        deadline = Deadline.of(deadline)
+        self.caught_up = False
+        try:
+            yield from self._changes(deadline)
+        except CMDBTimeoutError:
+            return
+
+    def _changes(self, deadline: Optional[Deadline]) -> Iterator[dict]:
+        page = 1
+        # ties of the watermark were scanned as a whole in this pass
+        scanned = False
+        while True:
+            result = self._page(self._query(), page, deadline).result
+            full = len(result) >= self.count
+            values = [ci.get(self.updated_attr) for ci in result]
+            values = [v for v in values if v is not None]
+            last = max(values) if values else None
+            for ci in result:
+                value = ci.get(self.updated_attr)
+                if value is None or (self.watermark is not None and value < self.watermark):
+                    continue
+                if value == self.watermark:
+                    if ci["_id"] in self.seen:
+                        continue
+                    self.seen.add(ci["_id"])
+                elif full and value == last:
+                    # the ties of the last value may go on in the next page, they are read after restarting from it
+                    continue
+                yield ci
+            if not full:
+                if last is not None and (self.watermark is None or last > self.watermark):
+                    self.watermark = last
+                    self.seen = {ci["_id"] for ci in result if ci.get(self.updated_attr) == last}
+                self._save()
+                self.caught_up = True
+                return
+            if last is None or last == self.watermark:
+                # a page full of nulls or of ties of the watermark, cis after them are on the following pages
+                if last is not None and not scanned:
+                    yield from self._ties(deadline)
+                    scanned = True
+                page += 1
+            else:
+                self.watermark = last
+                self.seen = set()
+                scanned = False
+                page = 1
+            self._save()
+
+    def poll(self, interval: float = 10.0, deadline: Optional[float] = None) -> Iterator[dict]:
+        """
+        yield modified cis forever, sleeping `interval` seconds once caught up
+
+        Args:
+            interval: seconds between polls
+            deadline: seconds each pass must finish in, a pass stopped by deadline is resumed without sleeping
+        """
+        while True:
+            yield from self.changes(deadline)
+            if self.caught_up:
+                time.sleep(interval)
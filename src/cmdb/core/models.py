@@ -1,9 +1,10 @@
 import abc
 import dataclasses
 import os
-from typing import Optional
+from collections.abc import Mapping, Sequence
+from typing import Any, Dict, Iterator, List, Optional, Union
 
-from cmdb.core.policy import ExistPolicy, NoAttributePolicy, RetKey
+from cmdb.core.policy import BalancePolicy, ExistPolicy, NoAttributePolicy, RetKey, TransportType
 
 
 class Request(abc.ABC):
@@ -17,7 +18,7 @@ class Request(abc.ABC):
 
 class Response(abc.ABC):
     """response of cmdb request"""
-    pass
+    __slots__ = ()
 
 
 @dataclasses.dataclass
@@ -27,10 +28,28 @@ class Option:
 
     all attributes default initialize with empty str if no argument input,
     and then will check the enviorment arguments
+
+    url may be a list of api replicas, or replicas split by comma,
+    requests are distributed across them by `balance_policy`,
+    a replica failing `max_failures` times in a row is ejected for `eject_seconds`
+
+    `connect_timeout` and `read_timeout` are socket timeouts in seconds of every request, None for no timeout
+
+    if `compact_keys` is True, cis are requested keyed by attribute id, which is much shorter on the wire,
+    and rewritten to the requested ret key by client with attribute names cached per ci type
+
+    `transport_type` selects the http library, URLLIB3 costs less per request than REQUESTS
     """
-    url: str = ""
+    url: Union[str, List[str]] = ""
     key: str = ""
     secret: str = ""
+    balance_policy: BalancePolicy = BalancePolicy.default()
+    max_failures: int = 3
+    eject_seconds: float = 30.0
+    connect_timeout: Optional[float] = 10.0
+    read_timeout: Optional[float] = 60.0
+    compact_keys: bool = False
+    transport_type: TransportType = TransportType.default()
 
     def __post_init__(self) -> None:
         if not self.url:
@@ -40,6 +59,12 @@ class Option:
         if not self.secret:
             self.secret = os.environ["CMDB_SECRET"]
 
+    @property
+    def urls(self) -> List[str]:
+        """api replicas"""
+        urls = self.url.split(",") if isinstance(self.url, str) else self.url
+        return [u.strip().rstrip("/") for u in urls if u.strip()]
+
 
 @dataclasses.dataclass
 class CICreateReq(Request):
@@ -65,6 +90,17 @@ class CICreateRsp(Response):
     ci_id: int
 
 
+@dataclasses.dataclass
+class CIUpsertRsp(Response):
+    """
+    response of ci upsert request
+
+    created is True if the ci is created, False if updated, None if unknown
+    """
+    ci_id: int
+    created: Optional[bool] = None
+
+
 @dataclasses.dataclass
 class CIRetrieveReq(Request):
     """ci retrieve requet"""
@@ -82,15 +118,185 @@ class CIRetrieveReq(Request):
         return p
 
 
-@dataclasses.dataclass
-class CIRetrieveRsp(Response):
+class CI(Mapping):
+    """
+    a ci of search results, read only view over its decoded json object
+
+    Attributes:
+        raw: decoded json object of the ci
+    """
+    __slots__ = ("raw",)
+
+    def __init__(self, raw: dict):
+        self.raw = raw
+
+    @property
+    def id(self) -> int:
+        """ci id"""
+        return self.raw["_id"]
+
+    @property
+    def type_id(self) -> int:
+        """ci type id"""
+        return self.raw["_type"]
+
+    @property
+    def ci_type(self) -> Optional[str]:
+        """ci type name"""
+        return self.raw.get("ci_type")
+
+    def __getitem__(self, key: str) -> Any:
+        return self.raw[key]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.raw.get(key, default)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.raw
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.raw)
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def __repr__(self) -> str:
+        return f"CI({self.raw!r})"
+
+
+class CIList(Sequence):
+    """cis of search results, each one wrapped as `CI` when accessed"""
+    __slots__ = ("raw",)
+
+    def __init__(self, raw: list):
+        self.raw = raw
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[CI, List[CI]]:
+        if isinstance(index, slice):
+            return [CI(x) for x in self.raw[index]]
+        return CI(self.raw[index])
+
+    def __iter__(self) -> Iterator[CI]:
+        return map(CI, self.raw)
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def ids(self) -> List[int]:
+        """ci ids in order"""
+        return [x["_id"] for x in self.raw]
+
+
+class _Field:
+    """field of a response, read from and written to its decoded json object"""
+    __slots__ = ("name", "default")
+
+    def __init__(self, default: Any = None):
+        self.default = default
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.name = name
+
+    def __get__(self, obj: Any, owner: Optional[type] = None) -> Any:
+        if obj is None:
+            return self
+        value = obj.raw.get(self.name)
+        if value is None:
+            if not callable(self.default):
+                return self.default
+            # kept, so changes to a missing list or dict are not lost
+            value = obj.raw[self.name] = self.default()
+        return value
+
+    def __set__(self, obj: Any, value: Any) -> None:
+        obj.raw[self.name] = value
+
+
+class SearchRsp(Response):
+    """
+    response of search requests, a view over the decoded json object
+
+    construction does not copy or convert anything, fields are read from `raw` when accessed,
+    so it costs the same whether callers use `numfound` only or all cis.
+    fields unknown to the sdk are kept in `raw`.
+
+    it is not a dataclass, `dataclasses.asdict` and `dataclasses.replace` raise TypeError on it,
+    use `to_dict()` and keyword construction instead.
+
+    Attributes:
+        numfound: total count of matched cis
+        total: count of cis in this page
+        page: page num
+        result: cis of this page as decoded json objects
+        facet: staticstics as returned by server, {attr: [[value, count, attr], ...]}
+        counter: ci count per ci type
+        raw: decoded json object of the response
+    """
+    __slots__ = ("raw", "_facets")
+
+    numfound: int = _Field(0)
+    total: int = _Field(0)
+    page: int = _Field(1)
+    result: List[dict] = _Field(list)
+    facet: Dict[str, list] = _Field(dict)
+    counter: Dict[str, int] = _Field(dict)
+
+    def __init__(
+            self,
+            numfound: int = 0,
+            total: int = 0,
+            page: int = 1,
+            result: Optional[list] = None,
+            facet: Optional[dict] = None,
+            counter: Optional[dict] = None,
+            **fields,
+        ):
+        self.raw = dict(
+            fields, numfound=numfound, total=total, page=page,
+            result=result if result is not None else [],
+            facet=facet if facet is not None else {},
+            counter=counter if counter is not None else {},
+        )
+        self._facets = None
+
+    @classmethod
+    def from_raw(cls, raw: dict) -> "SearchRsp":
+        """wrap a decoded json object without copying it"""
+        rsp = cls.__new__(cls)
+        rsp.raw = raw
+        rsp._facets = None
+        return rsp
+
+    @property
+    def cis(self) -> CIList:
+        """cis of this page with typed accessors"""
+        return CIList(self.result)
+
+    @property
+    def facets(self) -> Dict[str, Dict[Any, int]]:
+        """staticstics as {attr: {value: count}}, converted once when first accessed"""
+        if self._facets is None:
+            self._facets = {
+                attr: {entry[0]: entry[1] for entry in entries}
+                for attr, entries in self.facet.items()
+            }
+        return self._facets
+
+    def to_dict(self) -> dict:
+        return self.raw
+
+    def __eq__(self, other: object) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.raw == other.raw
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(numfound={self.numfound}, total={self.total}, page={self.page})"
+
+
+class CIRetrieveRsp(SearchRsp):
     """response of ci retrieve requet"""
-    numfound: int
-    total: int
-    page: int
-    result: list
-    facet: dict
-    counter: dict
+    __slots__ = ()
 
 
 @dataclasses.dataclass
@@ -169,15 +375,9 @@ class CIRelationRetrieveReq(Request):
         return p
 
 
-@dataclasses.dataclass
-class CIRelationRetrieveRsp(Response):
+class CIRelationRetrieveRsp(SearchRsp):
     """response of ci_relation retrieve requet"""
-    numfound: int
-    total: int
-    page: int
-    result: list
-    facet: dict
-    counter: dict
+    __slots__ = ()
     
 
 @dataclasses.dataclass
@@ -194,4 +394,25 @@ class CIRelationDeleteReq(Request):
 @dataclasses.dataclass
 class CIRelationDeleteRsp(Response):
     """response of ci_relation delete requet"""
-    message: str
\ No newline at end of file
+    message: str
+
+@dataclasses.dataclass
+class GroupCountRsp(Response):
+    """
+    response of group count
+
+    rows maps a tuple of values, one for each attribute in `by`, to ci count,
+    partial is True if the deadline passed before all queries finished, or if some values could not be
+    grouped further as they cannot be put in a search expression, then some rows are missing
+    """
+    by: list
+    rows: dict
+    total: int
+    partial: bool = False
+
+    def to_records(self) -> list:
+        """rows as list of dict, sorted by count descending"""
+        return [
+            {**dict(zip(self.by, values)), "count": count}
+            for values, count in sorted(self.rows.items(), key=lambda x: -x[1])
+        ]
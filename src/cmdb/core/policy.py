@@ -37,3 +37,28 @@ class ExistPolicy(Enum):
         defalut exist_policy
         """
         return ExistPolicy.REJECT
+
+
+class BalancePolicy(Enum):
+    ROUND_ROBIN = "round_robin"
+    LEAST_OUTSTANDING = "least_outstanding"
+    LATENCY_WEIGHTED = "latency_weighted"
+
+    @staticmethod
+    def default() -> "BalancePolicy":
+        """
+        defalut balance policy
+        """
+        return BalancePolicy.ROUND_ROBIN
+
+
+class TransportType(Enum):
+    REQUESTS = "requests"
+    URLLIB3 = "urllib3"
+
+    @staticmethod
+    def default() -> "TransportType":
+        """
+        defalut transport
+        """
+        return TransportType.REQUESTS
@@ -0,0 +1,219 @@
+import dataclasses
+import json
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+from cmdb.core.session import reset_after_fork
+from cmdb.core.transport import Transport, path_template, transports_of
+
+
+PHASES = ("to_params", "sign", "network", "decode", "rewrite", "model")
+
+
+@dataclasses.dataclass
+class PhaseStats:
+    """
+    cost of a phase summed over requests
+
+    Attributes:
+        count: times the phase ran
+        wall: wall clock seconds
+        cpu: cpu seconds of the thread running the phase, wall minus cpu is the time spent waiting
+        alloc: net bytes allocated, traced by tracemalloc, 0 if not traced
+    """
+    count: int = 0
+    wall: float = 0.0
+    cpu: float = 0.0
+    alloc: int = 0
+
+    @property
+    def wait(self) -> float:
+        return max(0.0, self.wall - self.cpu)
+
+
+class _Phase:
+    """measures one run of a phase, counted to the request current when it starts"""
+
+    __slots__ = ("profiler", "name", "endpoint", "wall", "cpu", "mem")
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self) -> "_Phase":
+        self.endpoint = getattr(self.profiler._local, "endpoint", "-")
+        self.mem = tracemalloc.get_traced_memory()[0] if self.profiler.trace_malloc else -1
+        self.cpu = time.thread_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        wall = time.perf_counter() - self.wall
+        cpu = time.thread_time() - self.cpu
+        # tracing may be stopped by another thread during the phase
+        alloc = tracemalloc.get_traced_memory()[0] - self.mem if self.mem >= 0 and tracemalloc.is_tracing() else 0
+        # a request sent during the phase, eg: attributes fetched to rewrite keys, ends here,
+        # the following phases count to the request of this phase again
+        self.profiler._local.endpoint = self.endpoint
+        self.profiler._record(self.endpoint, self.name, wall, cpu, alloc)
+
+
+class Profiler:
+    """
+    measure cpu time, wall time and allocations of every phase of the requests sent by cmdb clients
+
+    phases are building params by `to_params`, signing, network exchange, json decoding, rewriting
+    keys of cis requested with `compact_keys` and construction of response models, summed per endpoint
+    as "METHOD /path/{id}", to tell the cost of the sdk from the time spent waiting for the server.
+
+    a phase is counted to the last request sent by its thread before the phase started, requests sent
+    during a phase are counted on their own and included in it too. the network phase of a streamed response
+    ends with its headers, cis decoded while iterating the stream are not measured.
+    allocations are traced by `tracemalloc` over the whole process, so they are exact only if requests
+    are not sent concurrently, and tracing slows python down noticeably.
+
+    Attributes:
+        trace_malloc: trace allocations with tracemalloc, started on attach if not yet tracing
+        stats: PhaseStats keyed by endpoint and phase
+
+    Example:
+
+        > with client.profile() as profiler:
+        >     client.get_ci_all("_type:server")
+        > profiler.dump("profile.txt")
+
+    """
+
+    def __init__(self, trace_malloc: bool = True):
+        self.trace_malloc = trace_malloc
+        self.stats: Dict[str, Dict[str, PhaseStats]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._transports: List[Transport] = []
+        self._started_tracing = False
+        reset_after_fork(self)
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def attach(self, client) -> "Profiler":
+        """
+        start profiling requests of a client, a transport is profiled by one profiler at a time
+
+        Args:
+            client: one of Client, CIClient and CIRelationClient
+        """
+        if self.trace_malloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        for t in transports_of(client):
+            t.profiler = self
+            if t not in self._transports:
+                self._transports.append(t)
+        return self
+
+    def detach(self, client) -> None:
+        """stop profiling requests of a client"""
+        for t in transports_of(client):
+            if t.profiler is self:
+                t.profiler = None
+            if t in self._transports:
+                self._transports.remove(t)
+
+    def stop(self) -> None:
+        """stop profiling every attached client, stats are kept"""
+        for t in self._transports:
+            if t.profiler is self:
+                t.profiler = None
+        self._transports = []
+        if self._started_tracing:
+            self._started_tracing = False
+            tracemalloc.stop()
+
+    def __enter__(self) -> "Profiler":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def begin(self, method: str, path: str) -> None:
+        """count the following phases of current thread to the request of method and path"""
+        self._local.endpoint = f"{method} {path_template(path)}"
+
+    def phase(self, name: str) -> _Phase:
+        """context measuring a run of phase `name`"""
+        return _Phase(self, name)
+
+    def _record(self, endpoint: str, name: str, wall: float, cpu: float, alloc: int) -> None:
+        with self._lock:
+            phases = self.stats.get(endpoint)
+            if phases is None:
+                phases = self.stats[endpoint] = {}
+            st = phases.get(name)
+            if st is None:
+                st = phases[name] = PhaseStats()
+            st.count += 1
+            st.wall += wall
+            st.cpu += cpu
+            st.alloc += alloc
+
+    def reset(self) -> None:
+        """drop collected stats"""
+        with self._lock:
+            self.stats = {}
+
+    def to_dict(self) -> dict:
+        """stats as plain dicts keyed by endpoint and phase"""
+        with self._lock:
+            return {
+                endpoint: {name: dataclasses.asdict(st) for name, st in phases.items()}
+                for endpoint, phases in self.stats.items()
+            }
+
+    def report(self) -> str:
+        """stats as a table, one row for each phase of each endpoint, slowest endpoint first"""
+        with self._lock:
+            stats = {k: dict(v) for k, v in self.stats.items()}
+        order = {name: i for i, name in enumerate(PHASES)}
+        lines = [
+            f"{'':40} {'count':>8} {'wall ms':>10} {'cpu ms':>10} {'wait ms':>10} {'us/call':>9} {'alloc KiB':>10}",
+        ]
+        for endpoint, phases in sorted(stats.items(), key=lambda kv: -sum(st.wall for st in kv[1].values())):
+            total = PhaseStats()
+            for name in sorted(phases, key=lambda n: order.get(n, len(order))):
+                st = phases[name]
+                lines.append(self._row(f"{endpoint} {name}", st))
+                total.wall += st.wall
+                total.cpu += st.cpu
+                total.alloc += st.alloc
+            # retried requests run sign and network more than once, so the busiest phase may overcount
+            total.count = max(st.count for st in phases.values())
+            lines.append(self._row(f"{endpoint} total", total))
+        return "\n".join(lines)
+
+    @staticmethod
+    def _row(name: str, st: PhaseStats) -> str:
+        per_call = st.wall / st.count * 1e6 if st.count else 0.0
+        return (
+            f"{name:40} {st.count:>8} {st.wall * 1000:>10.2f} {st.cpu * 1000:>10.2f} "
+            f"{st.wait * 1000:>10.2f} {per_call:>9.1f} {st.alloc / 1024:>10.1f}"
+        )
+
+    def dump(self, path: Optional[str] = None) -> None:
+        """
+        write the report
+
+        Args:
+            path: file to write, as json if it ends with .json, if None, the table is written to stderr
+        """
+        if path is None:
+            print(self.report(), file=sys.stderr)
+            return
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith(".json"):
+                json.dump(self.to_dict(), f, indent=2)
+            else:
+                f.write(self.report() + "\n")
@@ -0,0 +1,246 @@
+import dataclasses
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from cmdb.core.models import Option
+from cmdb.core.session import reset_after_fork
+from cmdb.core.transport import Transport, path_template, transports_of
+
+
+_SIGN_KEYS = ("_key", "_secret")
+
+
+class Recorder:
+    """
+    record every request sent by cmdb clients into a ndjson log
+
+    each line keeps the send offset in seconds, method, path relative to api base url,
+    params without signature, latency, response size and status code.
+    requests failed before any response is received are not recorded.
+    closing the recorder detaches it from every client.
+
+    Attributes:
+        path: file path of the log
+
+    Example:
+
+        > with Recorder("traffic.ndjson").attach(client):
+        >     client.get_ci(q="_type:book")
+
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._attached: List[Transport] = []
+        reset_after_fork(self)
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def attach(self, client) -> "Recorder":
+        """
+        start recording requests of a client
+
+        Args:
+            client: one of Client, CIClient and CIRelationClient
+        """
+        for t in transports_of(client):
+            if self._observe not in t.observers:
+                t.observers.append(self._observe)
+            if t not in self._attached:
+                self._attached.append(t)
+        return self
+
+    def detach(self, client) -> None:
+        """stop recording requests of a client"""
+        for t in transports_of(client):
+            self._detach(t)
+
+    def _detach(self, transport: Transport) -> None:
+        if self._observe in transport.observers:
+            transport.observers.remove(self._observe)
+        if transport in self._attached:
+            self._attached.remove(transport)
+
+    def _observe(self, method: str, path: str, params: dict, status: int, size: int, elapsed: float) -> None:
+        entry = {
+            "ts": round(time.monotonic() - self._start - elapsed, 6),
+            "method": method,
+            "path": path,
+            "params": {k: v for k, v in params.items() if k not in _SIGN_KEYS},
+            "elapsed": round(elapsed, 6),
+            "size": size,
+            "status": status,
+        }
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + "\n")
+
+    def close(self) -> None:
+        """detach from all clients and close the log"""
+        for t in list(self._attached):
+            self._detach(t)
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self) -> "Recorder":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+@dataclasses.dataclass
+class LatencyStats:
+    """latency distribution in seconds"""
+    count: int
+    errors: int
+    p50: float
+    p90: float
+    p99: float
+    max: float
+
+    @classmethod
+    def from_samples(cls, latencies: List[float], errors: int) -> "LatencyStats":
+        if not latencies:
+            return cls(0, errors, 0.0, 0.0, 0.0, 0.0)
+        s = sorted(latencies)
+
+        def pick(p: float) -> float:
+            return s[min(len(s) - 1, int(p * len(s)))]
+
+        return cls(len(s), errors, pick(0.5), pick(0.9), pick(0.99), s[-1])
+
+
+@dataclasses.dataclass
+class ReplayReport:
+    """
+    result of a replay, compared with the recorded traffic
+
+    Attributes:
+        duration: wall time of the replay in seconds
+        replayed: latency of replayed requests
+        recorded: latency of recorded requests
+        by_path: (replayed, recorded) latency keyed by "METHOD /path/{id}"
+    """
+    duration: float
+    replayed: LatencyStats
+    recorded: LatencyStats
+    by_path: Dict[str, Tuple[LatencyStats, LatencyStats]]
+
+    @property
+    def error_delta(self) -> int:
+        """replayed errors minus recorded errors"""
+        return self.replayed.errors - self.recorded.errors
+
+    def summary(self) -> str:
+        lines = [
+            f"requests: {self.replayed.count}, duration: {self.duration:.3f}s, error delta: {self.error_delta:+d}",
+            f"{'':40} {'count':>7} {'errors':>7} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}",
+        ]
+        rows = [("total", self.replayed, self.recorded)]
+        rows += [(k, v[0], v[1]) for k, v in sorted(self.by_path.items())]
+        for name, replayed, recorded in rows:
+            for tag, st in (("replay", replayed), ("record", recorded)):
+                lines.append(
+                    f"{name + ' ' + tag:40} {st.count:>7} {st.errors:>7} "
+                    f"{st.p50 * 1000:>7.1f}ms {st.p90 * 1000:>7.1f}ms {st.p99 * 1000:>7.1f}ms {st.max * 1000:>7.1f}ms"
+                )
+        return "\n".join(lines)
+
+
+class Replayer:
+    """
+    re-issue recorded requests against another cmdb, signed with its own key and secret
+
+    Attributes:
+        opt: option of target cmdb
+        path: file path of the log written by `Recorder`
+        speed: replay speed, 1 for original pace, 2 for twice as fast, 0 for as fast as possible
+        concurrency: max in-flight requests
+        transport: sends the requests, if None, created by `opt.transport_type`
+
+    Example:
+
+        > report = Replayer(Option(url=staging_url, key=key, secret=secret), "traffic.ndjson", speed=2).run()
+
+        > print(report.summary())
+
+    """
+
+    def __init__(
+            self,
+            opt: Option,
+            path: str,
+            speed: float = 1.0,
+            concurrency: int = 8,
+            transport: Optional[Transport] = None,
+        ):
+        self.opt = opt
+        self.path = path
+        self.speed = speed
+        self.concurrency = concurrency
+        self.transport = transport if transport else Transport.from_option(opt)
+
+    def _send(self, entry: dict) -> Tuple[float, bool]:
+        start = time.monotonic()
+        try:
+            resp = self.transport.send(entry["method"], entry["path"], entry["params"])
+            ok = resp.status_code < 400
+        except requests.RequestException:
+            ok = False
+        return time.monotonic() - start, ok
+
+    def run(self, limit: Optional[int] = None) -> ReplayReport:
+        """
+        replay the log
+
+        Args:
+            limit: replay at most `limit` requests
+        """
+        with open(self.path, encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        entries.sort(key=lambda e: e["ts"])
+        if limit is not None:
+            entries = entries[:limit]
+        origin = entries[0]["ts"] if entries else 0.0
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = []
+            for entry in entries:
+                if self.speed > 0:
+                    delay = (entry["ts"] - origin) / self.speed - (time.monotonic() - start)
+                    if delay > 0:
+                        time.sleep(delay)
+                futures.append(pool.submit(self._send, entry))
+            results = [f.result() for f in futures]
+        duration = time.monotonic() - start
+
+        groups = {}
+        for entry, (elapsed, ok) in zip(entries, results):
+            key = f"{entry['method']} {path_template(entry['path'])}"
+            g = groups.setdefault(key, [[], 0, [], 0])
+            g[0].append(elapsed)
+            g[1] += not ok
+            g[2].append(entry["elapsed"])
+            g[3] += entry["status"] >= 400
+        by_path = {
+            k: (LatencyStats.from_samples(g[0], g[1]), LatencyStats.from_samples(g[2], g[3]))
+            for k, g in groups.items()
+        }
+        return ReplayReport(
+            duration,
+            LatencyStats.from_samples([r[0] for r in results], sum(not r[1] for r in results)),
+            LatencyStats.from_samples([e["elapsed"] for e in entries], sum(e["status"] >= 400 for e in entries)),
+            by_path,
+        )
@@ -0,0 +1,142 @@
+import mmap
+import pickle
+import sys
+import tempfile
+from array import array
+from typing import Any, Iterator, List, Optional, Sequence, Union
+
+
+def _sizeof(obj: Any) -> int:
+    """memory of a decoded json value with its keys and values, shared objects are counted for each reference"""
+    getsizeof = sys.getsizeof
+    if type(obj) is dict:
+        values = obj.values()
+        size = getsizeof(obj) + sum(map(getsizeof, obj)) + sum(map(getsizeof, values))
+    elif type(obj) is list:
+        values = obj
+        size = getsizeof(obj) + sum(map(getsizeof, obj))
+    else:
+        return getsizeof(obj)
+    for v in values:
+        if type(v) is dict or type(v) is list:
+            size += _sizeof(v) - getsizeof(v)
+    return size
+
+
+class CIResultSet(Sequence):
+    """
+    cis of a multi-page search, kept in memory up to a budget and spilled to disk beyond
+
+    the first cis are kept as objects while their size in memory fits `memory_budget`,
+    the rest are pickled into a temporary file read back through mmap, so a scan larger
+    than memory never runs out of it, while iteration, `len()` and indexing keep working.
+
+    measuring a ci costs more than decoding it, so only a sample is measured, the first
+    `sample_every` cis and one of every `sample_every` after, the others are counted as the
+    mean size of the sample. cis of one search are alike, so the budget holds within a few percent.
+
+    Attributes:
+        memory_budget: max bytes of cis kept in memory, estimated by `sys.getsizeof` of cis, keys and values
+        numfound: total count of matched cis reported by server
+        partial: True if fetching stopped by deadline before all pages were read
+
+    Example:
+
+        > with client.get_ci_all(q="_type:server", memory_budget=256 << 20) as cis:
+        >     print(len(cis), cis[-1])
+
+    """
+
+    # one of this many cis is measured
+    sample_every = 16
+
+    def __init__(self, memory_budget: int = 64 << 20):
+        self.memory_budget = memory_budget
+        self.numfound: Optional[int] = None
+        self.partial = False
+        self._memory: List[dict] = []
+        self._memory_size = 0
+        self._sampled_size = 0
+        self._samples = 0
+        self._file = None
+        self._offsets = array("q", [0])
+        self._mmap: Optional[mmap.mmap] = None
+
+    @property
+    def spilled(self) -> int:
+        """count of cis on disk"""
+        return len(self._offsets) - 1
+
+    def _size(self, ci: dict) -> int:
+        n = len(self._memory)
+        if n < self.sample_every or n % self.sample_every == 0:
+            size = _sizeof(ci)
+            self._sampled_size += size
+            self._samples += 1
+            return size
+        return self._sampled_size // self._samples
+
+    def append(self, ci: dict) -> None:
+        if self._file is None:
+            size = self._size(ci)
+            if self._memory_size + size <= self.memory_budget:
+                self._memory.append(ci)
+                self._memory_size += size
+                return
+            self._file = tempfile.TemporaryFile(prefix="cmdb-")
+        data = pickle.dumps(ci, pickle.HIGHEST_PROTOCOL)
+        self._file.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+
+    def extend(self, cis) -> None:
+        for ci in cis:
+            self.append(ci)
+
+    def _view(self, end: int) -> mmap.mmap:
+        if self._mmap is None or len(self._mmap) < end:
+            if self._mmap is not None:
+                self._mmap.close()
+            self._file.flush()
+            self._mmap = mmap.mmap(self._file.fileno(), self._offsets[-1], access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def _load(self, i: int) -> dict:
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return pickle.loads(self._view(end)[start:end])
+
+    def __len__(self) -> int:
+        return len(self._memory) + self.spilled
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[dict, List[dict]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("result set index out of range")
+        if index < len(self._memory):
+            return self._memory[index]
+        return self._load(index - len(self._memory))
+
+    def __iter__(self) -> Iterator[dict]:
+        yield from self._memory
+        for i in range(self.spilled):
+            yield self._load(i)
+
+    def close(self) -> None:
+        """remove the temporary file"""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._memory = []
+        self._offsets = array("q", [0])
+
+    def __enter__(self) -> "CIResultSet":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,86 @@
+import os
+import threading
+import weakref
+
+import requests
+
+
+_pools = weakref.WeakSet()
+# other objects holding locks or per process state, see `reset_after_fork`
+_fork_aware = weakref.WeakSet()
+
+
+def _reset_after_fork() -> None:
+    for pool in list(_pools):
+        pool._reset()
+    for obj in list(_fork_aware):
+        obj._after_fork()
+
+
+def reset_after_fork(obj) -> None:
+    """
+    call `obj._after_fork()` in the child process after fork
+
+    a lock held by another thread of the parent while forking is never released in the child,
+    so objects shared by threads re-create their locks there.
+    """
+    _fork_aware.add(obj)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class SessionPool:
+    """
+    requests sessions, one for each thread
+
+    `requests.Session` is not guaranteed thread safe, so every thread gets its own session
+    and connection pool. sockets inherited by a child process are shared with the parent,
+    so all sessions are dropped in the child after fork, and new ones are created on demand.
+
+    Attributes:
+        pool_maxsize: max connections kept for one host by the session of each thread
+        hooks: requests hooks applied to every session, eg: {"response": [fn]}
+    """
+
+    def __init__(self, pool_maxsize: int = 10):
+        self.pool_maxsize = pool_maxsize
+        self.hooks = {"response": []}
+        self._reset()
+        _pools.add(self)
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # sessions of exited threads are released with their thread local storage
+        self._sessions = weakref.WeakSet()
+
+    def _new_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.pool_maxsize)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.hooks = self.hooks
+        return session
+
+    def get(self) -> requests.Session:
+        """session of current thread"""
+        if self._pid != os.getpid():
+            # fork without os.register_at_fork, eg: from c extension
+            self._reset()
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self._new_session()
+            with self._lock:
+                self._sessions.add(session)
+        return session
+
+    def close(self) -> None:
+        """close sessions of all threads"""
+        with self._lock:
+            sessions, self._sessions = list(self._sessions), weakref.WeakSet()
+        self._local = threading.local()
+        for session in sessions:
+            session.close()
@@ -0,0 +1,192 @@
+import codecs
+import json
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+
+from cmdb.core.deadline import Deadline
+from cmdb.core.exc import CMDBError
+from cmdb.core.transport import iter_body
+
+
+_WHITESPACE = " \t\n\r"
+# chars that may follow a complete value
+_DELIMITERS = _WHITESPACE + ",:]}"
+
+
+class JSONObjectStream:
+    """
+    incremental parser for a top level json object
+
+    the members of `array_key` array are produced one by one as soon as they are complete,
+    all other fields are produced as a whole, so only the array needs to be large.
+
+    Attributes:
+        chunks: bytes chunks of the json document
+        array_key: key of the array to stream
+    """
+
+    # consumed text kept in buffer before it is dropped
+    compact_size = 64 * 1024
+
+    def __init__(self, chunks: Iterable[bytes], array_key: str):
+        self.chunks = iter(chunks)
+        self.array_key = array_key
+        self.decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        if self.pos > self.compact_size:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        for chunk in self.chunks:
+            if chunk:
+                self.buf += self._text.decode(chunk)
+                return True
+        self.buf += self._text.decode(b"", final=True)
+        self.eof = True
+        return False
+
+    def _peek(self) -> str:
+        """next non-whitespace char, empty at end of document"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars: str) -> str:
+        c = self._peek()
+        if not c or c not in chars:
+            raise json.JSONDecodeError(f"expecting one of {chars!r}", self.buf, self.pos)
+        self.pos += 1
+        return c
+
+    def _value(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number cut by the end of a chunk may continue in the next one, eg: `1` of `15` or of `1.5`,
+            # so a value is complete only if a delimiter follows it
+            if (end == len(self.buf) or self.buf[end] not in _DELIMITERS) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def __iter__(self) -> Iterator[Tuple[str, Any]]:
+        """
+        yield ("field", (key, value)) for ordinary fields and ("item", value) for array members
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key == self.array_key and self._peek() == "[":
+                self.pos += 1
+                if self._peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield "item", self._value()
+                        if self._expect(",]") == "]":
+                            break
+            else:
+                yield "field", (key, self._value())
+            if self._expect(",}") == "}":
+                return
+
+
+class CIRetrieveStream:
+    """
+    streaming response of ci retrieve request
+
+    cis in `result` are yielded by iteration while the response body is being received.
+    fields placed before `result` in the body are available once the stream is created,
+    the others are filled when iteration completes.
+
+    Example:
+
+        > with client.get_ci_stream(q="_type:book", count=10000) as rsp:
+        >     print(rsp.numfound)
+        >     for ci in rsp:
+        >         print(ci["_id"])
+
+    Attributes:
+        resp: http response opened with `stream=True`, `requests.Response` or transport `RawResponse`
+        chunk_size: max size of bytes read from socket at once
+        transform: applied to every ci before it is yielded
+        deadline: time the whole body must be read by, reading past it raises CMDBTimeoutError
+    """
+
+    def __init__(
+            self,
+            resp: Any,
+            chunk_size: int = 64 * 1024,
+            transform: Optional[Callable[[dict], dict]] = None,
+            deadline: Optional[Deadline] = None,
+        ):
+        self.resp = resp
+        self.transform = transform
+        self.deadline = deadline
+        self.numfound: Optional[int] = None
+        self.total: Optional[int] = None
+        self.page: Optional[int] = None
+        self.facet: Optional[dict] = None
+        self.counter: Optional[dict] = None
+        self._events = iter(JSONObjectStream(iter_body(self.resp, chunk_size, self.deadline), "result"))
+        self._pending = []
+        try:
+            self._read_header()
+        except BaseException:
+            self.close()
+            raise
+
+    def _set_field(self, key: str, value: Any) -> None:
+        if key == "message" and value:
+            raise CMDBError(value)
+        if key in ("numfound", "total", "page", "facet", "counter"):
+            setattr(self, key, value)
+
+    def _read_header(self) -> None:
+        for kind, value in self._events:
+            if kind == "item":
+                self._pending.append(value)
+                return
+            self._set_field(*value)
+        self.close()
+
+    def __iter__(self) -> Iterator[dict]:
+        try:
+            while self._pending:
+                ci = self._pending.pop()
+                yield self.transform(ci) if self.transform else ci
+            for kind, value in self._events:
+                if kind == "item":
+                    yield self.transform(value) if self.transform else value
+                else:
+                    self._set_field(*value)
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """release the underlying connection"""
+        self.resp.close()
+
+    def __enter__(self) -> "CIRetrieveStream":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
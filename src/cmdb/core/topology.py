@@ -0,0 +1,379 @@
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from cmdb.core.ci import CIClient
+from cmdb.core.ci_relations import CIRelationClient
+from cmdb.core.models import *
+
+
+_MAGIC = b"CMDBTOPO"
+_VERSION = 1
+_HEADER = struct.Struct("<8sIQQ")
+
+
+def _csr(n: int, edges: List[Tuple[int, int]]) -> Tuple[array, array]:
+    """compressed sparse rows of edges given as (src index, dst index), sorted by src"""
+    indptr = array("q", bytes(8 * (n + 1)))
+    for s, _ in edges:
+        indptr[s + 1] += 1
+    for i in range(n):
+        indptr[i + 1] += indptr[i]
+    indices = array("i", bytes(4 * len(edges)))
+    fill = array("q", indptr[:n])
+    for s, d in edges:
+        indices[fill[s]] = d
+        fill[s] += 1
+    return indptr, indices
+
+
+class Topology:
+    """
+    offline snapshot of ci relations for local graph queries
+
+    the graph is kept as integer arrays: sorted ci ids, and forward and reverse edges
+    in compressed sparse row form, so memory stays small and queries touch no network.
+    relation add and delete events are applied on a small overlay, merged by `compact`.
+
+    Attributes:
+        ids: sorted ci ids, the position of a ci id is its node index
+        types: ci type id of each node, -1 if unknown
+
+    Example:
+
+        > topo = Topology.download(ci_client, cr_client, ["application", "server"])
+
+        > topo.save("topo.bin")
+
+        > Topology.load("topo.bin").ancestors(server_id)
+
+    """
+
+    def __init__(
+            self,
+            ids: array,
+            types: array,
+            out_ptr: array,
+            out_idx: array,
+            in_ptr: array,
+            in_idx: array,
+        ):
+        self.ids = ids
+        self.types = types
+        self._out_ptr = out_ptr
+        self._out_idx = out_idx
+        self._in_ptr = in_ptr
+        self._in_idx = in_idx
+        self._reset_overlay()
+
+    def _reset_overlay(self) -> None:
+        self._extra_ids: List[int] = []
+        self._extra_index: Dict[int, int] = {}
+        self._added_out: Dict[int, Set[int]] = {}
+        self._added_in: Dict[int, Set[int]] = {}
+        self._removed: Set[Tuple[int, int]] = set()
+
+    @classmethod
+    def from_edges(
+            cls,
+            edges: Iterable[Tuple[int, int]],
+            nodes: Optional[Dict[int, int]] = None,
+        ) -> "Topology":
+        """
+        build snapshot from relations
+
+        Args:
+            edges: (src ci id, dst ci id) pairs
+            nodes: ci type id keyed by ci id, cis without relation are kept as isolated nodes
+        """
+        edges = set(edges)
+        nodes = nodes or {}
+        id_set = set(nodes)
+        for s, d in edges:
+            id_set.add(s)
+            id_set.add(d)
+        ids = array("q", sorted(id_set))
+        index = {ci_id: i for i, ci_id in enumerate(ids)}
+        types = array("i", (nodes.get(ci_id, -1) for ci_id in ids))
+        pairs = sorted((index[s], index[d]) for s, d in edges)
+        out_ptr, out_idx = _csr(len(ids), pairs)
+        in_ptr, in_idx = _csr(len(ids), sorted((d, s) for s, d in pairs))
+        return cls(ids, types, out_ptr, out_idx, in_ptr, in_idx)
+
+    @classmethod
+    def download(
+            cls,
+            ci_client: CIClient,
+            cr_client: CIRelationClient,
+            ci_types: List[str],
+            within_types: bool = True,
+            page_size: int = 500,
+            max_workers: int = 8,
+        ) -> "Topology":
+        """
+        download relations of all cis of the ci types
+
+        Args:
+            ci_client: ci client to list cis
+            cr_client: ci_relation client to list children of every ci
+            ci_types: ci model types to snapshot
+            within_types: keep only relations whose destination is also of `ci_types`
+            page_size: ci count per page
+            max_workers: max concurrent queries
+        """
+        q = f"_type:({';'.join(ci_types)})"
+        nodes = {}
+        page = 1
+        while True:
+            rsp = ci_client._get_ci(CIRetrieveReq(q, count=page_size, page=page))
+            for ci in rsp.result:
+                nodes[ci["_id"]] = ci.get("_type", -1)
+            if len(rsp.result) < page_size:
+                break
+            page += 1
+
+        def children(root_id: int) -> List[Tuple[int, int]]:
+            found = []
+            page = 1
+            while True:
+                req = CIRelationRetrieveReq(root_id, "1", q=q if within_types else None, count=page_size, page=page)
+                rsp = cr_client._get_ci_relation(req)
+                found.extend((ci["_id"], ci.get("_type", -1)) for ci in rsp.result)
+                if len(rsp.result) < page_size:
+                    return found
+                page += 1
+
+        edges = []
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for root_id, found in zip(nodes, pool.map(children, list(nodes))):
+                for ci_id, type_id in found:
+                    edges.append((root_id, ci_id))
+                    nodes.setdefault(ci_id, type_id)
+        return cls.from_edges(edges, nodes)
+
+    def __len__(self) -> int:
+        return len(self.ids) + len(self._extra_ids)
+
+    def _index(self, ci_id: int) -> Optional[int]:
+        i = bisect_left(self.ids, ci_id)
+        if i < len(self.ids) and self.ids[i] == ci_id:
+            return i
+        return self._extra_index.get(ci_id)
+
+    def _ci_id(self, i: int) -> int:
+        n = len(self.ids)
+        return self.ids[i] if i < n else self._extra_ids[i - n]
+
+    def _neighbors(self, i: int, reverse: bool) -> Iterable[int]:
+        ptr, idx, added = (self._in_ptr, self._in_idx, self._added_in) if reverse else (self._out_ptr, self._out_idx, self._added_out)
+        if i < len(self.ids):
+            for j in idx[ptr[i]:ptr[i + 1]]:
+                if not self._removed or ((j, i) if reverse else (i, j)) not in self._removed:
+                    yield j
+        yield from added.get(i, ())
+
+    def _walk(self, ci_id: int, reverse: bool, max_depth: Optional[int]) -> List[int]:
+        start = self._index(ci_id)
+        if start is None:
+            return []
+        seen = bytearray(len(self))
+        seen[start] = 1
+        found = []
+        frontier = [start]
+        depth = 0
+        while frontier and (max_depth is None or depth < max_depth):
+            depth += 1
+            next_frontier = []
+            for i in frontier:
+                for j in self._neighbors(i, reverse):
+                    if not seen[j]:
+                        seen[j] = 1
+                        next_frontier.append(j)
+                        found.append(self._ci_id(j))
+            frontier = next_frontier
+        return found
+
+    def descendants(self, ci_id: int, max_depth: Optional[int] = None) -> List[int]:
+        """
+        ci ids reachable from the ci, nearest first
+
+        Args:
+            ci_id: ci id of root
+            max_depth: max levels to walk, None for all
+        """
+        return self._walk(ci_id, False, max_depth)
+
+    def ancestors(self, ci_id: int, max_depth: Optional[int] = None) -> List[int]:
+        """
+        ci ids the ci is reachable from, nearest first
+
+        Args:
+            ci_id: ci id of leaf
+            max_depth: max levels to walk, None for all
+        """
+        return self._walk(ci_id, True, max_depth)
+
+    def shortest_path(self, src_ci_id: int, dst_ci_id: int, directed: bool = True) -> Optional[List[int]]:
+        """
+        ci ids on a shortest path from src to dst, both included, None if unreachable
+
+        Args:
+            src_ci_id: ci id of path start
+            dst_ci_id: ci id of path end
+            directed: follow relations only from source to destination
+        """
+        start, end = self._index(src_ci_id), self._index(dst_ci_id)
+        if start is None or end is None:
+            return None
+        parent = array("q", [-1]) * len(self)
+        parent[start] = start
+        queue = deque([start])
+        while queue:
+            i = queue.popleft()
+            if i == end:
+                path = [end]
+                while path[-1] != start:
+                    path.append(parent[path[-1]])
+                return [self._ci_id(j) for j in reversed(path)]
+            for reverse in ((False,) if directed else (False, True)):
+                for j in self._neighbors(i, reverse):
+                    if parent[j] < 0:
+                        parent[j] = i
+                        queue.append(j)
+        return None
+
+    def _roots(self) -> array:
+        """union find roots of weakly connected components"""
+        parent = array("q", range(len(self)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for i in range(len(self)):
+            for j in self._neighbors(i, False):
+                a, b = find(i), find(j)
+                if a != b:
+                    parent[max(a, b)] = min(a, b)
+        return array("q", (find(i) for i in range(len(self))))
+
+    def connected_component(self, ci_id: int) -> List[int]:
+        """
+        ci ids connected with the ci in either direction, the ci included
+        """
+        start = self._index(ci_id)
+        if start is None:
+            return []
+        seen = bytearray(len(self))
+        seen[start] = 1
+        stack = [start]
+        found = []
+        while stack:
+            i = stack.pop()
+            found.append(self._ci_id(i))
+            for reverse in (False, True):
+                for j in self._neighbors(i, reverse):
+                    if not seen[j]:
+                        seen[j] = 1
+                        stack.append(j)
+        return sorted(found)
+
+    def connected_components(self) -> List[List[int]]:
+        """
+        all weakly connected components, each as sorted ci ids, largest first
+        """
+        groups: Dict[int, List[int]] = {}
+        for i, root in enumerate(self._roots()):
+            groups.setdefault(root, []).append(self._ci_id(i))
+        return sorted(groups.values(), key=len, reverse=True)
+
+    def _ensure(self, ci_id: int) -> int:
+        i = self._index(ci_id)
+        if i is None:
+            i = len(self)
+            self._extra_ids.append(ci_id)
+            self._extra_index[ci_id] = i
+        return i
+
+    def _has_edge(self, s: int, d: int) -> bool:
+        return any(j == d for j in self._neighbors(s, False))
+
+    def add_relation(self, src_ci_id: int, dst_ci_id: int) -> None:
+        """apply a relation add event"""
+        s, d = self._ensure(src_ci_id), self._ensure(dst_ci_id)
+        if (s, d) in self._removed:
+            self._removed.discard((s, d))
+        elif not self._has_edge(s, d):
+            self._added_out.setdefault(s, set()).add(d)
+            self._added_in.setdefault(d, set()).add(s)
+
+    def delete_relation(self, src_ci_id: int, dst_ci_id: int) -> None:
+        """apply a relation delete event"""
+        s, d = self._index(src_ci_id), self._index(dst_ci_id)
+        if s is None or d is None:
+            return
+        if d in self._added_out.get(s, ()):
+            self._added_out[s].discard(d)
+            self._added_in[d].discard(s)
+        elif self._has_edge(s, d):
+            self._removed.add((s, d))
+
+    def apply(self, events: Iterable[dict]) -> None:
+        """
+        apply relation events, eg: {"op": "add", "src_ci_id": 1, "dst_ci_id": 2}, op is add or delete
+        """
+        for event in events:
+            if event["op"] == "add":
+                self.add_relation(event["src_ci_id"], event["dst_ci_id"])
+            elif event["op"] == "delete":
+                self.delete_relation(event["src_ci_id"], event["dst_ci_id"])
+            else:
+                raise ValueError(f"unknown relation event op: {event['op']}")
+
+    def edges(self) -> Iterable[Tuple[int, int]]:
+        """all relations as (src ci id, dst ci id)"""
+        for i in range(len(self)):
+            for j in self._neighbors(i, False):
+                yield self._ci_id(i), self._ci_id(j)
+
+    def compact(self) -> None:
+        """merge applied events into the arrays"""
+        if not (self._extra_ids or self._added_out or self._removed):
+            return
+        nodes = {self._ci_id(i): (self.types[i] if i < len(self.types) else -1) for i in range(len(self))}
+        other = Topology.from_edges(self.edges(), nodes)
+        self.__dict__.update(other.__dict__)
+
+    def save(self, path: str) -> None:
+        """save snapshot to file in compact binary form"""
+        self.compact()
+        arrays = (self.ids, self.types, self._out_ptr, self._out_idx, self._in_ptr, self._in_idx)
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, len(self.ids), len(self._out_idx)))
+            for a in arrays:
+                if sys.byteorder == "big":
+                    a = array(a.typecode, a)
+                    a.byteswap()
+                a.tofile(f)
+
+    @classmethod
+    def load(cls, path: str) -> "Topology":
+        """load snapshot saved by `save`"""
+        with open(path, "rb") as f:
+            magic, version, n, m = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError(f"{path} is not a topology snapshot")
+            arrays = []
+            for typecode, size in (("q", n), ("i", n), ("q", n + 1), ("i", m), ("q", n + 1), ("i", m)):
+                a = array(typecode)
+                a.fromfile(f, size)
+                if sys.byteorder == "big":
+                    a.byteswap()
+                arrays.append(a)
+        return cls(*arrays)
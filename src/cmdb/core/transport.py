@@ -0,0 +1,470 @@
+import abc
+import contextlib
+import json
+import os
+import re
+import time
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Mapping, Optional, Tuple, TypeVar, Union
+from urllib.parse import urlencode, urlparse
+
+import requests
+import urllib3
+
+from cmdb.core.auth import SigningContext
+from cmdb.core.balancer import Balancer, is_unsent
+from cmdb.core.deadline import Deadline
+from cmdb.core.exc import CMDBError
+from cmdb.core.models import Option, Request
+from cmdb.core.policy import TransportType
+from cmdb.core.session import SessionPool
+
+
+class RawResponse:
+    """
+    http response of transports not based on requests, with the subset of `requests.Response` used by clients
+
+    Attributes:
+        status_code: http status code
+        headers: response headers
+        body: whole response body, None if it is streamed by `raw`
+        raw: object read by `iter_content` if the body is streamed, must have `stream(chunk_size)`
+        release: called once when the response is closed
+    """
+
+    def __init__(
+            self,
+            status_code: int,
+            headers: Mapping[str, str],
+            body: Optional[bytes] = None,
+            raw: Any = None,
+            release: Optional[Callable[[], None]] = None,
+        ):
+        self.status_code = status_code
+        self.headers = headers
+        self._body = body
+        self.raw = raw
+        self._release = release
+
+    @property
+    def content(self) -> bytes:
+        if self._body is None:
+            self._body = b"".join(self.iter_content(64 * 1024))
+        return self._body
+
+    def json(self) -> Any:
+        try:
+            return json.loads(self.content)
+        except json.JSONDecodeError as e:
+            # raised as by requests, so decoding errors are the same whatever the transport
+            raise requests.exceptions.JSONDecodeError(e.msg, e.doc, e.pos) from e
+
+    def iter_content(self, chunk_size: int = 1) -> Iterator[bytes]:
+        if self._body is not None:
+            for i in range(0, len(self._body), chunk_size):
+                yield self._body[i:i + chunk_size]
+            return
+        yield from self.raw.stream(chunk_size)
+
+    def close(self) -> None:
+        release, self._release = self._release, None
+        if release:
+            release()
+
+
+Response = Union[requests.Response, RawResponse]
+T = TypeVar("T")
+
+_NOT_PROFILED = contextlib.nullcontext()
+
+
+class Transport(abc.ABC):
+    """
+    prepare, sign, send requests to cmdb api and decode responses, shared by ci and ci relation clients
+
+    requests are balanced across the api replicas of `opt`, a request failed by connection error is
+    retried on another replica if it is idempotent or was never sent. subclasses only perform
+    a single http exchange, and raise `requests.RequestException` on failure.
+
+    Attributes:
+        opt: api urls, key, secret and timeouts
+        balancer: load balancer over api replicas in opt, may be shared by transports
+        observers: called after every response as fn(method, path, params, status, size, elapsed),
+            path is relative to api base url, params are not signed, size is -1 if the body is streamed
+            without Content-Length
+        signer: signs params with key and secret of opt
+        profiler: measures every phase of requests if set, see `Profiler`
+    """
+
+    def __init__(self, opt: Optional[Option] = None, balancer: Optional[Balancer] = None):
+        self.opt = opt if opt else Option()
+        self.balancer = balancer if balancer else Balancer.from_option(self.opt)
+        self.observers: List[Callable] = []
+        self.signer = SigningContext(self.opt.key, self.opt.secret)
+        self.profiler = None
+        self._base_paths: Dict[str, str] = {}
+
+    @staticmethod
+    def from_option(opt: Option, balancer: Optional[Balancer] = None) -> "Transport":
+        """transport of `opt.transport_type`"""
+        if opt.transport_type == TransportType.URLLIB3:
+            return Urllib3Transport(opt, balancer)
+        return RequestsTransport(opt, balancer)
+
+    def sign(self, base_url: str, path: str, payload: dict) -> dict:
+        """payload with api key and signature, payload itself is not modified"""
+        base_path = self._base_paths.get(base_url)
+        if base_path is None:
+            base_path = self._base_paths[base_url] = urlparse(base_url).path
+        return self.signer.sign(f"{base_path}{path}", payload)
+
+    def phase(self, name: str) -> ContextManager:
+        """context measuring phase `name` of current request, if profiled"""
+        if self.profiler is None:
+            return _NOT_PROFILED
+        return self.profiler.phase(name)
+
+    @abc.abstractmethod
+    def _perform(
+            self,
+            method: str,
+            url: str,
+            data: dict,
+            timeout: Tuple[Optional[float], Optional[float]],
+            stream: bool,
+        ) -> Response:
+        """send one signed request to `url`"""
+        raise NotImplementedError("")
+
+    def send(
+            self,
+            method: str,
+            path: str,
+            payload: Union[Request, dict],
+            deadline: Optional[Deadline] = None,
+            stream: bool = False,
+        ) -> Response:
+        """
+        send a request and return the http response
+
+        Args:
+            method: http method
+            path: path relative to api base url, eg: /ci/s
+            payload: query params of GET, json body of other methods, built by `to_params` if a request
+            deadline: time the call must finish before, including retries and reading the body
+            stream: do not read the body before return, close the response when done
+        """
+        if self.profiler is not None:
+            self.profiler.begin(method, path)
+        if isinstance(payload, Request):
+            with self.phase("to_params"):
+                payload = payload.to_params()
+        tried = []
+        while True:
+            if deadline:
+                deadline.check()
+                timeout = deadline.timeout(self.opt.connect_timeout, self.opt.read_timeout)
+            else:
+                timeout = (self.opt.connect_timeout, self.opt.read_timeout)
+            ep = self.balancer.acquire(tried)
+            url = f"{ep.url}{path}"
+            with self.phase("sign"):
+                data = self.sign(ep.url, path, payload)
+            start = time.monotonic()
+            try:
+                with self.phase("network"):
+                    if deadline and not stream:
+                        # socket timeouts bound every single read only, the body is read in pieces
+                        # to stop a slow one at the deadline
+                        resp = self._preload(self._perform(method, url, data, timeout, True), deadline)
+                    else:
+                        resp = self._perform(method, url, data, timeout, stream)
+            except requests.RequestException as e:
+                self.balancer.release(ep, time.monotonic() - start, False)
+                if deadline and deadline.expired:
+                    raise deadline.exceeded() from e
+                tried.append(ep)
+                # only idempotent or unsent requests are retried on another replica
+                retry = isinstance(e, requests.ConnectionError) and (method == "GET" or is_unsent(e))
+                if not retry or len(tried) >= len(self.balancer.endpoints):
+                    raise
+                continue
+            except Exception:
+                self.balancer.release(ep, time.monotonic() - start, False)
+                raise
+            elapsed = time.monotonic() - start
+            self.balancer.release(ep, elapsed, resp.status_code < 500)
+            if self.observers:
+                self._notify(method, path, payload, resp, elapsed, stream)
+            return resp
+
+    @staticmethod
+    def _preload(resp: Response, deadline: Deadline) -> Response:
+        try:
+            body = b"".join(iter_body(resp, 64 * 1024, deadline))
+        except BaseException:
+            resp.close()
+            raise
+        if isinstance(resp, RawResponse):
+            resp._body = body
+        else:
+            resp._content = body
+            resp._content_consumed = True
+        # the body is read to the end, so the connection goes back to the pool
+        resp.close()
+        return resp
+
+    def _notify(self, method: str, path: str, payload: dict, resp: Response, elapsed: float, stream: bool) -> None:
+        if stream:
+            size = int(resp.headers.get("Content-Length", -1))
+        else:
+            size = len(resp.content)
+        for fn in self.observers:
+            fn(method, path, payload, resp.status_code, size, elapsed)
+
+    def decode(self, resp: Response) -> dict:
+        """json body of response"""
+        return resp.json()
+
+    def request(self, method: str, path: str, payload: Union[Request, dict], deadline: Optional[Deadline] = None) -> dict:
+        """send a request and return the decoded json body"""
+        resp = self.send(method, path, payload, deadline)
+        with self.phase("decode"):
+            return self.decode(resp)
+
+    def build(self, model: Callable[..., T], *args, **kwargs) -> T:
+        """construct the response model of current request by `model(*args, **kwargs)`"""
+        with self.phase("model"):
+            return model(*args, **kwargs)
+
+    @staticmethod
+    def check(resp: dict) -> None:
+        """raise CMDBError if the decoded body reports an error"""
+        msg = resp.get("message")
+        if msg:
+            raise CMDBError(msg)
+
+    def close(self) -> None:
+        """release pooled connections"""
+
+
+_ID_PATTERN = re.compile(r"/\d+(?=/|$)")
+
+
+def path_template(path: str) -> str:
+    """replace ids in path to group requests by endpoint, eg: /ci/12 -> /ci/{id}"""
+    return _ID_PATTERN.sub("/{id}", path)
+
+
+def transports_of(client) -> List[Transport]:
+    """
+    distinct transports of a client, for observers to attach to
+
+    Args:
+        client: one of Client, CIClient and CIRelationClient
+    """
+    clients = [client.ci, client.cr] if hasattr(client, "cr") else [client]
+    transports = []
+    for c in clients:
+        if c.transport not in transports:
+            transports.append(c.transport)
+    return transports
+
+
+class RequestsTransport(Transport):
+    """
+    transport over `requests` sessions, one for each thread
+
+    Attributes:
+        sessions: http sessions per thread, may be shared by transports, its hooks apply to every request
+    """
+
+    def __init__(
+            self,
+            opt: Optional[Option] = None,
+            balancer: Optional[Balancer] = None,
+            sessions: Optional[SessionPool] = None,
+        ):
+        super().__init__(opt, balancer)
+        self.sessions = sessions if sessions else SessionPool()
+
+    def _perform(self, method, url, data, timeout, stream):
+        body = {"params": data} if method == "GET" else {"json": data}
+        return self.sessions.get().request(method, url, timeout=timeout, stream=stream, **body)
+
+    def close(self) -> None:
+        self.sessions.close()
+
+
+class _Urllib3Body:
+    """streamed body of a urllib3 response, errors are raised as by `requests.Response.iter_content`"""
+
+    __slots__ = ("resp",)
+
+    def __init__(self, resp: urllib3.HTTPResponse):
+        self.resp = resp
+
+    def stream(self, chunk_size: int) -> Iterator[bytes]:
+        resp = self.resp
+        try:
+            if not hasattr(resp, "read1"):
+                # urllib3 before 2.2, every chunk but the last is read in full
+                yield from resp.stream(chunk_size)
+                return
+            # what has arrived up to chunk_size, not waiting for a whole chunk of a slow body
+            while True:
+                chunk = resp.read1(chunk_size, decode_content=True)
+                if not chunk:
+                    return
+                yield chunk
+        except urllib3.exceptions.ProtocolError as e:
+            raise requests.exceptions.ChunkedEncodingError(e) from e
+        except urllib3.exceptions.DecodeError as e:
+            raise requests.exceptions.ContentDecodingError(e) from e
+        except urllib3.exceptions.SSLError as e:
+            raise requests.exceptions.SSLError(e) from e
+        except urllib3.exceptions.HTTPError as e:
+            # read timeouts included, as requests does
+            raise requests.ConnectionError(e) from e
+
+
+def iter_body(resp: Response, chunk_size: int, deadline: Optional[Deadline] = None) -> Iterator[bytes]:
+    """
+    body of a response sent with `stream`, in pieces as they arrive
+
+    Args:
+        resp: response of any transport
+        chunk_size: max size of a piece
+        deadline: raise CMDBTimeoutError after the piece that arrives past it, or when a read
+            timed out by it fails
+    """
+    if isinstance(resp, requests.Response) and hasattr(resp.raw, "read1"):
+        # iter_content of requests waits for whole chunks
+        chunks = _Urllib3Body(resp.raw).stream(chunk_size)
+    else:
+        chunks = resp.iter_content(chunk_size)
+    try:
+        for chunk in chunks:
+            if deadline:
+                deadline.check()
+            yield chunk
+    except requests.RequestException as e:
+        # the read timeout is clamped to the time left, so a read timed out by the deadline fails here
+        if deadline and deadline.expired:
+            raise deadline.exceeded() from e
+        raise
+
+
+class Urllib3Transport(Transport):
+    """
+    transport over a `urllib3.PoolManager`
+
+    lighter than `RequestsTransport` for high request rates: the pool manager is thread safe and
+    shared by all threads, and there are no session hooks, cookies, proxies or settings to merge
+    for every request. urllib3 errors are raised as their `requests` counterparts, so the same
+    exceptions are caught whatever the transport.
+
+    Attributes:
+        pool_maxsize: max connections kept for one host
+        headers: sent with every request
+    """
+
+    headers = {
+        "User-Agent": "cmdb-sdk-python",
+        "Accept-Encoding": "gzip, deflate",
+        "Accept": "*/*",
+        "Connection": "keep-alive",
+    }
+
+    def __init__(self, opt: Optional[Option] = None, balancer: Optional[Balancer] = None, pool_maxsize: int = 10):
+        super().__init__(opt, balancer)
+        self.pool_maxsize = pool_maxsize
+        self._pid = None
+        self._manager = None
+
+    @property
+    def manager(self) -> urllib3.PoolManager:
+        """pool manager of current process, sockets inherited by a child process are not reused"""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._manager = urllib3.PoolManager(maxsize=self.pool_maxsize, block=False)
+        return self._manager
+
+    def _perform(self, method, url, data, timeout, stream):
+        if method == "GET":
+            query = urlencode([(k, v) for k, v in data.items() if v is not None], doseq=True)
+            url, body, headers = f"{url}?{query}", None, self.headers
+        else:
+            body = json.dumps(data, allow_nan=False).encode("utf-8")
+            headers = dict(self.headers, **{"Content-Type": "application/json"})
+        try:
+            resp = self.manager.urlopen(
+                method,
+                url,
+                body=body,
+                headers=headers,
+                timeout=urllib3.Timeout(connect=timeout[0], read=timeout[1]),
+                retries=False,
+                redirect=False,
+                preload_content=not stream,
+            )
+        except urllib3.exceptions.NewConnectionError as e:
+            raise requests.ConnectionError(e, request=None) from e
+        except urllib3.exceptions.ConnectTimeoutError as e:
+            raise requests.ConnectTimeout(e, request=None) from e
+        except urllib3.exceptions.ReadTimeoutError as e:
+            raise requests.ReadTimeout(e, request=None) from e
+        except urllib3.exceptions.SSLError as e:
+            raise requests.exceptions.SSLError(e, request=None) from e
+        except urllib3.exceptions.HTTPError as e:
+            raise requests.ConnectionError(e, request=None) from e
+        if not stream:
+            return RawResponse(resp.status, resp.headers, resp.data)
+
+        def release():
+            resp.close()
+            resp.release_conn()
+
+        return RawResponse(resp.status, resp.headers, raw=_Urllib3Body(resp), release=release)
+
+    def close(self) -> None:
+        if self._manager is not None:
+            self._manager.clear()
+
+
+class MemoryTransport(Transport):
+    """
+    transport answering requests in process, for tests without a cmdb server
+
+    requests are still signed and balanced, `handler` gets the method, the path relative to api
+    base url and the signed params, and returns the json body, or a tuple of status code and json body.
+
+    Attributes:
+        handler: fake server, fn(method, path, params) -> body | (status, body)
+        calls: (method, path, params) of every request handled
+
+    Example:
+
+        > def handler(method, path, params):
+        >     return {"numfound": 1, "total": 1, "page": 1, "result": [{"_id": 1}], "facet": {}, "counter": {}}
+
+        > client = Client(transport=MemoryTransport(handler))
+
+    """
+
+    def __init__(self, handler: Callable[[str, str, dict], Any], opt: Optional[Option] = None):
+        super().__init__(opt if opt else Option(url="memory://cmdb/api/v0.1", key="key", secret="secret"))
+        self.handler = handler
+        self.calls: List[Tuple[str, str, dict]] = []
+        self._bases = {ep.url for ep in self.balancer.endpoints}
+
+    def _perform(self, method, url, data, timeout, stream):
+        path = url
+        for base in self._bases:
+            if url.startswith(base):
+                path = url[len(base):]
+                break
+        self.calls.append((method, path, data))
+        result = self.handler(method, path, data)
+        status, body = result if isinstance(result, tuple) else (200, result)
+        content = json.dumps(body).encode("utf-8")
+        return RawResponse(status, {"Content-Type": "application/json", "Content-Length": str(len(content))}, content)
@@ -0,0 +1,80 @@
+import time
+from collections import Counter
+
+from cmdb import Client
+from cmdb.core.transport import MemoryTransport
+
+
+CIS = [
+    {"_type": "server", "dc": "bj", "os": "linux"},
+    {"_type": "server", "dc": "bj", "os": "linux"},
+    {"_type": "server", "dc": "bj", "os": "windows"},
+    {"_type": "server", "dc": "sh", "os": "linux"},
+    {"_type": "server", "dc": "sh,hk", "os": "linux"},
+    {"_type": "server", "dc": None, "os": "linux"},
+    {"_type": "switch", "dc": "bj", "os": "ios"},
+    {"_type": "switch", "dc": "sh", "os": "ios"},
+]
+
+
+class FacetServer:
+    """answers search by filtering CIS with the `attr:value` terms of q"""
+
+    def __init__(self, slow_type: str = ""):
+        self.slow_type = slow_type
+        self.queries = []
+
+    def __call__(self, method, path, params):
+        q = params["q"]
+        self.queries.append(q)
+        terms = [t.split(":", 1) for t in q.split(",")]
+        if any(len(t) != 2 for t in terms):
+            return 400, {"message": f"invalid search expression: {q}"}
+        if self.slow_type and f"_type:{self.slow_type}" in q:
+            time.sleep(0.5)
+        cis = [ci for ci in CIS if all(str(ci.get(k)) == v for k, v in terms)]
+        facet = {}
+        if params.get("facet"):
+            attr = params["facet"]
+            counts = Counter(ci.get(attr) for ci in cis)
+            facet[attr] = [[v, n, attr] for v, n in counts.items()]
+        return {"numfound": len(cis), "total": min(len(cis), 1), "page": 1, "result": cis[:1],
+                "facet": facet, "counter": {}}
+
+
+class TestCIAnalytics:
+
+    def test_group_count(self):
+        server = FacetServer()
+        analytics = Client(transport=MemoryTransport(server)).analytics
+        rsp = analytics.group_count("_type:server", by=["dc", "os"])
+        assert rsp.total == 6
+        assert rsp.rows == {("bj", "linux"): 2, ("bj", "windows"): 1, ("sh", "linux"): 1}
+        # "sh,hk" and null cannot be put into a search expression, they are skipped, not queried
+        assert rsp.partial
+        assert not any("hk" in q or "None" in q for q in server.queries)
+        assert rsp.to_records()[0] == {"dc": "bj", "os": "linux", "count": 2}
+
+    def test_last_level_keeps_any_value(self):
+        analytics = Client(transport=MemoryTransport(FacetServer())).analytics
+        rsp = analytics.group_count("_type:server", by=["dc"])
+        assert rsp.rows == {("bj",): 3, ("sh",): 1, ("sh,hk",): 1, (None,): 1}
+        assert not rsp.partial
+        assert analytics.group_count("_type:server", by=[]).rows == {(): 6}
+
+    def test_group_count_types(self):
+        analytics = Client(transport=MemoryTransport(FacetServer())).analytics
+        rsp = analytics.group_count_types(["server", "switch"], by=["os"], q="dc:bj")
+        assert rsp.by == ["_type", "os"]
+        assert rsp.rows == {("server", "linux"): 2, ("server", "windows"): 1, ("switch", "ios"): 1}
+        assert rsp.total == 4 and not rsp.partial
+        rsp = analytics.group_count_types(["server", "switch"], by=[])
+        assert rsp.rows == {("server",): 6, ("switch",): 2} and rsp.total == 8
+
+    def test_partial_on_deadline(self):
+        analytics = Client(transport=MemoryTransport(FacetServer(slow_type="switch"))).analytics
+        start = time.monotonic()
+        rsp = analytics.group_count_types(["server", "switch"], by=["os"], deadline=0.2)
+        assert time.monotonic() - start < 0.45
+        assert rsp.partial
+        assert rsp.rows == {("server", "linux"): 5, ("server", "windows"): 1}
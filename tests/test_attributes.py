@@ -0,0 +1,41 @@
+from cmdb.core.attributes import AttributeCache
+from cmdb.core.policy import RetKey
+
+
+class FakeRequest:
+
+    def __init__(self):
+        self.attributes = [{"id": 1, "name": "hostname", "alias": "Host Name"}, {"id": 2, "name": "ip", "alias": ""}]
+        self.calls = 0
+
+    def __call__(self, method, path, payload, deadline=None):
+        self.calls += 1
+        assert (method, path) == ("GET", "/ci_types/5/attributes")
+        return {"attributes": self.attributes, "type_id": 5}
+
+
+class TestAttributeCache:
+
+    def test_rewrite(self):
+        request = FakeRequest()
+        cache = AttributeCache(request)
+        ci = {"_id": 9, "_type": 5, "1": "web-1", "2": "10.0.0.1"}
+        assert cache.rewrite(ci, RetKey.NAME) == {"_id": 9, "_type": 5, "hostname": "web-1", "ip": "10.0.0.1"}
+        assert cache.rewrite(ci, RetKey.ALIAS) == {"_id": 9, "_type": 5, "Host Name": "web-1", "ip": "10.0.0.1"}
+        assert request.calls == 1
+
+    def test_refetch_on_new_attribute(self):
+        request = FakeRequest()
+        cache = AttributeCache(request)
+        cache.rewrite({"_type": 5, "1": "web-1"}, RetKey.NAME)
+        request.attributes.append({"id": 3, "name": "os", "alias": "OS"})
+        assert cache.rewrite({"_type": 5, "1": "web-1", "3": "linux"}, RetKey.NAME) == {
+            "_type": 5, "hostname": "web-1", "os": "linux"}
+        assert request.calls == 2
+
+    def test_ttl(self):
+        request = FakeRequest()
+        cache = AttributeCache(request, ttl=0)
+        cache.rewrite({"_type": 5, "1": "a"}, RetKey.NAME)
+        cache.rewrite({"_type": 5, "1": "b"}, RetKey.NAME)
+        assert request.calls == 2
@@ -0,0 +1,51 @@
+import random
+from collections import OrderedDict, UserList
+
+from cmdb.core.auth import SigningContext, build_api_key
+from cmdb.core.models import CICreateReq, CIRetrieveReq
+
+
+PATH = "/api/v0.1/ci/s"
+
+
+class TestSigningContext:
+
+    def test_same_as_build_api_key(self):
+        ctx = SigningContext("key", "secret")
+        cases = [
+            {},
+            CIRetrieveReq("_type:book", fl="name,author", count=100).to_params(),
+            CICreateReq("book", attrs={"name": "平凡的世界", "price": 1.5, "tags": ["a"], "meta": {"a": 1}}).to_params(),
+            {"b": None, "a": True, "c": 0, "_key": "old", "_secret": "old"},
+            {"d": OrderedDict(a=1), "t": (1, 2), "l": UserList([1]), "only": "one"},
+            {"only": 1},
+        ]
+        for params in cases:
+            expected = build_api_key("key", "secret", PATH, dict(params))
+            assert ctx.sign(PATH, params) == expected
+            assert ctx.signature(PATH, params) == expected["_secret"]
+
+    def test_random_layouts(self):
+        ctx = SigningContext("key", "秘密")
+        rnd = random.Random(7)
+        names = [f"attr{i}" for i in range(12)]
+        for _ in range(500):
+            keys = rnd.sample(names, rnd.randint(0, len(names)))
+            params = {k: rnd.choice([rnd.randint(-9, 9), f"v{rnd.random()}", None, [1], {"x": 1}]) for k in keys}
+            path = rnd.choice(["/api/v0.1/ci", "/api/v0.1/ci/s", "/api/v0.1/ci_relations/s"])
+            assert ctx.sign(path, params) == build_api_key("key", "秘密", path, dict(params))
+
+    def test_input_not_modified(self):
+        ctx = SigningContext("key", "secret")
+        params = {"q": "_type:book", "count": 25}
+        signed = ctx.sign(PATH, params)
+        assert params == {"q": "_type:book", "count": 25}
+        assert set(signed) == {"q", "count", "_key", "_secret"}
+
+    def test_cache_bounded(self):
+        ctx = SigningContext("key", "secret", max_cached=4)
+        for i in range(20):
+            path = f"/api/v0.1/ci/{i}"
+            params = {f"a{i}": i}
+            assert ctx.sign(path, params) == build_api_key("key", "secret", path, dict(params))
+        assert len(ctx._prefixes) <= 4 and len(ctx._getters) <= 4
@@ -0,0 +1,49 @@
+import time
+
+from cmdb.core.balancer import Balancer
+from cmdb.core.policy import BalancePolicy
+
+
+URLS = ["http://a/api/v0.1", "http://b/api/v0.1", "http://c/api/v0.1"]
+
+
+class TestBalancer:
+
+    def test_round_robin(self):
+        balancer = Balancer(URLS)
+        picked = []
+        for _ in range(6):
+            ep = balancer.acquire()
+            balancer.release(ep, 0.01, True)
+            picked.append(ep.url)
+        assert picked == URLS + URLS
+
+    def test_least_outstanding(self):
+        balancer = Balancer(URLS, BalancePolicy.LEAST_OUTSTANDING)
+        busy = [balancer.acquire(), balancer.acquire()]
+        ep = balancer.acquire()
+        assert ep not in busy
+
+    def test_eject_and_readmit(self):
+        balancer = Balancer(URLS[:2], max_failures=2, eject_seconds=0.05)
+        bad = balancer.endpoints[0]
+        for _ in range(2):
+            bad.outstanding += 1
+            balancer.release(bad, 0.01, False)
+        for _ in range(4):
+            ep = balancer.acquire()
+            balancer.release(ep, 0.01, True)
+            assert ep is not bad
+        time.sleep(0.06)
+        picked = set()
+        for _ in range(2):
+            ep = balancer.acquire()
+            balancer.release(ep, 0.01, True)
+            picked.add(ep.url)
+        assert bad.url in picked
+
+    def test_all_ejected(self):
+        balancer = Balancer(URLS[:1], max_failures=1)
+        ep = balancer.acquire()
+        balancer.release(ep, 0.01, False)
+        assert balancer.acquire() is ep
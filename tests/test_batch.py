@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+from cmdb import Client, CIRelationRetrieveReq, CIRetrieveReq
+from cmdb.core.exc import CMDBError, CMDBTimeoutError
+from cmdb.core.transport import MemoryTransport
+
+
+def page(*ids):
+    return {"numfound": len(ids), "total": len(ids), "page": 1, "facet": {}, "counter": {},
+            "result": [{"_id": i, "_type": 1} for i in ids]}
+
+
+class SlowServer:
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self, method, path, params):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(float(params.get("sort") or self.delay))
+            if params.get("q") == "bad":
+                return 400, {"message": "invalid search expression"}
+            if path == "/ci_relations/s":
+                return page(params["root_id"] * 10)
+            return page(int(params["q"].split(":")[1]))
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+class TestBatch:
+
+    def test_order_dedup_and_errors(self):
+        server = SlowServer(0.1)
+        transport = MemoryTransport(server)
+        batch = Client(transport=transport).batch()
+        reqs = [
+            CIRetrieveReq("_id:1"),
+            CIRelationRetrieveReq(root_id=2),
+            CIRetrieveReq("bad"),
+            CIRetrieveReq("_id:3"),
+            CIRetrieveReq("_id:1"),
+        ]
+        indexes = [batch.add(r) for r in reqs]
+        assert indexes == [0, 1, 2, 3, 4] and len(batch) == 5
+
+        start = time.monotonic()
+        results = batch.run()
+        elapsed = time.monotonic() - start
+
+        assert results[0].cis.ids() == [1]
+        assert results[1].cis.ids() == [20]
+        assert isinstance(results[2], CMDBError)
+        assert results[3].cis.ids() == [3]
+        assert results[4] is results[0]
+        assert len(transport.calls) == 4
+        assert server.max_running == 4
+        assert elapsed < 0.3
+
+    def test_deadline(self):
+        batch = Client(transport=MemoryTransport(SlowServer(0.01))).batch()
+        fast = batch.add(CIRetrieveReq("_id:1"))
+        slow = batch.add(CIRetrieveReq("_id:2", sort="0.5"))
+        start = time.monotonic()
+        results = batch.run(deadline=0.2)
+        assert time.monotonic() - start < 0.4
+        assert results[fast].numfound == 1
+        assert isinstance(results[slow], CMDBTimeoutError)
+
+    def test_queued_dropped_at_deadline(self):
+        transport = MemoryTransport(SlowServer(0.2))
+        batch = Client(transport=transport).batch(max_workers=1)
+        for i in range(3):
+            batch.add(CIRetrieveReq(f"_id:{i}"))
+        results = batch.run(deadline=0.1)
+        assert all(isinstance(r, CMDBTimeoutError) for r in results)
+        # the running request ends on its own, the queued ones are never sent
+        time.sleep(0.4)
+        assert len(transport.calls) == 1
+
+    def test_unsupported(self):
+        batch = Client(transport=MemoryTransport(SlowServer(0))).batch()
+        with pytest.raises(CMDBError):
+            batch.add({"q": "_type:server"})
+        assert batch.run() == []
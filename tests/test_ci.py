@@ -42,6 +42,18 @@ class TestCI:
         print("add")
         print(resp)
 
+    def test_upsert(self):
+        ci = {
+            "id": 1,
+            "book_id": 1,
+            "book_name": "平凡的世界",
+            "author": "路遥",
+        }
+        resp = self.client.upsert_ci("book", ci, key=["book_id"])
+        print("upsert")
+        print(resp)
+        assert resp.ci_id
+
     def test_update(self):
         ci = self.find_by_name("平凡的世界")
         resp = self.client.update_ci("book", ci_id=ci["_id"], attrs={"author": "yao.lu"})
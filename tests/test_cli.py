@@ -0,0 +1,142 @@
+import io
+import json
+import threading
+
+import pytest
+
+from cmdb import Client, cli
+from cmdb.core.transport import MemoryTransport
+
+
+class Server:
+    """cmdb api of ci create, search and relation create, cis are unique by name"""
+
+    def __init__(self, total: int = 0):
+        self.lock = threading.Lock()
+        self.cis = {f"ci{i}": {"_id": i + 1, "name": f"ci{i}", "n": i} for i in range(total)}
+        self.relations = []
+
+    def __call__(self, method, path, params):
+        if method == "GET":
+            cis = sorted(self.cis.values(), key=lambda ci: ci["_id"])
+            count, page = params["count"], params["page"]
+            return {"numfound": len(cis), "total": len(cis), "page": page, "facet": {}, "counter": {},
+                    "result": cis[(page - 1) * count:page * count]}
+        if path.startswith("/ci_relations/"):
+            with self.lock:
+                self.relations.append(tuple(int(i) for i in path.split("/")[2:]))
+                return {"cr_id": len(self.relations)}
+        if params.get("n") == "bad":
+            return 400, {"message": "attribute n: bad is invalid"}
+        with self.lock:
+            ci = self.cis.get(params["name"])
+            if ci and params["exist_policy"] == "reject":
+                return 400, {"message": "CI already exists!"}
+            if not ci and params["exist_policy"] == "need":
+                return 404, {"message": f"CI {params['name']} does not exist"}
+            if not ci:
+                ci = self.cis[params["name"]] = {"_id": len(self.cis) + 1}
+            ci.update({k: v for k, v in params.items() if not k.startswith("_") and "policy" not in k})
+        return {"ci_id": ci["_id"]}
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = Server()
+    transport = MemoryTransport(server)
+    monkeypatch.setattr(cli, "_client", lambda args: Client(transport=transport))
+    server.transport = transport
+    return server
+
+
+def write_lines(path, records):
+    path.write_text("".join(json.dumps(r) + "\n" for r in records), encoding="utf-8")
+
+
+class TestImport:
+
+    def test_upsert_with_errors_file(self, server, tmp_path, capsys):
+        src = tmp_path / "books.ndjson"
+        write_lines(src, [{"name": "a", "n": 1}, {"name": "b", "n": "bad"}, {"name": "a", "n": 2}])
+        errors = tmp_path / "errors.ndjson"
+        code = cli.main(["import", str(src), "--type", "book", "--key", "name", "--workers", "1",
+                         "--errors", str(errors), "--checkpoint", str(tmp_path / "ckpt")])
+        assert code == 1
+        assert server.cis["a"]["n"] == 2 and "b" not in server.cis
+        failed = [json.loads(line) for line in errors.read_text(encoding="utf-8").splitlines()]
+        assert [(f["seq"], f["record"]["name"]) for f in failed] == [(1, "b")]
+        assert "invalid" in failed[0]["error"]
+        assert json.loads((tmp_path / "ckpt").read_text()) == {"done": 3}
+        err = capsys.readouterr().err
+        assert "ok: 2, errors: 1" in err and "created: 1, updated: 1" in err
+
+    def test_checkpoint_resume(self, server, tmp_path, capsys):
+        src = tmp_path / "books.ndjson"
+        write_lines(src, [{"name": f"b{i}", "n": i} for i in range(5)])
+        ckpt = tmp_path / "ckpt"
+        ckpt.write_text(json.dumps({"done": 3}))
+        assert cli.main(["import", str(src), "--type", "book", "--checkpoint", str(ckpt)]) == 0
+        assert sorted(server.cis) == ["b3", "b4"]
+        assert json.loads(ckpt.read_text()) == {"done": 5}
+        assert "skipped by checkpoint: 3" in capsys.readouterr().err
+        # nothing left to do
+        assert cli.main(["import", str(src), "--type", "book", "--checkpoint", str(ckpt)]) == 0
+        assert len(server.transport.calls) == 2
+
+    def test_interrupted_resume(self, server, tmp_path, monkeypatch, capsys):
+        src = tmp_path / "books.ndjson"
+        write_lines(src, [{"name": f"b{i}", "n": i} for i in range(10)])
+        ckpt = tmp_path / "ckpt"
+        read_records = cli._read_records
+
+        def interrupted(f, fmt):
+            for i, record in enumerate(read_records(f, fmt)):
+                if i == 6:
+                    raise KeyboardInterrupt
+                yield record
+
+        monkeypatch.setattr(cli, "_read_records", interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            cli.main(["import", str(src), "--type", "book", "--workers", "2", "--checkpoint", str(ckpt)])
+        # records in flight are finished and saved, not only those saved before the interval passed
+        assert json.loads(ckpt.read_text()) == {"done": 6}
+        assert "ok: 6, errors: 0" in capsys.readouterr().err
+
+        monkeypatch.setattr(cli, "_read_records", read_records)
+        # without --key a record written again would fail as existing
+        assert cli.main(["import", str(src), "--type", "book", "--checkpoint", str(ckpt)]) == 0
+        assert sorted(server.cis) == sorted(f"b{i}" for i in range(10))
+        assert len(server.transport.calls) == 10
+        assert "skipped by checkpoint: 6" in capsys.readouterr().err
+
+    def test_csv_from_stdin(self, server, monkeypatch):
+        stdin = io.StringIO("name,n\nx,1\n\"y, z\",2\n")
+        monkeypatch.setattr("sys.stdin", stdin)
+        assert cli.main(["import", "-", "--format", "csv", "--type", "book"]) == 0
+        assert server.cis["x"]["n"] == "1" and server.cis["y, z"]["n"] == "2"
+        assert not stdin.closed
+
+    def test_relations_csv(self, server, tmp_path):
+        src = tmp_path / "relations.csv"
+        src.write_text("src_ci_id,dst_ci_id\n1,2\n1,3\n", encoding="utf-8")
+        assert cli.main(["relations", "import", str(src), "--workers", "1"]) == 0
+        assert server.relations == [(1, 2), (1, 3)]
+
+
+class TestExport:
+
+    def test_pages_as_ndjson(self, server, tmp_path, capsys):
+        server.cis.update(Server(7).cis)
+        out = tmp_path / "cis.ndjson"
+        assert cli.main(["export", "--q", "_type:book", "--page-size", "3", "--out", str(out)]) == 0
+        lines = [json.loads(line) for line in out.read_text(encoding="utf-8").splitlines()]
+        assert [ci["_id"] for ci in lines] == list(range(1, 8))
+        assert [c[2]["page"] for c in server.transport.calls] == [1, 2, 3]
+        assert "exported: 7" in capsys.readouterr().err
+
+    def test_csv_columns(self, server, capsys):
+        server.cis.update(Server(3).cis)
+        assert cli.main(["export", "--q", "_type:book", "--format", "csv", "--fl", "name,n", "--page-size", "3"]) == 0
+        assert capsys.readouterr().out.splitlines() == ["name,n", "ci0,0", "ci1,1", "ci2,2"]
+        # a full last page costs one more empty page
+        assert [c[2]["page"] for c in server.transport.calls] == [1, 2]
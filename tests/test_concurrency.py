@@ -0,0 +1,103 @@
+"""
+stress a shared client from many threads and forked processes against a local stub cmdb
+"""
+
+import json
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from cmdb import Client, Option
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        q = parse_qs(urlparse(self.path).query)["q"][0]
+        body = json.dumps({
+            "numfound": 1, "total": 1, "page": 1, "facet": {}, "counter": {},
+            "result": [{"_id": int(q.split(":")[1]), "_type": 1}],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestConcurrency:
+
+    def setup_method(self) -> None:
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{self.server.server_address[1]}/api/v0.1"
+        self.client = Client(Option(url=url, key="key", secret="secret"))
+
+    def teardown_method(self) -> None:
+        self.client.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_threads(self):
+        sessions = set()
+
+        def work(i: int) -> int:
+            sessions.add(id(self.client.ci.session))
+            return self.client.get_ci(q=f"_id:{i}").result[0]["_id"]
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            ids = list(pool.map(work, range(800)))
+        assert ids == list(range(800))
+        assert 1 < len(sessions) <= 16
+        assert all(ep.outstanding == 0 for ep in self.client.transport.balancer.endpoints)
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="fork not supported")
+    def test_fork(self):
+        assert self.client.get_ci(q="_id:1").result[0]["_id"] == 1
+        parent_session = self.client.ci.session
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                ok = self.client.ci.session is not parent_session
+                ok = ok and self.client.get_ci(q="_id:2").result[0]["_id"] == 2
+                code = 0 if ok else 1
+            finally:
+                os._exit(code)
+        _, status = os.waitpid(pid, 0)
+        assert os.WEXITSTATUS(status) == 0
+        assert self.client.ci.session is parent_session
+        assert self.client.get_ci(q="_id:3").result[0]["_id"] == 3
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="fork not supported")
+    def test_fork_while_locked(self):
+        balancer = self.client.transport.balancer
+        in_flight = balancer.acquire()
+        # fork while other threads of the parent would hold the locks
+        with balancer._lock, self.client.ci.attributes._lock:
+            pid = os.fork()
+            if pid == 0:
+                code = 1
+                try:
+                    # a deadlock kills the child instead of hanging the tests
+                    signal.alarm(5)
+                    ok = all(ep.outstanding == 0 for ep in balancer.endpoints)
+                    ok = ok and self.client.get_ci(q="_id:2").result[0]["_id"] == 2
+                    self.client.ci.attributes.invalidate()
+                    code = 0 if ok else 1
+                finally:
+                    os._exit(code)
+        balancer.release(in_flight, 0.0, True)
+        _, status = os.waitpid(pid, 0)
+        assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
@@ -0,0 +1,150 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from cmdb import Client, Option
+from cmdb.core.deadline import Deadline
+from cmdb.core.exc import CMDBTimeoutError
+from cmdb.core.feed import ChangeFeed
+from cmdb.core.policy import TransportType
+from cmdb.core.transport import MemoryTransport
+
+
+class StallHandler(BaseHTTPRequestHandler):
+    """stops sending in the middle of the body"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = b'{"numfound": 2, "page": 1, "result": [{"_id": 1}, {"_id": 2}]}' + b" " * 200
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body[:51])
+        self.wfile.flush()
+        time.sleep(2)
+        self.close_connection = True
+
+
+class DripHandler(StallHandler):
+    """sends the body one byte every 30ms, each read is fast but the whole body is slow"""
+
+    def do_GET(self):
+        body = b'{"numfound": 2, "page": 1, "result": [{"_id": 1}, {"_id": 2}]}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            for i in range(len(body)):
+                self.wfile.write(body[i:i + 1])
+                self.wfile.flush()
+                time.sleep(0.03)
+        except OSError:
+            pass
+        self.close_connection = True
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/api/v0.1"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope="module")
+def url():
+    yield from serve(StallHandler)
+
+
+@pytest.fixture(scope="module")
+def drip_url():
+    yield from serve(DripHandler)
+
+
+class TestDeadline:
+
+    def test_timeout_clamped(self):
+        deadline = Deadline(0.5)
+        connect, read = deadline.timeout(3.0, 60.0)
+        assert 0.4 < connect <= 0.5 and 0.4 < read <= 0.5
+        assert deadline.timeout(0.1, None)[0] == 0.1 and deadline.timeout(0.1, None)[1] <= 0.5
+        assert Deadline.of(None) is None and Deadline.of(deadline) is deadline
+        expired = Deadline(0)
+        assert expired.expired and expired.remaining() == 0.0
+        with pytest.raises(CMDBTimeoutError):
+            expired.check()
+
+    @pytest.mark.parametrize("transport_type", list(TransportType))
+    def test_read_past_deadline(self, url, transport_type):
+        client = Client(Option(url=url, key="key", secret="secret", transport_type=transport_type))
+        for stream in (False, True):
+            start = time.monotonic()
+            with pytest.raises(CMDBTimeoutError):
+                if stream:
+                    list(client.get_ci_stream("_type:server", deadline=0.3))
+                else:
+                    client.get_ci("_type:server", deadline=0.3)
+            assert time.monotonic() - start < 1
+        # partial results instead of an error
+        start = time.monotonic()
+        result = client.get_ci_all("_type:server", deadline=0.3)
+        assert result.partial and time.monotonic() - start < 1
+        result.close()
+        client.transport.close()
+
+    @pytest.mark.parametrize("transport_type", list(TransportType))
+    def test_slow_body_past_deadline(self, drip_url, transport_type):
+        client = Client(Option(url=drip_url, key="key", secret="secret", transport_type=transport_type))
+        for stream in (False, True):
+            start = time.monotonic()
+            with pytest.raises(CMDBTimeoutError):
+                if stream:
+                    list(client.get_ci_stream("_type:server", deadline=0.3))
+                else:
+                    client.get_ci("_type:server", deadline=0.3)
+            assert time.monotonic() - start < 0.6
+        # the whole body takes about 2s without a deadline
+        assert client.get_ci("_type:server").numfound == 2
+        client.transport.close()
+
+    def test_retries_stop_at_deadline(self):
+        attempts = []
+
+        def handler(method, path, params):
+            attempts.append(path)
+            time.sleep(0.15)
+            raise requests.ConnectionError("connection reset")
+
+        opt = Option(url=[f"memory://cmdb{i}/api/v0.1" for i in range(5)], key="key", secret="secret")
+        client = Client(transport=MemoryTransport(handler, opt))
+        start = time.monotonic()
+        with pytest.raises(CMDBTimeoutError):
+            client.get_ci("_type:server", deadline=0.4)
+        assert time.monotonic() - start < 0.6 and len(attempts) == 3
+
+    def test_feed_stops_at_deadline(self):
+        def handler(method, path, params):
+            # endless changes, one updated every second from the queried watermark on
+            time.sleep(0.1)
+            terms = params["q"].split(",")
+            low = int(terms[1].split(":", 1)[1].strip("[]").split(" _TO_ ")[0]) if len(terms) > 1 else 0
+            page = [{"_id": n, "updated_at": n} for n in range(low, low + 2)]
+            return {"numfound": 1000, "total": 2, "page": 1, "facet": {}, "counter": {}, "result": page}
+
+        feed = ChangeFeed(Client(transport=MemoryTransport(handler)).ci, "_type:server", count=2)
+        start = time.monotonic()
+        got = [ci["_id"] for ci in feed.changes(deadline=0.35)]
+        assert time.monotonic() - start < 0.5
+        assert not feed.caught_up
+        assert got == list(range(len(got))) and len(got) >= 2
+        # the next pass goes on from where this one stopped
+        assert feed.watermark == got[-1] + 1
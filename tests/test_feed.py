@@ -0,0 +1,91 @@
+import random
+
+from cmdb import Client
+from cmdb.core.feed import CallbackCheckpoint, ChangeFeed, FileCheckpoint
+from cmdb.core.transport import MemoryTransport
+
+
+def ts(second: int) -> str:
+    return f"2024-01-01 10:{second // 60:02d}:{second % 60:02d}"
+
+
+class UnstableServer:
+    """search sorted by updated_at only, cis with the same updated_at come in a random order on every request"""
+
+    def __init__(self, seed: int = 0):
+        self.rnd = random.Random(seed)
+        self.cis = {}
+        self.next_id = 1
+
+    def add(self, *seconds):
+        for s in seconds:
+            self.cis[self.next_id] = {"_id": self.next_id, "_type": 1, "updated_at": None if s is None else ts(s)}
+            self.next_id += 1
+
+    def touch(self, ci_id: int, second: int):
+        self.cis[ci_id] = dict(self.cis[ci_id], updated_at=ts(second))
+
+    def __call__(self, method, path, params):
+        terms = params["q"].split(",")
+        cis = list(self.cis.values())
+        for term in terms[1:]:
+            low, high = term.split(":", 1)[1].strip("[]").split(" _TO_ ")
+            cis = [ci for ci in cis if ci["updated_at"] is not None and ci["updated_at"] >= low
+                   and (high == "*" or ci["updated_at"] <= high)]
+        self.rnd.shuffle(cis)
+        cis.sort(key=lambda ci: ci["updated_at"] or "")
+        count, page = params["count"], params["page"]
+        return {"numfound": len(cis), "total": len(cis), "page": page, "facet": {}, "counter": {},
+                "result": cis[(page - 1) * count:page * count]}
+
+
+def ids(cis):
+    return [ci["_id"] for ci in cis]
+
+
+class TestChangeFeed:
+
+    def test_ties_across_pages_and_polls(self):
+        for seed in range(50):
+            server = UnstableServer(seed)
+            feed = ChangeFeed(Client(transport=MemoryTransport(server)).ci, "_type:server", count=3)
+            server.add(1, 1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 3, None, None)
+            first = ids(feed.changes())
+            assert sorted(first) == list(range(1, 13)), seed
+            assert feed.caught_up and feed.watermark == ts(3)
+
+            # new ties of the watermark, and more ties than a page on a later value
+            server.add(3, 3, 4, 4, 4, 4, 4, 5)
+            server.touch(1, 4)
+            second = ids(feed.changes())
+            assert sorted(second) == [1] + list(range(15, 23)), seed
+            assert ids(feed.changes()) == []
+
+    def test_nulls_never_yielded(self):
+        server = UnstableServer()
+        server.add(None, None, None, None, 1)
+        feed = ChangeFeed(Client(transport=MemoryTransport(server)).ci, "_type:server", count=2)
+        assert ids(feed.changes()) == [5]
+
+    def test_checkpoint_resume(self, tmp_path):
+        server = UnstableServer(3)
+        server.add(1, 2, 2, 2, 2, 3, 4, 4)
+        client = Client(transport=MemoryTransport(server))
+        path = str(tmp_path / "feed.ckpt")
+
+        got = []
+        feed = ChangeFeed(client.ci, "_type:server", checkpoint=FileCheckpoint(path), count=3)
+        for ci in feed.changes():
+            got.append(ci["_id"])
+            if len(got) == 4:
+                break
+        # a new feed resumes from the saved page, cis after it are yielded at least once
+        resumed = ChangeFeed(client.ci, "_type:server", checkpoint=FileCheckpoint(path), count=3)
+        got += ids(resumed.changes())
+        assert set(got) == set(range(1, 9))
+        assert resumed.watermark == ts(4)
+
+        saved = {}
+        feed = ChangeFeed(client.ci, "_type:server", checkpoint=CallbackCheckpoint(lambda: None, saved.update))
+        assert len(ids(feed.changes())) == 8
+        assert saved == {"watermark": ts(4), "seen": [7, 8]}
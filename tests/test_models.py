@@ -0,0 +1,56 @@
+import pickle
+
+from cmdb.core.models import CI, CIRelationRetrieveRsp, CIRetrieveRsp
+
+
+RAW = {
+    "numfound": 3,
+    "total": 2,
+    "page": 1,
+    "result": [{"_id": 7, "_type": 2, "ci_type": "server", "hostname": "web-1"}, {"_id": 8, "_type": 2}],
+    "facet": {"os": [["linux", 2, "os"], ["windows", 1, "os"]]},
+    "counter": {"server": 3},
+}
+
+
+class TestSearchRsp:
+
+    def test_from_raw(self):
+        rsp = CIRetrieveRsp.from_raw(RAW)
+        assert (rsp.numfound, rsp.total, rsp.page) == (3, 2, 1)
+        assert rsp.result is RAW["result"]
+        assert rsp.counter == {"server": 3}
+        assert rsp.facets == {"os": {"linux": 2, "windows": 1}}
+
+    def test_cis(self):
+        cis = CIRetrieveRsp.from_raw(RAW).cis
+        assert len(cis) == 2 and cis.ids() == [7, 8]
+        ci = cis[0]
+        assert isinstance(ci, CI)
+        assert (ci.id, ci.type_id, ci.ci_type) == (7, 2, "server")
+        assert ci["hostname"] == "web-1" and ci.get("ip") is None and "hostname" in ci
+        assert dict(ci) == RAW["result"][0]
+        assert [c.id for c in cis[1:]] == [8]
+
+    def test_keyword_construction(self):
+        rsp = CIRelationRetrieveRsp(**dict(RAW, took=0.01))
+        assert rsp.numfound == 3 and rsp.raw["took"] == 0.01
+        assert rsp == CIRelationRetrieveRsp.from_raw(dict(RAW, took=0.01))
+        empty = CIRetrieveRsp()
+        assert (empty.numfound, empty.result, empty.facet, empty.facets) == (0, [], {}, {})
+
+    def test_missing_fields_and_assignment(self):
+        rsp = CIRetrieveRsp.from_raw({"numfound": 0})
+        assert rsp.result == [] and rsp.counter == {}
+        rsp.result = [{"_id": 1, "_type": 1}]
+        assert rsp.cis.ids() == [1]
+        # defaults of missing fields are kept like the decoded ones
+        rsp = CIRetrieveRsp.from_raw({"numfound": 0, "facet": None})
+        rsp.result.append({"_id": 2, "_type": 1})
+        rsp.facet["os"] = [["linux", 1, "os"]]
+        assert rsp.cis.ids() == [2] and rsp.facets == {"os": {"linux": 1}}
+        assert rsp.to_dict()["result"] == [{"_id": 2, "_type": 1}]
+
+    def test_pickle(self):
+        rsp = CIRetrieveRsp.from_raw(dict(RAW))
+        assert pickle.loads(pickle.dumps(rsp)) == rsp
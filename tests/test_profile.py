@@ -0,0 +1,79 @@
+import json
+import time
+import tracemalloc
+
+from cmdb import Client, Option
+from cmdb.core.profile import PHASES, Profiler
+from cmdb.core.transport import MemoryTransport
+
+
+def handler(method, path, params):
+    if method == "GET":
+        time.sleep(0.01)
+        return {"numfound": 100, "total": 100, "page": 1, "facet": {}, "counter": {},
+                "result": [{"_id": i, "_type": 1, "hostname": f"host-{i}" * 10} for i in range(100)]}
+    if method == "POST":
+        return {"ci_id": 1}
+    return {"message": "ok"}
+
+
+class TestProfiler:
+
+    def test_phases_per_endpoint(self, tmp_path):
+        client = Client(transport=MemoryTransport(handler))
+        with client.profile() as profiler:
+            assert tracemalloc.is_tracing()
+            for _ in range(3):
+                client.get_ci("_type:server")
+            client.add_ci("server", {"hostname": "a"})
+            client.delete_ci(12)
+        assert not tracemalloc.is_tracing() and client.transport.profiler is None
+
+        search = profiler.stats["GET /ci/s"]
+        # only cis requested with compact keys are rewritten
+        assert set(search) == set(PHASES) - {"rewrite"}
+        assert all(st.count == 3 for st in search.values())
+        # the fake server sleeps without cpu, which is the network wait
+        assert search["network"].wait >= 0.025 and search["network"].wait > search["decode"].wait
+        assert search["decode"].alloc > 0
+        assert set(profiler.stats["POST /ci"]) == set(PHASES) - {"rewrite"}
+        # delete ci sends no request params
+        assert "to_params" not in profiler.stats["DELETE /ci/{id}"]
+
+        report = profiler.report()
+        assert report.splitlines()[1].startswith("GET /ci/s to_params")
+        assert "DELETE /ci/{id} total" in report
+        profiler.dump(str(tmp_path / "profile.json"))
+        dumped = json.loads((tmp_path / "profile.json").read_text())
+        assert dumped["GET /ci/s"]["model"]["count"] == 3
+
+    def test_without_tracemalloc_and_detach(self):
+        client = Client(transport=MemoryTransport(handler))
+        profiler = Profiler(trace_malloc=False).attach(client)
+        assert not tracemalloc.is_tracing()
+        with client.get_ci_stream("_type:server", count=100) as stream:
+            assert len(list(stream)) == 100
+        profiler.detach(client)
+        client.get_ci("_type:server")
+        phases = profiler.stats["GET /ci/s"]
+        assert phases["network"].count == 1 and "decode" not in phases
+        assert all(st.alloc == 0 for st in phases.values())
+
+    def test_compact_keys(self):
+        def compact(method, path, params):
+            if path == "/ci_types/1/attributes":
+                return {"attributes": [{"id": 7, "name": "hostname"}]}
+            return {"numfound": 100, "total": 100, "page": 1, "facet": {}, "counter": {},
+                    "result": [{"_id": i, "_type": 1, "7": f"host-{i}"} for i in range(100)]}
+
+        opt = Option(url="memory://cmdb/api/v0.1", key="key", secret="secret", compact_keys=True)
+        client = Client(transport=MemoryTransport(compact, opt))
+        with client.profile(trace_malloc=False) as profiler:
+            for _ in range(2):
+                assert client.get_ci("_type:server").result[0]["hostname"] == "host-0"
+        # the attributes fetched while rewriting the first search do not take over its model phase
+        search = profiler.stats["GET /ci/s"]
+        assert search["rewrite"].count == 2 and search["model"].count == 2
+        attributes = profiler.stats["GET /ci_types/{id}/attributes"]
+        assert attributes["network"].count == 1 and {"rewrite", "model"}.isdisjoint(attributes)
+        assert search["rewrite"].wall >= attributes["network"].wall
@@ -0,0 +1,87 @@
+import json
+import time
+
+from cmdb import Client, Option
+from cmdb.core.replay import Recorder, Replayer
+from cmdb.core.transport import MemoryTransport
+
+
+def handler(method, path, params):
+    if path != "/ci/s":
+        return 404, {"message": "ci not found"}
+    return {"numfound": 0, "total": 0, "page": 1, "facet": {}, "counter": {}, "result": []}
+
+
+def write_log(path, entries):
+    with open(path, "w", encoding="utf-8") as f:
+        for e in entries:
+            f.write(json.dumps(dict({"params": {}, "elapsed": 0.01, "size": 10, "status": 200}, **e)) + "\n")
+
+
+class TestRecorder:
+
+    def test_record_and_close(self, tmp_path):
+        path = str(tmp_path / "traffic.ndjson")
+        transport = MemoryTransport(handler)
+        client = Client(transport=transport)
+        with Recorder(path).attach(client):
+            client.get_ci("_type:server", count=5)
+            client.delete_ci(12)
+            assert len(transport.observers) == 1
+        # closing detaches, later requests are not observed any more
+        assert transport.observers == []
+        client.get_ci("_type:book")
+
+        with open(path, encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f]
+        assert [(e["method"], e["path"], e["status"]) for e in entries] == [("GET", "/ci/s", 200), ("DELETE", "/ci/12", 404)]
+        assert entries[0]["params"]["q"] == "_type:server" and entries[0]["params"]["count"] == 5
+        assert not {"_key", "_secret"} & set(entries[0]["params"])
+        assert entries[0]["size"] > 0 and entries[0]["ts"] <= entries[1]["ts"]
+
+    def test_detach(self, tmp_path):
+        transport = MemoryTransport(handler)
+        client = Client(transport=transport)
+        recorder = Recorder(str(tmp_path / "traffic.ndjson")).attach(client)
+        recorder.detach(client)
+        assert transport.observers == []
+        client.get_ci("_type:book")
+        recorder.close()
+        assert (tmp_path / "traffic.ndjson").read_text() == ""
+
+
+class TestReplayer:
+
+    def test_replay_signed_with_target_key(self, tmp_path):
+        path = str(tmp_path / "traffic.ndjson")
+        write_log(path, [
+            {"ts": 0.0, "method": "GET", "path": "/ci/s", "params": {"q": "_type:server"}},
+            {"ts": 0.01, "method": "DELETE", "path": "/ci/7", "status": 200},
+            {"ts": 0.02, "method": "DELETE", "path": "/ci/8", "status": 500},
+        ])
+        opt = Option(url="memory://staging/api/v0.1", key="staging", secret="s")
+        transport = MemoryTransport(handler, opt)
+        report = Replayer(opt, path, speed=0, transport=transport).run()
+
+        assert [c[2]["_key"] for c in transport.calls] == ["staging"] * 3
+        assert transport.calls[0][2]["q"] == "_type:server"
+        assert report.replayed.count == report.recorded.count == 3
+        assert (report.replayed.errors, report.recorded.errors, report.error_delta) == (2, 1, 1)
+        assert set(report.by_path) == {"GET /ci/s", "DELETE /ci/{id}"}
+        assert report.by_path["DELETE /ci/{id}"][0].count == 2
+        assert "DELETE /ci/{id} replay" in report.summary()
+
+    def test_pacing_and_limit(self, tmp_path):
+        path = str(tmp_path / "traffic.ndjson")
+        write_log(path, [{"ts": t, "method": "GET", "path": "/ci/s"} for t in (5.4, 5.0, 5.2)])
+        transport = MemoryTransport(handler)
+
+        start = time.monotonic()
+        report = Replayer(transport.opt, path, speed=2, transport=transport).run()
+        assert 0.18 < time.monotonic() - start < 0.4
+        assert report.replayed.count == 3
+
+        start = time.monotonic()
+        assert Replayer(transport.opt, path, speed=0, transport=transport).run().replayed.count == 3
+        assert time.monotonic() - start < 0.1
+        assert Replayer(transport.opt, path, speed=0, transport=transport, concurrency=1).run(limit=2).replayed.count == 2
@@ -0,0 +1,109 @@
+import os
+import time
+
+import pytest
+import requests
+
+from cmdb import Client
+from cmdb.core.resultset import CIResultSet, _sizeof
+from cmdb.core.transport import MemoryTransport
+
+
+def make_ci(i: int) -> dict:
+    return {"_id": i, "_type": 3, "name": f"server-{i:05d}", "ip": f"10.0.{i // 256}.{i % 256}", "tags": ["a", "b"]}
+
+
+def filled(total: int, budget: int) -> CIResultSet:
+    result = CIResultSet(budget)
+    result.extend(make_ci(i) for i in range(total))
+    return result
+
+
+class TestCIResultSet:
+
+    def test_spill_threshold(self):
+        size = _sizeof(make_ci(0))
+        # a dict and its keys and values, not the few bytes of its encoding
+        assert size > 5 * len(repr(make_ci(0)))
+        with filled(100, size * 10) as result:
+            assert len(result._memory) == 10 and result.spilled == 90
+            assert result._memory_size <= result.memory_budget
+        with filled(10, size * 10) as result:
+            assert result.spilled == 0 and result._file is None
+
+    def test_sampled_size(self):
+        with filled(1000, 1 << 30) as result:
+            every = CIResultSet.sample_every
+            assert result._samples == len(set(range(every)) | set(range(0, 1000, every)))
+            exact = sum(_sizeof(ci) for ci in result)
+            assert abs(result._memory_size - exact) < exact * 0.01
+
+    def test_index_across_memory_and_disk(self):
+        with filled(50, _sizeof(make_ci(0)) * 20) as result:
+            n = len(result._memory)
+            assert 0 < n < 50 and len(result) == 50
+            assert [ci["_id"] for ci in result] == list(range(50))
+            assert result[n - 1]["_id"] == n - 1 and result[n]["_id"] == n
+            assert result[-1] == make_ci(49) and result[-50] == make_ci(0)
+            with pytest.raises(IndexError):
+                result[50]
+            with pytest.raises(IndexError):
+                result[-51]
+            assert [ci["_id"] for ci in result[n - 2:n + 2]] == [n - 2, n - 1, n, n + 1]
+            assert [ci["_id"] for ci in result[::-7]] == list(range(49, -1, -7))
+            assert result[-3:] == [make_ci(i) for i in (47, 48, 49)]
+            assert result[60:] == []
+
+    def test_append_after_read(self):
+        with filled(30, 0) as result:
+            assert result[-1]["_id"] == 29
+            result.append(make_ci(30))
+            assert result[-1]["_id"] == 30 and len(result) == 31
+
+    def test_close_removes_file(self):
+        result = filled(20, 0)
+        assert result.spilled == 20
+        fd = result._file.fileno()
+        result[0]
+        result.close()
+        assert len(result) == 0
+        with pytest.raises(OSError):
+            os.fstat(fd)
+
+
+class TestGetCIAll:
+
+    def setup_method(self) -> None:
+        self.fail_page = None
+
+    def handler(self, method, path, params):
+        page = params["page"]
+        if page == self.fail_page:
+            time.sleep(0.25)
+            raise requests.ReadTimeout("read timed out")
+        cis = [make_ci(i) for i in range(page * 2 - 2, min(page * 2, 5))]
+        return {"numfound": 5, "total": len(cis), "page": page, "facet": {}, "counter": {}, "result": cis}
+
+    def test_all_pages(self):
+        transport = MemoryTransport(self.handler)
+        with Client(transport=transport).get_ci_all("_type:server", page_size=2, memory_budget=0) as result:
+            assert result[:] == [make_ci(i) for i in range(5)]
+            assert result.spilled == 5 and result.numfound == 5 and not result.partial
+        assert [c[2]["page"] for c in transport.calls] == [1, 2, 3]
+
+    def test_partial_past_deadline(self):
+        self.fail_page = 2
+        client = Client(transport=MemoryTransport(self.handler))
+        with client.get_ci_all("_type:server", page_size=2, deadline=0.2) as result:
+            assert result.partial and result[:] == [make_ci(0), make_ci(1)]
+
+    def test_closed_on_error(self, monkeypatch):
+        closed = []
+        close = CIResultSet.close
+        monkeypatch.setattr(CIResultSet, "close", lambda self: closed.append(self.spilled) or close(self))
+        self.fail_page = 3
+        client = Client(transport=MemoryTransport(self.handler))
+        with pytest.raises(requests.ReadTimeout):
+            client.get_ci_all("_type:server", page_size=2, memory_budget=0, deadline=30)
+        # the file of the cis read before the error is removed
+        assert closed == [4]
@@ -0,0 +1,97 @@
+import json
+import random
+
+import pytest
+
+from cmdb.core.exc import CMDBError
+from cmdb.core.stream import CIRetrieveStream, JSONObjectStream
+from cmdb.core.transport import RawResponse
+
+
+def split(data: bytes, *cuts: int):
+    bounds = [0, *cuts, len(data)]
+    return [data[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+def parse(chunks, array_key="result"):
+    fields, items = {}, []
+    for kind, value in JSONObjectStream(chunks, array_key):
+        if kind == "item":
+            items.append(value)
+        else:
+            fields[value[0]] = value[1]
+    return fields, items
+
+
+def random_value(rnd: random.Random, depth: int = 0):
+    kind = rnd.randrange(8 if depth < 3 else 6)
+    if kind == 0:
+        return rnd.randint(-10 ** 6, 10 ** 6)
+    if kind == 1:
+        return rnd.choice([1.5, -0.25, 1e-7, 3.25e10, 0.0])
+    if kind == 2:
+        return rnd.choice([True, False, None])
+    if kind in (3, 4, 5):
+        return "".join(rnd.choice("ab, :{}[]\"\\\n平凡的世界😀") for _ in range(rnd.randrange(8)))
+    if kind == 6:
+        return [random_value(rnd, depth + 1) for _ in range(rnd.randrange(4))]
+    return {f"k{i}": random_value(rnd, depth + 1) for i in range(rnd.randrange(4))}
+
+
+class TestJSONObjectStream:
+
+    def test_number_split_at_every_position(self):
+        doc = {"a": 1.5, "b": -12e-3, "c": 10, "result": [1.25, 2e5, -3, {"x": 4.5}], "d": 7}
+        data = json.dumps(doc).encode()
+        for i in range(1, len(data)):
+            fields, items = parse(split(data, i))
+            assert items == doc["result"]
+            assert fields == {k: v for k, v in doc.items() if k != "result"}
+
+    def test_unicode_split_inside_char(self):
+        doc = {"result": [{"name": "平凡的世界😀"}], "counter": {"书": 1}}
+        data = json.dumps(doc, ensure_ascii=False).encode()
+        for i in range(1, len(data)):
+            assert parse(split(data, i)) == ({"counter": {"书": 1}}, doc["result"])
+
+    def test_fuzz(self):
+        rnd = random.Random(27)
+        for _ in range(300):
+            doc = {f"f{i}": random_value(rnd) for i in range(rnd.randrange(4))}
+            doc["result"] = [random_value(rnd) for _ in range(rnd.randrange(6))]
+            data = json.dumps(doc, ensure_ascii=rnd.random() < 0.5, indent=rnd.choice([None, 1])).encode()
+            cuts = sorted(rnd.sample(range(1, len(data)), min(len(data) - 1, rnd.randrange(1, 12))))
+            fields, items = parse(split(data, *cuts))
+            assert items == doc["result"]
+            assert fields == {k: v for k, v in doc.items() if k != "result"}
+
+    def test_single_bytes_and_empty(self):
+        data = b' { "result" : [ ] , "n" : 0 } '
+        assert parse([data[i:i + 1] for i in range(len(data))]) == ({"n": 0}, [])
+        assert parse([b"{}"]) == ({}, [])
+
+    def test_malformed(self):
+        with pytest.raises(json.JSONDecodeError):
+            parse([b'{"a": 1.', b'x}'])
+        with pytest.raises(json.JSONDecodeError):
+            parse([b'{"result": [1, 2'])
+
+
+class TestCIRetrieveStream:
+
+    def test_fields_and_cis(self):
+        body = json.dumps({"numfound": 3, "page": 1, "result": [{"_id": i} for i in range(3)], "counter": {"a": 3}})
+        resp = RawResponse(200, {}, body.encode())
+        rsp = CIRetrieveStream(resp, chunk_size=7)
+        assert rsp.numfound == 3 and rsp.counter is None
+        assert [ci["_id"] for ci in rsp] == [0, 1, 2]
+        assert rsp.counter == {"a": 3}
+
+    def test_message_error(self):
+        released = []
+        body = json.dumps({"message": "不存在的属性: abc"}, ensure_ascii=False).encode()
+        for chunk_size in (1, 5, 1024):
+            resp = RawResponse(400, {}, body, release=lambda: released.append(1))
+            with pytest.raises(CMDBError, match="不存在的属性"):
+                CIRetrieveStream(resp, chunk_size=chunk_size)
+        assert len(released) == 3
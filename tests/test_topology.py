@@ -0,0 +1,54 @@
+import os
+import tempfile
+
+from cmdb.core.topology import Topology
+
+
+EDGES = [(10, 20), (10, 30), (20, 40), (30, 40), (40, 50), (60, 70)]
+
+
+class TestTopology:
+
+    def setup_method(self) -> None:
+        self.topo = Topology.from_edges(EDGES, nodes={80: 3})
+
+    def test_walk(self):
+        assert sorted(self.topo.descendants(10)) == [20, 30, 40, 50]
+        assert self.topo.descendants(10, max_depth=1) == [20, 30]
+        assert sorted(self.topo.ancestors(40)) == [10, 20, 30]
+        assert self.topo.descendants(50) == []
+        assert self.topo.descendants(999) == []
+
+    def test_shortest_path(self):
+        assert self.topo.shortest_path(10, 50) in ([10, 20, 40, 50], [10, 30, 40, 50])
+        assert self.topo.shortest_path(50, 10) is None
+        assert self.topo.shortest_path(50, 20, directed=False) == [50, 40, 20]
+
+    def test_components(self):
+        assert self.topo.connected_components() == [[10, 20, 30, 40, 50], [60, 70], [80]]
+        assert self.topo.connected_component(70) == [60, 70]
+
+    def test_events(self):
+        self.topo.apply([
+            {"op": "add", "src_ci_id": 50, "dst_ci_id": 60},
+            {"op": "add", "src_ci_id": 70, "dst_ci_id": 90},
+            {"op": "delete", "src_ci_id": 10, "dst_ci_id": 30},
+        ])
+        assert sorted(self.topo.descendants(40)) == [50, 60, 70, 90]
+        assert sorted(self.topo.ancestors(30)) == []
+        self.topo.delete_relation(70, 90)
+        self.topo.add_relation(10, 30)
+        expected = sorted(self.topo.edges())
+        self.topo.compact()
+        assert sorted(self.topo.edges()) == expected
+        assert len(self.topo) == 9
+
+    def test_save_load(self):
+        self.topo.add_relation(50, 60)
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "topo.bin")
+            self.topo.save(path)
+            loaded = Topology.load(path)
+        assert sorted(loaded.edges()) == sorted(self.topo.edges())
+        assert list(loaded.ids) == list(self.topo.ids)
+        assert list(loaded.types) == list(self.topo.types)
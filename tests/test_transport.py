@@ -0,0 +1,140 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+
+from cmdb import Client, Option
+from cmdb.core.auth import build_api_key
+from cmdb.core.exc import CMDBError
+from cmdb.core.policy import TransportType
+from cmdb.core.transport import MemoryTransport, RequestsTransport, Transport, Urllib3Transport, path_template, transports_of
+
+
+RETRIEVE = {"numfound": 2, "total": 2, "page": 1, "facet": {}, "counter": {}, "result": [{"_id": 1}, {"_id": 2}]}
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, params: dict) -> None:
+        body = json.dumps(dict(RETRIEVE, path=urlparse(self.path).path, params=params)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.endswith(("/stall", "/cut")):
+            # a body broken after its first bytes, by a stalled or a closed connection
+            self.send_response(200)
+            self.send_header("Content-Length", "1000")
+            self.end_headers()
+            self.wfile.write(b'{"result": [')
+            self.wfile.flush()
+            if path.endswith("/stall"):
+                time.sleep(1)
+            self.close_connection = True
+            return
+        self._reply({k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()})
+
+    def do_POST(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        self._reply(json.loads(self.rfile.read(n)))
+
+
+@pytest.fixture(scope="module")
+def url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EchoHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/api/v0.1"
+    server.shutdown()
+    server.server_close()
+
+
+class TestTransport:
+
+    def test_from_option(self):
+        opt = Option(url="http://h/api/v0.1", key="key", secret="secret")
+        assert isinstance(Transport.from_option(opt), RequestsTransport)
+        opt.transport_type = TransportType.URLLIB3
+        assert isinstance(Transport.from_option(opt), Urllib3Transport)
+
+    @pytest.mark.parametrize("transport_type", list(TransportType))
+    def test_http_backends(self, url, transport_type):
+        opt = Option(url=url, key="key", secret="secret", transport_type=transport_type)
+        transport = Transport.from_option(opt)
+        payload = {"q": "_type:书", "fl": None, "count": 2}
+        resp = transport.request("GET", "/ci/s", payload)
+        expected = build_api_key("key", "secret", "/api/v0.1/ci/s", dict(payload))
+        assert resp["path"] == "/api/v0.1/ci/s"
+        assert resp["params"] == {k: str(v) for k, v in expected.items() if v is not None}
+        assert payload == {"q": "_type:书", "fl": None, "count": 2}
+
+        resp = transport.request("POST", "/ci", {"ci_type": "book", "n": 1})
+        assert resp["params"] == build_api_key("key", "secret", "/api/v0.1/ci", {"ci_type": "book", "n": 1})
+
+        stream = Client(transport=transport).get_ci_stream("_type:book")
+        assert [ci["_id"] for ci in stream] == [1, 2]
+        assert stream.numfound == 2
+        transport.close()
+
+    def test_connection_errors(self, url):
+        dead = "http://127.0.0.1:1/api/v0.1"
+        for transport_type in TransportType:
+            opt = Option(url=dead, key="key", secret="secret", transport_type=transport_type)
+            with pytest.raises(requests.ConnectionError):
+                Transport.from_option(opt).request("GET", "/ci/s", {})
+            # unsent requests fail over to the live replica, whatever the method
+            opt = Option(url=[dead, url], key="key", secret="secret", transport_type=transport_type)
+            transport = Transport.from_option(opt)
+            for _ in range(2):
+                assert transport.request("POST", "/ci", {})["path"] == "/api/v0.1/ci"
+
+    @pytest.mark.parametrize("transport_type", list(TransportType))
+    def test_stream_errors(self, url, transport_type):
+        opt = Option(url=url, key="key", secret="secret", transport_type=transport_type, read_timeout=0.2)
+        transport = Transport.from_option(opt)
+        for path, error in (("/stall", requests.ConnectionError), ("/cut", requests.exceptions.ChunkedEncodingError)):
+            resp = transport.send("GET", path, {}, stream=True)
+            with pytest.raises(error):
+                b"".join(resp.iter_content(64))
+            resp.close()
+        transport.close()
+
+    def test_memory(self):
+        def handler(method, path, params):
+            if path == "/ci/s":
+                return RETRIEVE
+            return 400, {"message": "ci type not found"}
+
+        transport = MemoryTransport(handler)
+        seen = []
+        transport.observers.append(lambda *args: seen.append(args[:4]))
+        client = Client(transport=transport)
+        assert client.get_ci("_type:book").numfound == 2
+        with pytest.raises(CMDBError):
+            client.add_ci("book", {"name": "a"})
+        method, path, params = transport.calls[0]
+        assert (method, path, params["_key"]) == ("GET", "/ci/s", "key")
+        assert [(s[0], s[1], s[3]) for s in seen] == [("GET", "/ci/s", 200), ("POST", "/ci", 400)]
+        assert "_secret" not in seen[0][2]
+
+    def test_helpers(self):
+        assert path_template("/ci/12") == "/ci/{id}"
+        assert path_template("/ci_relations/3/41") == "/ci_relations/{id}/{id}"
+        assert path_template("/ci/s") == "/ci/s"
+        transport = MemoryTransport(lambda *args: RETRIEVE)
+        client = Client(transport=transport)
+        assert transports_of(client) == [transport]
+        assert transports_of(client.cr) == [transport]
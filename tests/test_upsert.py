@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+import requests
+
+from cmdb import Client, ExistPolicy
+from cmdb.core.exc import CMDBError
+from cmdb.core.transport import MemoryTransport
+
+
+class CIServer:
+    """ci create api with exist policies, cis are unique by name"""
+
+    def __init__(self, exists: str = "CI already exists!", not_found: str = "CI name={} does not exist"):
+        self.lock = threading.Lock()
+        self.cis = {}
+        self.exists = exists
+        self.not_found = not_found
+
+    def __call__(self, method, path, params):
+        name = params.get("name")
+        if name == "unreachable":
+            raise requests.ConnectionError("connection reset by peer")
+        if "price" in params and not isinstance(params["price"], (int, float)):
+            return 400, {"message": f"attribute price: {params['price']} is invalid"}
+        with self.lock:
+            ci_id = self.cis.get(name)
+            policy = params["exist_policy"]
+            if ci_id is not None and policy == "reject":
+                return 400, {"message": self.exists}
+            if ci_id is None and policy == "need":
+                return 404, {"message": self.not_found.format(name)}
+            if ci_id is None:
+                ci_id = self.cis[name] = len(self.cis) + 1
+        return {"ci_id": ci_id}
+
+
+class TestUpsertCIs:
+
+    def test_errors_in_place(self):
+        transport = MemoryTransport(CIServer())
+        records = [{"name": "a"}, {"name": "unreachable"}, {"price": 1}, {"name": "b"}]
+        results = Client(transport=transport).upsert_cis("book", records, key=["name"])
+        assert results[0].ci_id == 1 and results[3].ci_id == 2
+        assert isinstance(results[1], requests.ConnectionError)
+        assert isinstance(results[2], CMDBError)
+
+
+class TestUpsertCI:
+
+    def setup_method(self) -> None:
+        self.server = CIServer()
+        self.transport = MemoryTransport(self.server)
+        self.client = Client(transport=self.transport)
+
+    def policies(self):
+        return [params["exist_policy"] for _, _, params in self.transport.calls]
+
+    def test_need_first(self):
+        rsp = self.client.upsert_ci("book", {"name": "a"}, key=["name"])
+        assert (rsp.ci_id, rsp.created) == (1, True)
+        assert self.policies() == ["need", "reject"]
+        rsp = self.client.upsert_ci("book", {"name": "a", "price": 2}, key=["name"])
+        assert (rsp.ci_id, rsp.created) == (1, False)
+        assert self.policies() == ["need", "reject", "need"]
+
+    def test_reject_first(self):
+        self.server.cis["a"] = 7
+        rsp = self.client.upsert_ci("book", {"name": "a"}, key=["name"], prefer=ExistPolicy.REJECT)
+        assert (rsp.ci_id, rsp.created) == (7, False)
+        assert self.policies() == ["reject", "need"]
+
+    def test_lost_race(self):
+        handler = self.server.__call__
+
+        def racing(method, path, params):
+            # another writer creates the ci right after the update found none
+            rsp = handler(method, path, params)
+            self.server.cis.setdefault("a", 9)
+            return rsp
+
+        self.transport.handler = racing
+        rsp = self.client.upsert_ci("book", {"name": "a"}, key=["name"])
+        assert (rsp.ci_id, rsp.created) == (9, False)
+        assert self.policies() == ["need", "reject", "need"]
+
+    @pytest.mark.parametrize("exists, not_found", [("CI已经存在!", "CI不存在"), ("CI 已存在", "CI {} 不存在")])
+    def test_chinese_messages(self, exists, not_found):
+        self.server.exists, self.server.not_found = exists, not_found
+        assert self.client.upsert_ci("book", {"name": "a"}, key=["name"]).created
+        assert not self.client.upsert_ci("book", {"name": "a"}, key=["name"], prefer=ExistPolicy.REJECT).created
+        assert self.policies() == ["need", "reject", "reject", "need"]
+
+    def test_other_errors_not_retried(self):
+        with pytest.raises(CMDBError, match="price"):
+            self.client.upsert_ci("book", {"name": "a", "price": "free"}, key=["name"])
+        assert self.policies() == ["need"]
+        with pytest.raises(CMDBError, match="key attributes"):
+            self.client.upsert_ci("book", {"price": 1}, key=["name"])
+        assert len(self.transport.calls) == 1
+        # the ci type, not the ci, is missing
+        self.server.not_found = "CI类型不存在"
+        with pytest.raises(CMDBError, match="类型"):
+            self.client.upsert_ci("book", {"name": "b"}, key=["name"])
+        assert len(self.transport.calls) == 2